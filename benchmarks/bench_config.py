@@ -0,0 +1,290 @@
+"""Benchmarks for the config layer: get_config on each backend, list_configs, read_config and concurrent access.
+
+A local stand-in for the config api server (with configurable latency and failure rate) and a temporary
+TFDS_ROOT_PATH are set up, so nothing outside the process is touched. Results are written as JSON
+to compare releases:
+
+    python benchmarks/bench_config.py --output config-0.1.20.json
+    python benchmarks/bench_config.py --output config-new.json --compare config-0.1.20.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from importlib import metadata
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+import yaml
+
+from tfdslib.config import clear_config_snapshot, get_config, set_config_snapshot
+from tfdslib.config_file import list_configs, read_config, write_config_to_file
+
+# Number of keys in the generated configs.
+CONFIG_SIZES = {"small": 10, "medium": 200, "large": 2_000}
+API_PATH = "/api/configs/"
+
+
+def make_config(keys: int) -> dict[str, Any]:
+    return {"config": {f"key_{i}": {"value": i, "name": f"value {i}", "enabled": i % 2 == 0} for i in range(keys)}}
+
+
+class ConfigServer(ThreadingHTTPServer):
+    """Stand-in for the config api server, answering from a dict with an optional delay and failure rate."""
+
+    daemon_threads = True
+
+    def __init__(self, configs: dict[str, dict[str, Any]], latency: float = 0.0, failure_rate: float = 0.0):
+        super().__init__(("127.0.0.1", 0), _ConfigHandler)
+        self.configs = {name: json.dumps({**cfg, "meta": {"name": name}}).encode() for name, cfg in configs.items()}
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}{API_PATH}"
+
+
+class _ConfigHandler(BaseHTTPRequestHandler):
+    server: ConfigServer
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _delay_or_fail(self) -> bool:
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if random.random() < self.server.failure_rate:
+            self._reply(500, b'{"detail": "injected failure"}')
+            return True
+        return False
+
+    def _reply(self, status: int, body: bytes = b"") -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def do_HEAD(self) -> None:
+        if not self._delay_or_fail():
+            self._reply(200)
+
+    def do_GET(self) -> None:
+        if self._delay_or_fail():
+            return
+        # The real server answers unknown configs with a null body.
+        self._reply(200, self.server.configs.get(self.path[len(API_PATH) :], b"null"))
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self._delay_or_fail():
+            return
+        with self.server.lock:
+            self.server.configs[self.path[len(API_PATH) :]] = body
+        self._reply(200, body)
+
+
+def summarize(durations: list[float], errors: int = 0, wall: Optional[float] = None) -> dict[str, Any]:
+    """Latency statistics in milliseconds, plus throughput when the wall time of a concurrent run is given."""
+    ms = sorted(d * 1000 for d in durations)
+    result: dict[str, Any] = {
+        "n": len(ms),
+        "errors": errors,
+        "mean_ms": statistics.fmean(ms) if ms else None,
+        "median_ms": statistics.median(ms) if ms else None,
+        "p95_ms": ms[min(len(ms) - 1, int(len(ms) * 0.95))] if ms else None,
+        "min_ms": ms[0] if ms else None,
+        "max_ms": ms[-1] if ms else None,
+    }
+    if wall is not None:
+        result["ops_per_second"] = len(ms) / wall if wall else None
+    return result
+
+
+def measure(func: Callable[[], Any], iterations: int) -> dict[str, Any]:
+    durations, errors = [], 0
+    for _ in range(iterations):
+        start = time.perf_counter()
+        try:
+            func()
+        except Exception:
+            errors += 1
+            continue
+        durations.append(time.perf_counter() - start)
+    return summarize(durations, errors)
+
+
+def measure_cold(config_name: str, env: dict[str, str], runs: int) -> dict[str, Any]:
+    """First get_config in a fresh interpreter, including the lazy imports and the first connection."""
+    code = (
+        "import time; start = time.perf_counter()\n"
+        "from tfdslib.config import get_config\n"
+        f"get_config({config_name!r})\n"
+        "print(time.perf_counter() - start)"
+    )
+    durations, errors = [], 0
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True)
+        if result.returncode:
+            errors += 1
+        else:
+            durations.append(float(result.stdout.strip().splitlines()[-1]))
+    return summarize(durations, errors)
+
+
+def measure_concurrent(config_name: str, readers: int, writers: int, operations: int) -> dict[str, Any]:
+    """Readers call read_config while writers rewrite the same file, each thread running operations calls."""
+    cfg = read_config(config_name)
+    results: dict[str, tuple[list[float], int]] = {"read": ([], 0), "write": ([], 0)}
+    lock = threading.Lock()
+
+    def run(kind: str) -> None:
+        durations, errors = [], 0
+        for _ in range(operations):
+            start = time.perf_counter()
+            try:
+                if kind == "read":
+                    read_config(config_name)
+                else:
+                    write_config_to_file(config_name, dict(cfg))
+                durations.append(time.perf_counter() - start)
+            except Exception:
+                errors += 1
+        with lock:
+            results[kind] = (results[kind][0] + durations, results[kind][1] + errors)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=readers + writers) as pool:
+        list(pool.map(run, ["read"] * readers + ["write"] * writers))
+    wall = time.perf_counter() - start
+    return {kind: summarize(durations, errors, wall) for kind, (durations, errors) in results.items()}
+
+
+def _closed_port_url() -> str:
+    """An url nobody listens on, so get_config falls back to files right away."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{sock.getsockname()[1]}{API_PATH}"
+
+
+def run(args: argparse.Namespace) -> dict[str, Any]:
+    configs = {f"bench_{size}": make_config(keys) for size, keys in CONFIG_SIZES.items() if size in args.sizes}
+    results: dict[str, Any] = {}
+    with tempfile.TemporaryDirectory() as root:
+        config_dir = Path(root) / "config"
+        config_dir.mkdir()
+        for name, cfg in configs.items():
+            (config_dir / f"{name}.yaml").write_text(yaml.dump(cfg, default_flow_style=False))
+        server = ConfigServer(configs, latency=args.latency / 1000, failure_rate=args.failure_rate)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        backends = {"file": _closed_port_url(), "api": server.url}
+        saved_env = {key: os.environ.get(key) for key in ("TFDS_ROOT_PATH", "TFDS_CONFIG_URL")}
+        os.environ["TFDS_ROOT_PATH"] = root
+        try:
+            for backend, url in backends.items():
+                os.environ["TFDS_CONFIG_URL"] = url
+                env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, sys.path))}
+                first = next(iter(configs))
+                results[f"get_config.cold.{backend}"] = measure_cold(first, env, args.cold_runs)
+                for name in configs:
+                    results[f"get_config.warm.{backend}.{name}"] = measure(
+                        lambda name=name: get_config(name), args.iterations
+                    )
+
+            for name, cfg in configs.items():
+                set_config_snapshot({name: cfg["config"]})
+                results[f"get_config.warm.snapshot.{name}"] = measure(
+                    lambda name=name: get_config(name), args.iterations
+                )
+            clear_config_snapshot()
+
+            results["list_configs"] = measure(list_configs, args.iterations)
+            for name in configs:
+                results[f"read_config.{name}"] = measure(lambda name=name: read_config(name), args.iterations)
+            for name in configs:
+                results[f"concurrent.{name}"] = measure_concurrent(
+                    name, args.readers, args.writers, max(1, args.iterations // 10)
+                )
+        finally:
+            server.shutdown()
+            server.server_close()
+            for key, value in saved_env.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+    return results
+
+
+def _version() -> str:
+    try:
+        return metadata.version("tfdslib")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def compare(results: dict[str, Any], baseline: dict[str, Any]) -> None:
+    """Print the mean latency of each benchmark against a baseline result file."""
+    print(f"{'benchmark':60} {'baseline ms':>12} {'current ms':>12} {'ratio':>7}")
+    flat = {}
+    for source, data in (("current", results), ("baseline", baseline)):
+        for name, entry in data.items():
+            for sub, stats in entry.items() if "n" not in entry else [("", entry)]:
+                flat.setdefault(f"{name}.{sub}".rstrip("."), {})[source] = stats.get("mean_ms")
+    for name, means in sorted(flat.items()):
+        before, after = means.get("baseline"), means.get("current")
+        ratio = f"{after / before:7.2f}" if before and after else "      -"
+        print(f"{name:60} {before or 0:12.3f} {after or 0:12.3f} {ratio}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=50, help="Calls per warm benchmark.")
+    parser.add_argument("--cold-runs", type=int, default=5, help="Fresh interpreters per cold benchmark.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Delay in ms added by the api stand-in.")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of api requests answered with 500.")
+    parser.add_argument("--sizes", nargs="+", default=list(CONFIG_SIZES), choices=list(CONFIG_SIZES))
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument("--compare", help="A previous JSON result file to compare against.")
+    args = parser.parse_args()
+
+    # The file backend logs an error for every failed api check.
+    logging.disable(logging.CRITICAL)
+    report = {
+        "meta": {
+            "benchmark": "config",
+            "tfdslib": _version(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "args": vars(args),
+        },
+        "results": run(args),
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    if args.compare:
+        compare(report["results"], json.loads(Path(args.compare).read_text())["results"])
+    else:
+        print(json.dumps(report["results"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""Benchmarks for tfdslib.s3: client creation, listing, file_exists, put_file/get_file throughput and delete_prefix.
+
+Runs against a local S3 stand-in, a moto server started in process (pip install "moto[server]") or an
+already running endpoint such as a local MinIO given with --endpoint. Everything is written to a temporary
+bucket that is removed afterwards. Results are written as JSON to compare releases:
+
+    python benchmarks/bench_s3.py --output s3-0.1.20.json
+    python benchmarks/bench_s3.py --endpoint http://localhost:9000 --access-key minio --secret-key minio123 \\
+        --keys 1000 100000 --concurrency 32 --compare s3-0.1.20.json
+"""
+
+import argparse
+import datetime as dt
+import json
+import logging
+import os
+import platform
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Iterator, Optional
+
+from bench_config import _version, compare, measure, summarize
+
+from tfdslib.config import set_config_snapshot
+from tfdslib.s3 import (
+    clear_s3_clients,
+    delete_prefix,
+    file_exists,
+    get_file,
+    get_s3_client,
+    list_files,
+    list_files_for_dates,
+    make_date_prefix,
+    put_file,
+)
+
+FILE_SIZES = {"1KiB": 1024, "1MiB": 1024**2, "16MiB": 16 * 1024**2, "128MiB": 128 * 1024**2}
+
+
+def start_moto() -> tuple[str, Callable[[], None]]:
+    """Start a moto server on a free port, returns its url and a function stopping it."""
+    try:
+        from moto.server import ThreadedMotoServer
+    except ImportError:
+        raise SystemExit('moto is not installed, pip install "moto[server]" or pass --endpoint.')
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=0)
+    server.start()
+    host, port = server.get_host_and_port()
+    return f"http://{host}:{port}", server.stop
+
+
+def timed_pool(func: Callable[[Any], Any], items: list[Any], concurrency: int) -> tuple[list[float], int, float]:
+    """Run func over items on a thread pool, returns the per item durations, the failures and the wall time."""
+
+    def call(item: Any) -> Optional[float]:
+        start = time.perf_counter()
+        try:
+            if func(item) is False:
+                return None
+        except Exception:
+            return None
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        durations = list(pool.map(call, items))
+    wall = time.perf_counter() - start
+    ok = [d for d in durations if d is not None]
+    return ok, len(durations) - len(ok), wall
+
+
+def seed(bucket: str, keys: Iterator[str], concurrency: int) -> int:
+    """Write empty objects for the keys, returns the number written."""
+    s3 = get_s3_client()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return sum(1 for _ in pool.map(lambda key: s3.put_object(Bucket=bucket, Key=key, Body=b""), keys))
+
+
+def bench_clients(iterations: int) -> dict[str, Any]:
+    def cold() -> None:
+        clear_s3_clients()
+        get_s3_client()
+
+    return {"get_s3_client.cold": measure(cold, iterations), "get_s3_client.warm": measure(get_s3_client, iterations)}
+
+
+def bench_listing(bucket: str, args: argparse.Namespace) -> dict[str, Any]:
+    results: dict[str, Any] = {}
+    for count in args.keys:
+        prefix = f"keys_{count}/"
+        seed(bucket, (f"{prefix}{i:08d}.json" for i in range(count)), args.concurrency)
+        results[f"list_files.{count}"] = measure(lambda prefix=prefix: list_files(prefix, bucket), args.list_iterations)
+
+    dates = [dt.date(2024, 1, 1) + dt.timedelta(days=i) for i in range(args.dates)]
+    per_date = max(1, args.keys[0] // len(dates))
+    seed(bucket, (f"{make_date_prefix(d)}/{i:06d}.parquet" for d in dates for i in range(per_date)), args.concurrency)
+    results[f"list_files_for_dates.{len(dates)}x{per_date}"] = measure(
+        lambda: list_files_for_dates(dates, bucket), args.list_iterations
+    )
+
+    keys = [f"keys_{args.keys[0]}/{i:08d}.json" for i in range(args.iterations)]
+    sequential = iter(keys)
+    results["file_exists.sequential"] = measure(lambda: file_exists(bucket, next(sequential)), len(keys))
+    durations, errors, wall = timed_pool(lambda key: file_exists(bucket, key), keys, args.concurrency)
+    results["file_exists.concurrent"] = summarize(durations, errors, wall)
+    return results
+
+
+def bench_transfers(bucket: str, workdir: Path, args: argparse.Namespace) -> dict[str, Any]:
+    results: dict[str, Any] = {}
+    for label in args.file_sizes:
+        size = FILE_SIZES[label]
+        source = workdir / f"source_{label}"
+        with open(source, "wb") as f:
+            for start in range(0, size, 1024**2):
+                f.write(os.urandom(min(1024**2, size - start)))
+        count = max(1, min(args.iterations, (256 * 1024**2) // size))
+        names = [f"transfer_{label}/{i:05d}" for i in range(count)]
+
+        durations, errors, wall = timed_pool(lambda name: put_file(str(source), bucket, name), names, args.concurrency)
+        results[f"put_file.{label}"] = {
+            **summarize(durations, errors, wall),
+            "mb_per_second": count * size / 1e6 / wall,
+        }
+
+        target = workdir / f"target_{label}"
+        target.mkdir()
+        for parallel in (False, True):
+            durations, errors, wall = timed_pool(
+                lambda name: get_file(str(target / name.replace("/", "_")), bucket, name, parallel=parallel),
+                names,
+                args.concurrency,
+            )
+            name = f"get_file{'.parallel' if parallel else ''}.{label}"
+            results[name] = {**summarize(durations, errors, wall), "mb_per_second": count * size / 1e6 / wall}
+        source.unlink()
+    return results
+
+
+def bench_delete(bucket: str, args: argparse.Namespace) -> dict[str, Any]:
+    results: dict[str, Any] = {}
+    for count in args.keys:
+        start = time.perf_counter()
+        deleted = delete_prefix(bucket, f"keys_{count}/", max_workers=args.concurrency)
+        wall = time.perf_counter() - start
+        results[f"delete_prefix.{count}"] = {
+            **summarize([wall], len(deleted["errors"])),
+            "files": deleted["files"],
+            "files_per_second": deleted["files"] / wall if wall else None,
+        }
+    return results
+
+
+def run(args: argparse.Namespace) -> dict[str, Any]:
+    stop: Optional[Callable[[], None]] = None
+    endpoint = args.endpoint
+    if endpoint is None:
+        endpoint, stop = start_moto()
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    set_config_snapshot({"s3": {"url": endpoint, "access_key": args.access_key, "secret_key": args.secret_key}})
+    bucket = f"tfds-bench-{uuid.uuid4().hex[:8]}"
+    results: dict[str, Any] = {}
+    try:
+        get_s3_client().create_bucket(Bucket=bucket)
+        try:
+            results.update(bench_clients(args.iterations))
+            results.update(bench_listing(bucket, args))
+            with tempfile.TemporaryDirectory() as workdir:
+                results.update(bench_transfers(bucket, Path(workdir), args))
+            results.update(bench_delete(bucket, args))
+        finally:
+            delete_prefix(bucket, "", max_workers=args.concurrency)
+            get_s3_client().delete_bucket(Bucket=bucket)
+    finally:
+        if stop is not None:
+            stop()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--endpoint", help="Url of a running S3 endpoint (e.g. MinIO), default starts a moto server.")
+    parser.add_argument("--access-key", default="testing")
+    parser.add_argument("--secret-key", default="testing")
+    parser.add_argument("--keys", type=int, nargs="+", default=[1_000, 10_000], help="Key counts of listed prefixes.")
+    parser.add_argument("--dates", type=int, default=30, help="Date folders for list_files_for_dates.")
+    parser.add_argument("--file-sizes", nargs="+", default=["1KiB", "1MiB", "16MiB"], choices=list(FILE_SIZES))
+    parser.add_argument("--iterations", type=int, default=100, help="Calls or files per benchmark.")
+    parser.add_argument("--list-iterations", type=int, default=5, help="Repeats of each listing.")
+    parser.add_argument("--concurrency", type=int, default=16, help="Threads for the concurrent benchmarks.")
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument("--compare", help="A previous JSON result file to compare against.")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    report = {
+        "meta": {
+            "benchmark": "s3",
+            "tfdslib": _version(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "args": vars(args),
+        },
+        "results": run(args),
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    if args.compare:
+        compare(report["results"], json.loads(Path(args.compare).read_text())["results"])
+    else:
+        print(json.dumps(report["results"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
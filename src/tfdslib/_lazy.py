@@ -0,0 +1,28 @@
+"""Lazy exports for the subpackage __init__ modules.
+The implementation modules are imported on first attribute access, so importing a package doesn't load
+its dependencies (boto3, requests, pyspark, ...). The names are imported under TYPE_CHECKING for type checkers."""
+
+import sys
+from importlib import import_module
+from typing import Any, Callable
+
+
+def attach(package: str, exports: dict[str, list[str]]) -> tuple[Callable[[str], Any], Callable[[], list[str]]]:
+    """Module __getattr__ and __dir__ for package, exports maps each submodule to the names it provides.
+    A loaded name is stored in the package namespace, later lookups don't go through __getattr__ again."""
+    namespace = sys.modules[package].__dict__
+    modules = {name: module for module, names in exports.items() for name in names}
+
+    def __getattr__(name: str) -> Any:
+        if name in exports:
+            return import_module(f".{name}", package)
+        if name not in modules:
+            raise AttributeError(f"module {package!r} has no attribute {name!r}")
+        value = getattr(import_module(f".{modules[name]}", package), name)
+        namespace[name] = value
+        return value
+
+    def __dir__() -> list[str]:
+        return sorted([*namespace, *modules])
+
+    return __getattr__, __dir__
@@ -1,3 +1,17 @@
-from .config import get_config, set_config
+"""Config access, served from the config api server or from files."""
 
-__all__ = ["get_config", "set_config"]
+from typing import TYPE_CHECKING
+
+from tfdslib._lazy import attach
+
+if TYPE_CHECKING:
+    from .config import (
+        clear_config_snapshot,
+        get_config,
+        set_config,
+        set_config_snapshot,
+    )
+
+__all__ = ["get_config", "set_config", "set_config_snapshot", "clear_config_snapshot"]
+
+__getattr__, __dir__ = attach(__name__, {"config": __all__})
@@ -1,17 +1,70 @@
+import copy
+import json
 import logging
+import sys
+from pathlib import Path
 from typing import Any, cast
 
 from tfdslib.config_api import get_config_from_api, is_api_avaiable, write_config_to_api
-from tfdslib.config_file import get_config_from_file, write_config_to_file
+from tfdslib.config_file import get_config_from_file, strip_yaml, write_config_to_file
+from tfdslib.utils.stats import instrumented, record_cache
 
 logger = logging.getLogger(__name__)
 
+# Snapshot files shipped to spark executors with SparkContext.addFile are named like this.
+SNAPSHOT_FILE_PREFIX = "tfds_config_snapshot"
 
+_snapshot: dict[str, dict[str, Any]] = {}
+# Names of the SparkFiles snapshots already loaded, later broadcasts ship new files to the same executors.
+_spark_files_loaded: set[str] = set()
+
+
+def set_config_snapshot(configs: dict[str, dict[str, Any]]) -> None:
+    """Serve these configs from memory in this process, get_config won't call the server or read files for them."""
+    _snapshot.update({strip_yaml(name): cfg for name, cfg in configs.items()})
+
+
+def clear_config_snapshot() -> None:
+    """Drop the in-memory configs, get_config goes back to the server or files."""
+    _snapshot.clear()
+    _spark_files_loaded.clear()
+
+
+def _on_spark_executor() -> bool:
+    """True inside a spark task, without importing pyspark when it isn't loaded already."""
+    if "pyspark" not in sys.modules:
+        return False
+    from pyspark import TaskContext
+
+    return TaskContext.get() is not None
+
+
+def _load_spark_files_snapshot() -> None:
+    """Load the config snapshots shipped with SparkFiles (see tfdslib.spark.broadcast_configs), each file once."""
+    from pyspark import SparkFiles
+
+    for snapshot_file in sorted(Path(SparkFiles.getRootDirectory()).glob(f"{SNAPSHOT_FILE_PREFIX}*.json")):
+        if snapshot_file.name in _spark_files_loaded:
+            continue
+        _spark_files_loaded.add(snapshot_file.name)
+        logger.debug("Loading config snapshot %s", snapshot_file)
+        set_config_snapshot(json.loads(snapshot_file.read_text()))
+
+
+@instrumented()
 def get_config(config_name: str) -> dict[str, Any]:
-    """Get a config, from api server if available or from file if avaiable."""
+    """Get a config, from the in-memory snapshot if it has it (on spark executors including the snapshot
+    shipped with SparkFiles), else from api server if available or from file if avaiable."""
     if not config_name:
         raise ValueError("A config_name must be provided.")
 
+    name = strip_yaml(config_name)
+    if name not in _snapshot and _on_spark_executor():
+        _load_spark_files_snapshot()
+    record_cache("config.snapshot", name in _snapshot)
+    if name in _snapshot:
+        return copy.deepcopy(_snapshot[name])
+
     if is_api_avaiable():
         logger.debug("Using API to get config: %s", config_name)
         cfg = get_config_from_api(config_name)
@@ -23,6 +76,7 @@ def get_config(config_name: str) -> dict[str, Any]:
     return cast(dict[str, Any], cfg)
 
 
+@instrumented()
 def set_config(config_name: str, config: dict[str, Any]) -> None:
     if config is None:
         raise ValueError("Config cannot be None.")
@@ -1,11 +1,18 @@
-from .config_api import (
-    get_config_from_api,
-    get_config_url,
-    get_full_config_response,
-    get_meta,
-    is_api_avaiable,
-    write_config_to_api,
-)
+"""Config api server client."""
+
+from typing import TYPE_CHECKING
+
+from tfdslib._lazy import attach
+
+if TYPE_CHECKING:
+    from .config_api import (
+        get_config_from_api,
+        get_config_url,
+        get_full_config_response,
+        get_meta,
+        is_api_avaiable,
+        write_config_to_api,
+    )
 
 __all__ = [
     "get_config_from_api",
@@ -15,3 +22,5 @@ __all__ = [
     "get_full_config_response",
     "write_config_to_api",
 ]
+
+__getattr__, __dir__ = attach(__name__, {"config_api": __all__})
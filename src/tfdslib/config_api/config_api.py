@@ -2,9 +2,8 @@ import logging
 import os
 from typing import Any, Union, cast
 
-import requests
-
 from tfdslib.config_file import strip_yaml
+from tfdslib.utils.stats import instrumented
 
 logger = logging.getLogger(__name__)
 
@@ -19,8 +18,11 @@ def get_config_url(config_name: Union[None, str] = None) -> str:
     return f"{base_url}{strip_yaml(config_name)}" if config_name else base_url
 
 
+@instrumented()
 def is_api_avaiable() -> bool:
     """Check if the config api server is available."""
+    import requests  # imported on use, it is slow to import and most callers never reach the server
+
     try:
         url = get_config_url()
 
@@ -33,8 +35,11 @@ def is_api_avaiable() -> bool:
         return False
 
 
+@instrumented()
 def get_full_config_response(config_name: str) -> dict[str, Any]:
     """Get a config from the config api server."""
+    import requests
+
     if config_name is None:
         raise ValueError("Config name cannot be None")
 
@@ -48,6 +53,7 @@ def get_full_config_response(config_name: str) -> dict[str, Any]:
     return cast(dict[str, Any], response.json())
 
 
+@instrumented()
 def get_config_from_api(config_name: str) -> dict[str, Any]:
     """Get the a config from the api as a dict."""
     response = get_full_config_response(config_name=config_name)
@@ -58,12 +64,16 @@ def get_config_from_api(config_name: str) -> dict[str, Any]:
     return cast(dict[str, Any], cfg)
 
 
+@instrumented()
 def get_meta(config_name: str) -> Union[None, dict[str, Any]]:
     """Get the meta data from the config api response."""
     meta = get_full_config_response(config_name=config_name).get("meta")
     return cast(dict[str, Any], meta) if meta else None
 
 
+@instrumented()
 def write_config_to_api(config_name: str, config: dict[str, Any]) -> None:
+    import requests
+
     response = requests.post(get_config_url(config_name), json=config)
     response.raise_for_status()
@@ -1,13 +1,20 @@
-from .config_file import (
-    delete_config,
-    get_config_from_file,
-    get_file_name,
-    get_root_folder,
-    list_configs,
-    read_config,
-    strip_yaml,
-    write_config_to_file,
-)
+"""Config file access."""
+
+from typing import TYPE_CHECKING
+
+from tfdslib._lazy import attach
+
+if TYPE_CHECKING:
+    from .config_file import (
+        delete_config,
+        get_config_from_file,
+        get_file_name,
+        get_root_folder,
+        list_configs,
+        read_config,
+        strip_yaml,
+        write_config_to_file,
+    )
 
 __all__ = [
     "delete_config",
@@ -19,3 +26,5 @@ __all__ = [
     "write_config_to_file",
     "get_root_folder",
 ]
+
+__getattr__, __dir__ = attach(__name__, {"config_file": __all__})
@@ -7,6 +7,8 @@ from typing import Any, Union, cast
 
 import yaml
 
+from tfdslib.utils.stats import instrumented
+
 
 def strip_yaml(config_name: Union[str, Path]) -> str:
     """Strip the .yaml or .yml extension from the config name."""
@@ -25,6 +27,7 @@ def get_root_folder() -> Path:
     return Path(os.environ.get("TFDS_ROOT_PATH", "/opt/tfds/"))
 
 
+@instrumented()
 def get_file_name(config_name: str) -> Path:
     """Get a file path for a config, searching in secrets and config folders."""
     config_name = strip_yaml(config_name)
@@ -34,6 +37,7 @@ def get_file_name(config_name: str) -> Path:
     return get_root_folder() / "config" / (config_name + ".yaml")
 
 
+@instrumented()
 def config_exists(config_name: str) -> bool:
     """Check if a config file exists."""
     if config_name is None:
@@ -42,6 +46,7 @@ def config_exists(config_name: str) -> bool:
     return file_path.is_file()
 
 
+@instrumented()
 def read_config(config_name: str) -> dict[str, Any]:
     """Read a configuration file, returning the config data as a dict."""
     if config_name is None:
@@ -59,6 +64,7 @@ def read_config(config_name: str) -> dict[str, Any]:
     return config
 
 
+@instrumented()
 def write_config_to_file(config_name: str, config: dict[str, Any]) -> None:
     """Write a configuration file, meta key is stripped if present."""
     file_path = get_file_name(config_name)
@@ -71,6 +77,7 @@ def write_config_to_file(config_name: str, config: dict[str, Any]) -> None:
         fcntl.flock(file, fcntl.LOCK_UN)
 
 
+@instrumented()
 def delete_config(config_name: str) -> None:
     """Delete a configuration file."""
     file_path = get_file_name(config_name)
@@ -90,6 +97,7 @@ def list_files(path: Union[str, Path]) -> list[Path]:
         return []
 
 
+@instrumented()
 def list_configs() -> list[str]:
     """List all available configurations (including the secrets)."""
     cfg_list = list_files(get_root_folder() / "config")
@@ -97,6 +105,7 @@ def list_configs() -> list[str]:
     return [strip_yaml(f.name) for f in cfg_list + sec_list if f.suffix in (".yaml", ".yml")]
 
 
+@instrumented()
 def get_config_from_file(config_name: str) -> dict[str, Any]:
     """Get the a config key from a file while validating the file."""
     cfg = read_config(config_name=config_name)["config"]
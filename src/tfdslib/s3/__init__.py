@@ -1,24 +1,49 @@
-from .s3 import (
-    as_urls,
-    bucket_exists,
-    create_bucket,
-    delete_bucket,
-    delete_prefix,
-    file_exists,
-    get_file,
-    get_s3_client,
-    is_s3_service_available,
-    list_files,
-    list_files_for_dates,
-    make_date_prefix,
-    put_file,
-)
+"""S3 helpers on top of boto3."""
+
+from typing import TYPE_CHECKING
+
+from tfdslib._lazy import attach
+
+if TYPE_CHECKING:
+    from .s3 import (
+        as_urls,
+        bucket_exists,
+        clear_s3_clients,
+        compute_etag,
+        create_bucket,
+        delete_bucket,
+        delete_keys,
+        delete_prefix,
+        file_exists,
+        get_bytes,
+        get_file,
+        get_file_ranged,
+        get_range,
+        get_s3_client,
+        get_s3_health,
+        is_s3_service_available,
+        iter_objects,
+        list_files,
+        list_files_for_dates,
+        make_date_prefix,
+        open_read,
+        open_write,
+        put_bytes,
+        put_file,
+        select_rows,
+        start_s3_health_monitor,
+        stop_s3_health_monitor,
+        sync_from_s3,
+        sync_to_s3,
+        wait_for_s3,
+    )
 
 __all__ = [
     "bucket_exists",
     "file_exists",
     "create_bucket",
     "delete_bucket",
+    "delete_keys",
     "delete_prefix",
     "get_file",
     "get_s3_client",
@@ -28,4 +53,22 @@ __all__ = [
     "make_date_prefix",
     "put_file",
     "as_urls",
+    "compute_etag",
+    "iter_objects",
+    "sync_from_s3",
+    "sync_to_s3",
+    "get_bytes",
+    "open_read",
+    "open_write",
+    "put_bytes",
+    "get_file_ranged",
+    "get_range",
+    "clear_s3_clients",
+    "select_rows",
+    "get_s3_health",
+    "start_s3_health_monitor",
+    "stop_s3_health_monitor",
+    "wait_for_s3",
 ]
+
+__getattr__, __dir__ = attach(__name__, {"s3": __all__})
@@ -0,0 +1,107 @@
+"""asyncio versions of the S3 functions.
+The blocking boto3 calls run on a dedicated, bounded thread pool sharing the pooled client from get_s3_client,
+and a per event loop semaphore caps how many are in flight, so thousands of small operations can be
+multiplexed from one loop without blocking it."""
+
+import asyncio
+import functools
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Optional, TypeVar, Union
+
+from tfdslib.s3 import s3 as _sync
+
+T = TypeVar("T")
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+_max_concurrency = _sync.MAX_POOL_CONNECTIONS
+_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+
+def set_max_concurrency(limit: int) -> None:
+    """Set the number of S3 calls allowed in flight, applies to event loops and executors created afterwards."""
+    global _max_concurrency, _executor
+    if limit < 1:
+        raise ValueError("limit must be at least 1.")
+    with _executor_lock:
+        _max_concurrency = limit
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+            _executor = None
+    _semaphores.clear()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=_max_concurrency, thread_name_prefix="tfds-s3-aio")
+        return _executor
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(_max_concurrency)
+        _semaphores[loop] = semaphore
+    return semaphore
+
+
+async def _run(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a blocking call on the S3 executor once a concurrency slot is free."""
+    async with _get_semaphore():
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_executor(), functools.partial(func, *args, **kwargs))
+
+
+async def iter_objects(prefix: str, bucket_name: str) -> AsyncIterator[dict[str, Any]]:
+    """Yield the listing entry of every object under the given prefix, fetching one page at a time."""
+
+    def paginate() -> Any:
+        paginator = _sync.get_s3_client().get_paginator("list_objects_v2")
+        return iter(paginator.paginate(Bucket=bucket_name, Prefix=prefix))
+
+    pages = await _run(paginate)
+    while (page := await _run(next, pages, None)) is not None:
+        for obj in page.get("Contents", []):
+            yield obj
+
+
+async def list_files(prefix: str, bucket_name: str) -> list[str]:
+    """Return all files under the given prefix."""
+    return [obj["Key"] async for obj in iter_objects(prefix, bucket_name)]
+
+
+async def file_exists(bucket_name: str, file_name: str, prefix: Union[str, None] = None) -> bool:
+    """Check if a file exists on S3."""
+    return await _run(_sync.file_exists, bucket_name, file_name, prefix)
+
+
+async def put_file(
+    local_path: str,
+    bucket: str,
+    file_name: str,
+    prefix: Union[str, None] = None,
+    compression: Optional[str] = None,
+) -> bool:
+    """Upload a file to S3."""
+    return await _run(_sync.put_file, local_path, bucket, file_name, prefix, compression=compression)
+
+
+async def get_file(
+    local_path: str,
+    bucket: str,
+    file_name: str,
+    prefix: Union[str, None] = None,
+    compression: Optional[str] = None,
+) -> bool:
+    """Download a file from S3."""
+    return await _run(_sync.get_file, local_path, bucket, file_name, prefix, compression=compression)
+
+
+async def delete_prefix(bucket: str, prefix: str, dry_run: bool = False) -> dict[str, Any]:
+    """Delete all files with a given prefix in a bucket, see tfdslib.s3.delete_prefix."""
+    return await _run(_sync.delete_prefix, bucket, prefix, dry_run=dry_run)
@@ -1,41 +1,195 @@
 """S3 managemnent functions.
 Let's see how we refactor this to transparently use config from file or api server."""
 
+import csv
 import datetime as dt
-from typing import Union
+import hashlib
+import io
+import json
+import logging
+import mmap
+import operator
+import os
+import re
+import shutil
+import threading
+import time
+import zlib
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from types import ModuleType
+from typing import Any, Iterator, Optional, Union, cast
 
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
 from tfdslib.config import get_config
+from tfdslib.utils.stats import instrumented, record_bytes, record_cache, stats_enabled
 
+zstandard: Optional[ModuleType]
+try:
+    import zstandard
+except ImportError:  # zstd compression is optional
+    zstandard = None
 
-def get_s3_client() -> boto3.client:
-    """Get an S3 client using config from the config api"""
+logger = logging.getLogger(__name__)
+
+# Large enough for the thread pools used by the bulk transfer and delete functions.
+MAX_POOL_CONNECTIONS = 32
+# The health probe fails fast instead of waiting out botocore's default timeouts and retries.
+HEALTH_PROBE_TIMEOUT = 2
+HEALTH_TTL = 30.0
+
+_clients: dict[tuple[str, str, str, str], Any] = {}
+_clients_lock = threading.Lock()
+
+_health: dict[str, Any] = {"available": None, "error": None, "latency": None, "checked_at": None}
+_health_lock = threading.Lock()
+_probe_lock = threading.Lock()
+_monitor: Optional[threading.Thread] = None
+_monitor_stop = threading.Event()
+
+
+def _cached_client(kind: str, client_config: Config) -> Any:
+    """One client per kind, endpoint and credentials, built with the config from the config api."""
     cfg = get_config("s3")
     if cfg is None or cfg.get("url") is None:
         raise ValueError("s3 config not found")
-    s3_client = boto3.client(
-        service_name="s3",
-        aws_access_key_id=cfg["access_key"],
-        aws_secret_access_key=cfg["secret_key"],
-        endpoint_url=cfg["url"],
-    )
+    client_key = (kind, cfg["url"], cfg["access_key"], cfg["secret_key"])
+    with _clients_lock:
+        s3_client = _clients.get(client_key)
+        record_cache(f"s3.{kind}_client", s3_client is not None)
+        if s3_client is None:
+            s3_client = boto3.client(
+                service_name="s3",
+                aws_access_key_id=cfg["access_key"],
+                aws_secret_access_key=cfg["secret_key"],
+                endpoint_url=cfg["url"],
+                config=client_config,
+            )
+            _clients[client_key] = s3_client
     return s3_client
 
 
-def is_s3_service_available() -> bool:
-    """Simple check if s3 works. A negative response might indicate service down or invalid credentials."""
-    try:
-        get_s3_client().list_buckets()
-        return True
-    except Exception:
-        print(
+@instrumented()
+def get_s3_client() -> boto3.client:
+    """Get an S3 client using config from the config api.
+    Clients are thread safe and expensive to build, so one pooled client is kept per endpoint and credentials."""
+    return _cached_client("pooled", Config(max_pool_connections=MAX_POOL_CONNECTIONS))
+
+
+def _get_probe_client() -> Any:
+    return _cached_client(
+        "probe",
+        Config(
+            connect_timeout=HEALTH_PROBE_TIMEOUT,
+            read_timeout=HEALTH_PROBE_TIMEOUT,
+            retries={"total_max_attempts": 1},
+        ),
+    )
+
+
+def clear_s3_clients() -> None:
+    """Drop the pooled clients and the cached health state, e.g. after rotating credentials."""
+    with _clients_lock:
+        _clients.clear()
+    with _health_lock:
+        _health.update(available=None, error=None, latency=None, checked_at=None)
+
+
+def _probe_s3(max_age: float) -> dict[str, Any]:
+    """Probe the service unless another caller refreshed the state within max_age while we waited."""
+    with _probe_lock:
+        with _health_lock:
+            state = dict(_health)
+        if state["checked_at"] is not None and time.monotonic() - state["checked_at"] <= max_age:
+            return state
+        start = time.monotonic()
+        try:
+            _get_probe_client().list_buckets()
+            state = {"available": True, "error": None}
+        except Exception as e:
+            state = {"available": False, "error": str(e)}
+        state.update(latency=time.monotonic() - start, checked_at=time.monotonic())
+        with _health_lock:
+            was_available = _health["available"]
+            _health.update(state)
+    if not state["available"] and was_available is not False:
+        logger.error(
             "S3 service not responding, this might be due to s3 service not started, invalid credentials or faulty/missing configuration."
         )
-        return False
+    elif state["available"] and was_available is False:
+        logger.info("S3 service is available again.")
+    return state
+
+
+def get_s3_health(max_age: float = HEALTH_TTL) -> dict[str, Any]:
+    """Health of the S3 service: available, the probe error and latency, and the age of the state in seconds.
+    The cached state is used when it is at most max_age seconds old, else the service is probed
+    with a short timeout and no retries."""
+    with _health_lock:
+        state = dict(_health)
+    if state["checked_at"] is None or time.monotonic() - state["checked_at"] > max_age:
+        state = _probe_s3(max_age)
+    return {
+        "available": state["available"],
+        "error": state["error"],
+        "latency": state["latency"],
+        "age": time.monotonic() - state["checked_at"],
+    }
+
 
+@instrumented()
+def is_s3_service_available(max_age: float = HEALTH_TTL) -> bool:
+    """Simple check if s3 works. A negative response might indicate service down or invalid credentials.
+    Answers from the cached health state when it is at most max_age seconds old (see get_s3_health)."""
+    return bool(get_s3_health(max_age)["available"])
 
+
+def wait_for_s3(timeout: float = 60.0, interval: float = 1.0) -> bool:
+    """Probe until S3 is available, returns False if it isn't within timeout seconds."""
+    deadline = time.monotonic() + timeout
+    while True:
+        if get_s3_health(max_age=0)["available"]:
+            return True
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        time.sleep(min(interval, remaining))
+
+
+def start_s3_health_monitor(interval: float = 10.0) -> None:
+    """Refresh the health state on a background thread every interval seconds, so checks never wait on a probe
+    as long as their max_age is larger than the interval."""
+    global _monitor
+    if _monitor is not None and _monitor.is_alive():
+        return
+    _monitor_stop.clear()
+
+    def run() -> None:
+        while True:
+            try:
+                _probe_s3(max_age=0)
+            except Exception as e:  # e.g. a missing s3 config, keep monitoring
+                logger.error("S3 health probe failed: %s", e)
+            if _monitor_stop.wait(interval):
+                return
+
+    _monitor = threading.Thread(target=run, name="tfds-s3-health", daemon=True)
+    _monitor.start()
+
+
+def stop_s3_health_monitor() -> None:
+    """Stop the background health refresh."""
+    global _monitor
+    _monitor_stop.set()
+    if _monitor is not None:
+        _monitor.join()
+        _monitor = None
+
+
+@instrumented()
 def bucket_exists(bucket_name: str) -> bool:
     """Check if an S3 bucket exists."""
     response = get_s3_client().list_buckets()
@@ -46,6 +200,7 @@ def bucket_exists(bucket_name: str) -> bool:
     return False
 
 
+@instrumented()
 def file_exists(bucket_name: str, file_name: str, prefix: Union[str, None] = None) -> bool:
     """Check if a file exists on S3."""
     try:
@@ -56,26 +211,28 @@ def file_exists(bucket_name: str, file_name: str, prefix: Union[str, None] = Non
         if e.response["Error"]["Code"] == "404":
             return False
         else:
-            print(f"Error checking file: {e}")
+            logger.error("Error checking file: %s", e)
             raise
 
 
+@instrumented()
 def create_bucket(bucket_name: str) -> bool:
     """Create an S3 bucket if does not exist."""
 
     try:
         if bucket_exists(bucket_name):
-            print(f"S3 bucket {bucket_name} already exists.")
+            logger.info("S3 bucket %s already exists.", bucket_name)
             return True
         s3_client = get_s3_client()
         s3_client.create_bucket(Bucket=bucket_name)
-        print(f"Bucket {bucket_name} created.")
+        logger.info("Bucket %s created.", bucket_name)
         return True
     except ClientError as e:
-        print(f"Error creating bucket: {e}")
+        logger.error("Error creating bucket: %s", e)
         return False
 
 
+@instrumented()
 def delete_bucket(bucket_name: str) -> None:
     """Delete S3 bucket if it exists."""
     if not bucket_exists(bucket_name):
@@ -84,18 +241,84 @@ def delete_bucket(bucket_name: str) -> None:
     s3_client.delete_bucket(Bucket=bucket_name)
 
 
-def delete_prefix(bucket: str, prefix: str) -> None:
-    """Delete all files with a given prefix in a bucket."""
+def _delete_batch(s3: Any, bucket: str, objects: list[dict[str, Any]], max_retries: int) -> dict[str, Any]:
+    """Delete up to 1000 listed objects, retrying the keys delete_objects reports as failed."""
+    sizes = {obj["Key"]: obj.get("Size", 0) for obj in objects}
+    pending = list(sizes)
+    errors: list[dict[str, Any]] = []
+    for attempt in range(max_retries + 1):
+        if attempt:
+            time.sleep(0.1 * 2**attempt)
+        response = s3.delete_objects(Bucket=bucket, Delete={"Objects": [{"Key": k} for k in pending], "Quiet": True})
+        errors = response.get("Errors", [])
+        pending = [e["Key"] for e in errors]
+        if not pending:
+            break
+    failed = set(pending)
+    deleted = [k for k in sizes if k not in failed]
+    return {"files": len(deleted), "bytes": sum(sizes[k] for k in deleted), "errors": errors}
+
+
+@instrumented()
+def delete_prefix(
+    bucket: str, prefix: str, dry_run: bool = False, max_workers: int = 8, max_retries: int = 3
+) -> dict[str, Any]:
+    """Delete all files with a given prefix in a bucket.
+    Listing continues while the 1000 key delete batches run on a bounded thread pool.
+    Keys that fail are retried max_retries times, the ones still failing are returned under 'errors'.
+    Returns the number of files and bytes deleted (or that would be deleted when dry_run)."""
     s3 = get_s3_client()
+    result: dict[str, Any] = {"files": 0, "bytes": 0, "errors": [], "dry_run": dry_run}
+
+    def collect(future: Future[dict[str, Any]]) -> None:
+        batch = future.result()
+        result["files"] += batch["files"]
+        result["bytes"] += batch["bytes"]
+        result["errors"].extend(batch["errors"])
+
     paginator = s3.get_paginator("list_objects_v2")
-    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
-        if "Contents" in page:
-            objects = [{"Key": obj["Key"]} for obj in page["Contents"]]
-            s3.delete_objects(Bucket=bucket, Delete={"Objects": objects})
+    pending: set[Future[dict[str, Any]]] = set()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            objects = page.get("Contents", [])
+            if not objects:
+                continue
+            if dry_run:
+                result["files"] += len(objects)
+                result["bytes"] += sum(obj.get("Size", 0) for obj in objects)
+                continue
+            # Keep the number of listed but undeleted pages bounded.
+            if len(pending) >= 2 * max_workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    collect(future)
+            pending.add(pool.submit(_delete_batch, s3, bucket, objects, max_retries))
+        for future in pending:
+            collect(future)
+
+    logger.info(
+        "%s %s files (%s bytes) from s3://%s/%s, %s failed.",
+        "Would delete" if dry_run else "Deleted",
+        result["files"],
+        result["bytes"],
+        bucket,
+        prefix,
+        len(result["errors"]),
+    )
+    return result
 
 
-def put_file(local_path: str, bucket: str, file_name: str, prefix: Union[str, None] = None) -> bool:
-    """Upload a file to S3."""
+@instrumented()
+def put_file(
+    local_path: str,
+    bucket: str,
+    file_name: str,
+    prefix: Union[str, None] = None,
+    compression: Optional[str] = None,
+) -> bool:
+    """Upload a file to S3.
+    compression ('gzip', 'zstd' or 'auto' for the key suffix) streams the file through a compressor in chunks.
+    With 'auto' a local file that already has the compressed suffix is uploaded as is."""
 
     s3_client = get_s3_client()
     if prefix and not prefix.endswith("/"):
@@ -103,28 +326,65 @@ def put_file(local_path: str, bucket: str, file_name: str, prefix: Union[str, No
     s3_key = prefix + file_name if prefix else file_name
 
     try:
-        text = f"{local_path} to bucket '{bucket}' as '{s3_key}'"
-        print(f"Intitating upload: {text}.")
-        s3_client.upload_file(local_path, bucket, s3_key)
-        print(f"Upload succeeded: {text}.")
+        if compression == "auto" and Path(local_path).suffix.lower() == Path(s3_key).suffix.lower():
+            compression = None
+        compression = _resolve_compression(compression, s3_key)
+        logger.debug(
+            "Intitating upload: %s to bucket '%s' as '%s' (%s).",
+            local_path,
+            bucket,
+            s3_key,
+            compression or "uncompressed",
+        )
+        if compression:
+            with open(local_path, "rb") as f, open_write(bucket, s3_key, compression=compression) as writer:
+                shutil.copyfileobj(f, writer, 1024 * 1024)
+        else:
+            s3_client.upload_file(local_path, bucket, s3_key)
+        if stats_enabled():
+            record_bytes("s3.put_file", os.path.getsize(local_path))
+        logger.info("Upload succeeded: %s to bucket '%s' as '%s'.", local_path, bucket, s3_key)
         return True
     except Exception as e:
-        print(f"Upload failed {text}: {e}")
+        logger.error("Upload failed %s to bucket '%s' as '%s': %s", local_path, bucket, s3_key, e)
         return False
 
 
-def get_file(local_path: str, bucket: str, file_name: str, prefix: Union[str, None] = None) -> bool:
-    """Download a file from S3."""
+@instrumented()
+def get_file(
+    local_path: str,
+    bucket: str,
+    file_name: str,
+    prefix: Union[str, None] = None,
+    parallel: bool = False,
+    compression: Optional[str] = None,
+) -> bool:
+    """Download a file from S3, parallel=True fetches byte ranges concurrently (see get_file_ranged).
+    compression ('gzip', 'zstd' or 'auto' for Content-Encoding/key suffix) decompresses while streaming to disk."""
+    if parallel and compression:
+        raise ValueError("Parallel ranged downloads can't be decompressed while streaming.")
+    if parallel:
+        return get_file_ranged(local_path, bucket, file_name, prefix)
     source_object_name = f"{prefix}/{file_name}" if prefix else file_name
-    text = f"{source_object_name} to {local_path}"
-    print(f"Intitating download: {text}.")
+    logger.debug("Intitating download: %s to %s.", source_object_name, local_path)
+    # download_file only replaces local_path once complete, the streamed download writes it directly.
+    opened = False
     try:
-        s3_client = get_s3_client()
-        s3_client.download_file(bucket, source_object_name, local_path)
-        print(f"Download completed: {text}.")
+        if compression:
+            with open_read(bucket, source_object_name, compression=compression) as reader, open(local_path, "wb") as f:
+                opened = True
+                shutil.copyfileobj(reader, f, 1024 * 1024)
+        else:
+            s3_client = get_s3_client()
+            s3_client.download_file(bucket, source_object_name, local_path)
+        if stats_enabled():
+            record_bytes("s3.get_file", os.path.getsize(local_path))
+        logger.info("Download completed: %s to %s.", source_object_name, local_path)
         return True
-    except ClientError as e:
-        print(f"Download failed {source_object_name} from s3: {e}")
+    except Exception as e:
+        logger.error("Download failed %s from s3: %s", source_object_name, e)
+        if opened and os.path.exists(local_path):
+            os.remove(local_path)
         return False
 
 
@@ -140,18 +400,21 @@ def as_urls(files: list[str], bucket_name: str) -> list[str]:
     return [f"s3a://{bucket_name}/{f}" for f in files]
 
 
-def list_files(prefix: str, bucket_name: str) -> list[str]:
-    """Expand s3 path and return all files under the given prefix, prefix should not contain any part of the filename or wildcards."""
+def iter_objects(prefix: str, bucket_name: str) -> Iterator[dict[str, Any]]:
+    """Yield the listing entry (Key, Size, LastModified, ETag...) of every object under the given prefix."""
     s3 = get_s3_client()
     paginator = s3.get_paginator("list_objects_v2")
-    pages = paginator.paginate(Bucket=bucket_name, Prefix=prefix)
-    all_files = []
-    for page in pages:
-        for obj in page.get("Contents", []):
-            all_files.append(obj["Key"])
-    return all_files
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+        yield from page.get("Contents", [])
+
+
+@instrumented()
+def list_files(prefix: str, bucket_name: str) -> list[str]:
+    """Expand s3 path and return all files under the given prefix, prefix should not contain any part of the filename or wildcards."""
+    return [obj["Key"] for obj in iter_objects(prefix, bucket_name)]
 
 
+@instrumented()
 def list_files_for_dates(dates: list[Union[dt.datetime, dt.date]], bucket_name: str) -> list[str]:
     """List all files in the s3 tfds standard date paths for the given dates.
     Spark doesn't resolve wildcards so we need to list the files individually.
@@ -162,3 +425,696 @@ def list_files_for_dates(dates: list[Union[dt.datetime, dt.date]], bucket_name:
         files = list_files(prefix, bucket_name)
         all_files.extend(files)
     return all_files
+
+
+# boto3's TransferConfig defaults, used when guessing how a multipart ETag was produced.
+DEFAULT_MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
+SYNC_COMPARE_MODES = ("size_mtime", "checksum")
+
+
+def _sync_prefix(prefix: Union[str, None]) -> str:
+    """Normalise a sync prefix so it can be prepended to relative paths."""
+    return prefix.strip("/") + "/" if prefix and prefix.strip("/") else ""
+
+
+def _list_local_files(local_dir: Union[str, Path]) -> dict[str, Path]:
+    """All files below local_dir, keyed by their posix path relative to local_dir."""
+    root = Path(local_dir)
+    if not root.is_dir():
+        return {}
+    return {p.relative_to(root).as_posix(): p for p in root.rglob("*") if p.is_file()}
+
+
+def _file_md5(path: Path, start: int = 0, length: Union[int, None] = None) -> bytes:
+    """MD5 digest of a file, or of a byte range of it, read in chunks."""
+    md5 = hashlib.md5(usedforsecurity=False)
+    remaining = length if length is not None else os.path.getsize(path) - start
+    with open(path, "rb") as f:
+        f.seek(start)
+        while remaining > 0:
+            chunk = f.read(min(remaining, 1024 * 1024))
+            if not chunk:
+                break
+            md5.update(chunk)
+            remaining -= len(chunk)
+    return md5.digest()
+
+
+@instrumented()
+def compute_etag(path: Union[str, Path], part_size: Union[int, None] = None) -> str:
+    """Compute the S3 ETag a file would get: plain MD5 for single part uploads, md5-of-md5s-N for multipart."""
+    path = Path(path)
+    size = path.stat().st_size
+    if not part_size or size <= part_size:
+        return _file_md5(path).hex()
+    digests = [_file_md5(path, start, part_size) for start in range(0, size, part_size)]
+    return f"{hashlib.md5(b''.join(digests)).hexdigest()}-{len(digests)}"
+
+
+def _etag_matches(path: Path, size: int, etag: str) -> bool:
+    """Check a local file against a remote ETag, guessing the part size for multipart ETags."""
+    etag = etag.strip('"')
+    if "-" not in etag:
+        return compute_etag(path) == etag
+    parts = int(etag.split("-")[1])
+    candidates = [DEFAULT_MULTIPART_CHUNKSIZE]
+    # Uploaders mostly use whole MiB part sizes, derive one from the part count as a fallback.
+    mib = 1024 * 1024
+    derived = -(-size // parts)
+    candidates.append(-(-derived // mib) * mib)
+    for part_size in dict.fromkeys(candidates):
+        if -(-size // part_size) == parts and compute_etag(path, part_size) == etag:
+            return True
+    return False
+
+
+def _needs_transfer(local: Path, remote: dict[str, Any], compare: str, upload: bool) -> bool:
+    """Decide if a file differs between local and remote."""
+    stat = local.stat()
+    if stat.st_size != remote["Size"]:
+        return True
+    if compare == "checksum":
+        return not _etag_matches(local, stat.st_size, remote["ETag"])
+    remote_mtime = cast(float, remote["LastModified"].timestamp())
+    # Uploads get the upload time as LastModified, so only a newer local file is a change.
+    # Downloads have their mtime set to LastModified, so any newer remote object is a change.
+    return stat.st_mtime > remote_mtime if upload else remote_mtime > stat.st_mtime
+
+
+@instrumented()
+def delete_keys(bucket: str, keys: list[str], max_retries: int = 3) -> dict[str, Any]:
+    """Delete the given keys in batches of 1000 (the delete_objects limit), retrying the ones that fail.
+    Returns the number of files deleted and the errors of the keys still failing after max_retries."""
+    s3 = get_s3_client()
+    result: dict[str, Any] = {"files": 0, "errors": []}
+    for i in range(0, len(keys), 1000):
+        batch = _delete_batch(s3, bucket, [{"Key": k} for k in keys[i : i + 1000]], max_retries)
+        result["files"] += batch["files"]
+        result["errors"].extend(batch["errors"])
+    return result
+
+
+@instrumented()
+def sync_to_s3(
+    local_dir: Union[str, Path],
+    bucket: str,
+    prefix: Union[str, None] = None,
+    delete: bool = False,
+    dry_run: bool = False,
+    compare: str = "size_mtime",
+) -> dict[str, Any]:
+    """Upload files in local_dir that are missing or changed under prefix, optionally deleting remote extras.
+    compare is 'size_mtime' (cheap) or 'checksum' (MD5 against the ETag, including multipart ETags).
+    Returns the plan: keys uploaded and deleted, number of unchanged files, the bytes to transfer
+    and the errors of remote extras that failed to delete (those are left out of 'deleted')."""
+    if compare not in SYNC_COMPARE_MODES:
+        raise ValueError(f"compare must be one of {SYNC_COMPARE_MODES}, got '{compare}'.")
+    key_prefix = _sync_prefix(prefix)
+    local_files = _list_local_files(local_dir)
+    remote = {obj["Key"][len(key_prefix) :]: obj for obj in iter_objects(key_prefix, bucket)}
+
+    upload = [
+        rel
+        for rel, path in local_files.items()
+        if rel not in remote or _needs_transfer(path, remote[rel], compare, True)
+    ]
+    extras = sorted(set(remote) - set(local_files)) if delete else []
+    plan: dict[str, Any] = {
+        "uploaded": [key_prefix + rel for rel in upload],
+        "deleted": [key_prefix + rel for rel in extras],
+        "unchanged": len(local_files) - len(upload),
+        "bytes": sum(local_files[rel].stat().st_size for rel in upload),
+        "dry_run": dry_run,
+        "errors": [],
+    }
+    logger.info(
+        "Sync %s to s3://%s/%s: %s to upload (%s bytes), %s to delete, %s unchanged%s.",
+        local_dir,
+        bucket,
+        key_prefix,
+        len(upload),
+        plan["bytes"],
+        len(extras),
+        plan["unchanged"],
+        " (dry run)" if dry_run else "",
+    )
+    if dry_run:
+        return plan
+
+    s3_client = get_s3_client()
+    for rel in upload:
+        s3_client.upload_file(str(local_files[rel]), bucket, key_prefix + rel)
+    record_bytes("s3.sync_to_s3", plan["bytes"])
+    if extras:
+        plan["errors"] = delete_keys(bucket, plan["deleted"])["errors"]
+        failed = {error["Key"] for error in plan["errors"]}
+        plan["deleted"] = [key for key in plan["deleted"] if key not in failed]
+    return plan
+
+
+@instrumented()
+def sync_from_s3(
+    local_dir: Union[str, Path],
+    bucket: str,
+    prefix: Union[str, None] = None,
+    delete: bool = False,
+    dry_run: bool = False,
+    compare: str = "size_mtime",
+) -> dict[str, Any]:
+    """Download objects under prefix that are missing or changed in local_dir, optionally deleting local extras.
+    compare is 'size_mtime' (cheap) or 'checksum' (MD5 against the ETag, including multipart ETags).
+    Returns the plan: keys downloaded, local files deleted, number of unchanged files and the bytes to transfer."""
+    if compare not in SYNC_COMPARE_MODES:
+        raise ValueError(f"compare must be one of {SYNC_COMPARE_MODES}, got '{compare}'.")
+    key_prefix = _sync_prefix(prefix)
+    root = Path(local_dir)
+    local_files = _list_local_files(root)
+    # "Folder" placeholder objects can't be written as files.
+    remote = {
+        obj["Key"][len(key_prefix) :]: obj for obj in iter_objects(key_prefix, bucket) if not obj["Key"].endswith("/")
+    }
+
+    download = [
+        rel
+        for rel, obj in remote.items()
+        if rel not in local_files or _needs_transfer(local_files[rel], obj, compare, False)
+    ]
+    extras = sorted(set(local_files) - set(remote)) if delete else []
+    plan: dict[str, Any] = {
+        "downloaded": [key_prefix + rel for rel in download],
+        "deleted": [str(local_files[rel]) for rel in extras],
+        "unchanged": len(remote) - len(download),
+        "bytes": sum(remote[rel]["Size"] for rel in download),
+        "dry_run": dry_run,
+    }
+    logger.info(
+        "Sync s3://%s/%s to %s: %s to download (%s bytes), %s to delete, %s unchanged%s.",
+        bucket,
+        key_prefix,
+        local_dir,
+        len(download),
+        plan["bytes"],
+        len(extras),
+        plan["unchanged"],
+        " (dry run)" if dry_run else "",
+    )
+    if dry_run:
+        return plan
+
+    s3_client = get_s3_client()
+    for rel in download:
+        target = root / rel
+        target.parent.mkdir(parents=True, exist_ok=True)
+        s3_client.download_file(bucket, key_prefix + rel, str(target))
+        # Align mtime with the object so the next size_mtime sync sees it as unchanged.
+        mtime = remote[rel]["LastModified"].timestamp()
+        os.utime(target, (mtime, mtime))
+    record_bytes("s3.sync_from_s3", plan["bytes"])
+    for rel in extras:
+        local_files[rel].unlink()
+    return plan
+
+
+def _make_key(file_name: str, prefix: Union[str, None] = None) -> str:
+    """Join prefix and file name into an object key."""
+    return f"{prefix.rstrip('/')}/{file_name}" if prefix else file_name
+
+
+COMPRESSION_SUFFIXES = {".gz": "gzip", ".gzip": "gzip", ".zst": "zstd", ".zstd": "zstd"}
+COMPRESSIONS = ("gzip", "zstd")
+
+
+def _resolve_compression(compression: Optional[str], key: str, content_encoding: Optional[str] = None) -> Optional[str]:
+    """Turn a compression argument into 'gzip', 'zstd' or None.
+    'auto' uses the object's Content-Encoding when known, otherwise the key suffix."""
+    if compression == "auto":
+        if content_encoding in COMPRESSIONS:
+            compression = content_encoding
+        else:
+            compression = COMPRESSION_SUFFIXES.get(Path(key).suffix.lower())
+    if compression is not None and compression not in COMPRESSIONS:
+        raise ValueError(f"compression must be one of {COMPRESSIONS}, 'auto' or None, got '{compression}'.")
+    if compression == "zstd" and zstandard is None:
+        raise ImportError("zstd compression requires the zstandard package: pip install zstandard")
+    return compression
+
+
+def _compressor(compression: Optional[str]) -> Any:
+    """A streaming compressor with compress()/flush(), or None."""
+    if compression == "gzip":
+        return zlib.compressobj(6, zlib.DEFLATED, 31)
+    if compression == "zstd" and zstandard is not None:
+        return zstandard.ZstdCompressor().compressobj()
+    return None
+
+
+def _decompressor(compression: Optional[str]) -> Any:
+    """A streaming decompressor with decompress()/flush(), or None."""
+    if compression == "gzip":
+        return zlib.decompressobj(31)
+    if compression == "zstd" and zstandard is not None:
+        return zstandard.ZstdDecompressor().decompressobj()
+    return None
+
+
+class S3ObjectReader(io.RawIOBase):
+    """Read-only file object streaming the body of an S3 object, see open_read.
+    With a compression the body is decompressed on the fly, chunk by chunk."""
+
+    def __init__(self, body: Any, size: int, compression: Optional[str] = None) -> None:
+        self._body = body
+        self.size = size
+        self._compression = compression
+        self._decompressor = _decompressor(compression)
+        self._pending = b""
+        self._eof = False
+
+    def readable(self) -> bool:
+        return True
+
+    def _fill(self, size: int) -> None:
+        """Decompress body chunks until there is output to hand out or the body is exhausted."""
+        while not self._pending and not self._eof:
+            chunk = self._body.read(max(size, 64 * 1024))
+            if not chunk:
+                self._pending = self._decompressor.flush()
+                self._eof = True
+                break
+            self._pending = self._decompressor.decompress(chunk)
+            # Concatenated gzip members / zstd frames each need a fresh decompressor.
+            unused = getattr(self._decompressor, "unused_data", b"")
+            while getattr(self._decompressor, "eof", False) and unused:
+                self._decompressor = _decompressor(self._compression)
+                self._pending += self._decompressor.decompress(unused)
+                unused = getattr(self._decompressor, "unused_data", b"")
+
+    def readinto(self, buffer: Any) -> int:
+        view = memoryview(buffer).cast("B")
+        if self._decompressor is None:
+            chunk = self._body.read(len(view))
+        else:
+            self._fill(len(view))
+            chunk, self._pending = self._pending[: len(view)], self._pending[len(view) :]
+        view[: len(chunk)] = chunk
+        return len(chunk)
+
+    def close(self) -> None:
+        if not self.closed:
+            self._body.close()
+        super().close()
+
+
+class S3ObjectWriter(io.RawIOBase):
+    """Write-only file object uploading to S3, see open_write.
+    Data is buffered up to part_size; small objects go up in a single put_object when closed,
+    larger ones are sent as a multipart upload so memory stays bounded by the part size.
+    With a compression the data is compressed as it is written and part_size applies to the compressed stream."""
+
+    def __init__(
+        self,
+        s3_client: Any,
+        bucket: str,
+        key: str,
+        part_size: int,
+        extra_args: dict[str, Any],
+        compression: Optional[str] = None,
+    ) -> None:
+        self._s3 = s3_client
+        self._bucket = bucket
+        self._key = key
+        self._part_size = part_size
+        self._extra_args = extra_args
+        self._compressor = _compressor(compression)
+        if compression:
+            self._extra_args = {**extra_args, "ContentEncoding": compression}
+        self._buffer = bytearray()
+        self._upload_id: Optional[str] = None
+        self._parts: list[dict[str, Any]] = []
+        self.bytes_written = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: Any) -> int:
+        if self.closed:
+            raise ValueError("I/O operation on closed S3 object writer.")
+        view = memoryview(data).cast("B")
+        self._buffer += self._compressor.compress(view) if self._compressor else view
+        self.bytes_written += len(view)
+        self._upload_full_parts()
+        return len(view)
+
+    def _upload_full_parts(self) -> None:
+        while len(self._buffer) >= self._part_size:
+            self._upload_part(bytes(self._buffer[: self._part_size]))
+            del self._buffer[: self._part_size]
+
+    def _upload_part(self, data: bytes) -> None:
+        if self._upload_id is None:
+            response = self._s3.create_multipart_upload(Bucket=self._bucket, Key=self._key, **self._extra_args)
+            self._upload_id = response["UploadId"]
+        number = len(self._parts) + 1
+        response = self._s3.upload_part(
+            Bucket=self._bucket, Key=self._key, UploadId=self._upload_id, PartNumber=number, Body=data
+        )
+        self._parts.append({"ETag": response["ETag"], "PartNumber": number})
+
+    def close(self) -> None:
+        """Flush the remaining buffer and complete the upload."""
+        if self.closed:
+            return
+        try:
+            if self._compressor:
+                self._buffer += self._compressor.flush()
+                self._compressor = None
+                self._upload_full_parts()
+            if self._upload_id is None:
+                self._s3.put_object(Bucket=self._bucket, Key=self._key, Body=bytes(self._buffer), **self._extra_args)
+            else:
+                if self._buffer:
+                    self._upload_part(bytes(self._buffer))
+                self._s3.complete_multipart_upload(
+                    Bucket=self._bucket,
+                    Key=self._key,
+                    UploadId=self._upload_id,
+                    MultipartUpload={"Parts": self._parts},
+                )
+        except Exception:
+            self.abort()
+            raise
+        self._buffer = bytearray()
+        super().close()
+
+    def abort(self) -> None:
+        """Discard everything written so far, nothing is stored on S3."""
+        if self._upload_id is not None:
+            self._s3.abort_multipart_upload(Bucket=self._bucket, Key=self._key, UploadId=self._upload_id)
+            self._upload_id = None
+        self._buffer = bytearray()
+        super().close()
+
+    def __exit__(self, exc_type: Any, exc_value: Any, traceback: Any) -> None:
+        # Never store a partially written object when the block failed.
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+
+@instrumented()
+def open_read(
+    bucket: str, file_name: str, prefix: Union[str, None] = None, compression: Optional[str] = None
+) -> io.BufferedReader:
+    """Open an S3 object for streaming reads, wrap it in io.TextIOWrapper for text.
+    compression ('gzip', 'zstd' or 'auto' for Content-Encoding/key suffix) decompresses while reading."""
+    key = _make_key(file_name, prefix)
+    response = get_s3_client().get_object(Bucket=bucket, Key=key)
+    compression = _resolve_compression(compression, key, response.get("ContentEncoding"))
+    reader = S3ObjectReader(response["Body"], response["ContentLength"], compression)
+    return io.BufferedReader(reader, buffer_size=1024 * 1024)
+
+
+@instrumented()
+def open_write(
+    bucket: str,
+    file_name: str,
+    prefix: Union[str, None] = None,
+    part_size: int = DEFAULT_MULTIPART_CHUNKSIZE,
+    extra_args: Optional[dict[str, Any]] = None,
+    compression: Optional[str] = None,
+) -> S3ObjectWriter:
+    """Open an S3 object for streaming writes, the object is stored when the writer is closed.
+    part_size bounds memory use, S3 requires at least 5 MiB for all but the last part.
+    compression ('gzip', 'zstd' or 'auto' for the key suffix) compresses while writing and sets Content-Encoding."""
+    key = _make_key(file_name, prefix)
+    compression = _resolve_compression(compression, key)
+    return S3ObjectWriter(get_s3_client(), bucket, key, part_size, extra_args or {}, compression)
+
+
+@instrumented()
+def put_bytes(
+    data: Union[bytes, bytearray, memoryview],
+    bucket: str,
+    file_name: str,
+    prefix: Union[str, None] = None,
+    part_size: int = DEFAULT_MULTIPART_CHUNKSIZE,
+    compression: Optional[str] = None,
+) -> bool:
+    """Upload an in-memory buffer to S3 without a temp file, large buffers are sent as multipart in slices."""
+    key = _make_key(file_name, prefix)
+    view = memoryview(data).cast("B")
+    try:
+        with open_write(bucket, file_name, prefix, part_size=part_size, compression=compression) as writer:
+            for start in range(0, len(view), part_size):
+                writer.write(view[start : start + part_size])
+        record_bytes("s3.put_bytes", len(view))
+        return True
+    except Exception as e:
+        logger.error("Upload failed %s bytes to bucket '%s' as '%s': %s", len(view), bucket, key, e)
+        return False
+
+
+@instrumented()
+def get_bytes(bucket: str, file_name: str, prefix: Union[str, None] = None, compression: Optional[str] = None) -> bytes:
+    """Download an S3 object into memory, decompressing it when a compression is given."""
+    if compression:
+        with open_read(bucket, file_name, prefix, compression=compression) as reader:
+            data = reader.read()
+    else:
+        response = get_s3_client().get_object(Bucket=bucket, Key=_make_key(file_name, prefix))
+        data = bytes(response["Body"].read())
+    record_bytes("s3.get_bytes", len(data))
+    return data
+
+
+DEFAULT_RANGE_PART_SIZE = 64 * 1024 * 1024
+DEFAULT_RANGE_WORKERS = 8
+
+
+@instrumented()
+def get_range(bucket: str, key: str, start: int, end: Union[int, None] = None) -> bytes:
+    """Download the bytes start..end of an object, end is inclusive as in an HTTP Range header, None reads to the end."""
+    byte_range = f"bytes={start}-{end if end is not None else ''}"
+    response = get_s3_client().get_object(Bucket=bucket, Key=key, Range=byte_range)
+    data = bytes(response["Body"].read())
+    record_bytes("s3.get_range", len(data))
+    return data
+
+
+def _fetch_range_into(
+    s3_client: Any, bucket: str, key: str, etag: str, start: int, end: int, fd: int, mm: Optional[mmap.mmap]
+) -> int:
+    """Fetch one byte range and write it in chunks at its offset in the target file or memory map."""
+    response = s3_client.get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{end}", IfMatch=etag)
+    body = response["Body"]
+    offset = start
+    while chunk := body.read(1024 * 1024):
+        if mm is not None:
+            mm[offset : offset + len(chunk)] = chunk
+        else:
+            os.pwrite(fd, chunk, offset)
+        offset += len(chunk)
+    if offset != end + 1:
+        raise IOError(f"Short read for bytes {start}-{end} of '{key}', got {offset - start} bytes.")
+    return offset - start
+
+
+@instrumented()
+def get_file_ranged(
+    local_path: str,
+    bucket: str,
+    file_name: str,
+    prefix: Union[str, None] = None,
+    part_size: int = DEFAULT_RANGE_PART_SIZE,
+    max_workers: int = DEFAULT_RANGE_WORKERS,
+    use_mmap: bool = False,
+) -> bool:
+    """Download a large object as concurrent ranged GETs written straight into a preallocated local file.
+    All ranges are pinned to the ETag seen up front, so an object replaced mid-download fails instead of mixing versions.
+    use_mmap writes the ranges through a memory map of the file rather than positional writes."""
+    key = _make_key(file_name, prefix)
+    logger.debug("Intitating ranged download: %s to %s.", key, local_path)
+    s3_client = get_s3_client()
+    # Only a file this call truncated is removed on failure, an existing one is left alone when head_object fails.
+    opened = False
+    try:
+        head = s3_client.head_object(Bucket=bucket, Key=key)
+        size, etag = head["ContentLength"], head["ETag"]
+        ranges = [(start, min(start + part_size, size) - 1) for start in range(0, size, part_size)]
+        with open(local_path, "wb+") as f:
+            opened = True
+            f.truncate(size)
+            mm = mmap.mmap(f.fileno(), size) if use_mmap and size else None
+            try:
+                with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                    futures = [
+                        pool.submit(_fetch_range_into, s3_client, bucket, key, etag, start, end, f.fileno(), mm)
+                        for start, end in ranges
+                    ]
+                    try:
+                        for future in futures:
+                            future.result()
+                    except BaseException:
+                        # Don't fetch the rest of the object for a download that already failed, the
+                        # ranges in flight are still waited for as they write into the file closed below.
+                        pool.shutdown(wait=True, cancel_futures=True)
+                        raise
+            finally:
+                if mm is not None:
+                    mm.flush()
+                    mm.close()
+        record_bytes("s3.get_file_ranged", size)
+        logger.info("Download completed: %s to %s, %s bytes in %s ranges.", key, local_path, size, len(ranges))
+        return True
+    except Exception as e:
+        logger.error("Download failed %s from s3: %s", key, e)
+        if opened and os.path.exists(local_path):
+            os.remove(local_path)
+        return False
+
+
+SELECT_FORMATS = ("csv", "json")
+# Error codes of endpoints that don't implement (or have disabled) select_object_content.
+SELECT_UNSUPPORTED_CODES = ("NotImplemented", "XNotImplemented", "MethodNotAllowed", "UnsupportedOperation")
+_SELECT_SQL = re.compile(
+    r"^\s*select\s+(?P<columns>.+?)\s+from\s+s3object(?:\s+(?:as\s+)?(?P<alias>\w+))?"
+    r"(?:\s+where\s+(?P<where>.+?))?(?:\s+limit\s+(?P<limit>\d+))?\s*;?\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+_SELECT_CONDITION = re.compile(
+    r"^\s*(?P<column>[\w.\"]+)\s*(?P<op>=|!=|<>|<=|>=|<|>)\s*(?P<value>'(?:[^']|'')*'|-?\d+(?:\.\d+)?)\s*$"
+)
+_SELECT_OPS = {
+    "=": operator.eq,
+    "!=": operator.ne,
+    "<>": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+
+def _select_column(ref: str, alias: Optional[str]) -> str:
+    """Strip the table alias and quotes from a column reference like s."name"."""
+    ref = ref.strip()
+    if alias and ref.lower().startswith(alias.lower() + "."):
+        ref = ref[len(alias) + 1 :]
+    elif ref.lower().startswith("s3object."):
+        ref = ref[len("s3object.") :]
+    return ref.strip('"')
+
+
+def _parse_select_sql(sql: str) -> tuple[Optional[list[str]], list[tuple[str, Any, Any]], Optional[int]]:
+    """Parse the S3 Select subset supported locally: SELECT */columns FROM S3Object [alias]
+    [WHERE col op literal [AND ...]] [LIMIT n]. Returns the columns (None for *), conditions and limit."""
+    match = _SELECT_SQL.match(sql)
+    if not match:
+        raise ValueError(f"SQL not supported by the local select fallback: {sql}")
+    alias = match["alias"]
+    columns = None
+    if match["columns"].strip() != "*":
+        columns = [_select_column(c, alias) for c in match["columns"].split(",")]
+        if not all(re.fullmatch(r"[\w ]+", c) for c in columns):
+            raise ValueError(f"Only plain columns are supported by the local select fallback: {sql}")
+    conditions = []
+    where_parts = re.split(r"\s+and\s+", match["where"], flags=re.IGNORECASE) if match["where"] else []
+    for part in where_parts:
+        cond = _SELECT_CONDITION.match(part)
+        if not cond:
+            raise ValueError(f"WHERE condition not supported by the local select fallback: {part}")
+        raw = cond["value"]
+        value: Any = raw[1:-1].replace("''", "'") if raw.startswith("'") else float(raw)
+        conditions.append((_select_column(cond["column"], alias), _SELECT_OPS[cond["op"]], value))
+    return columns, conditions, int(match["limit"]) if match["limit"] else None
+
+
+def _condition_holds(record: dict[str, Any], column: str, op: Any, value: Any) -> bool:
+    """Evaluate one condition, comparing numerically when the literal is a number."""
+    field = record.get(column)
+    if field is None:
+        return False
+    try:
+        return bool(op(float(field), value) if isinstance(value, float) else op(str(field), value))
+    except (TypeError, ValueError):
+        return False
+
+
+def _local_select(
+    bucket: str, key: str, sql: str, input_format: str, output_format: str, compression: Optional[str]
+) -> Iterator[Any]:
+    """Evaluate a simple select query while streaming the object, used when the endpoint has no S3 Select."""
+    columns, conditions, limit = _parse_select_sql(sql)
+    if limit == 0:
+        return
+    count = 0
+    with io.TextIOWrapper(open_read(bucket, key, compression=compression), encoding="utf-8", newline="") as text:
+        records: Iterator[dict[str, Any]]
+        if input_format == "csv":
+            records = csv.DictReader(text)
+        else:
+            records = (json.loads(line) for line in text if line.strip())
+        for record in records:
+            if not all(_condition_holds(record, *cond) for cond in conditions):
+                continue
+            selected = record if columns is None else {c: record.get(c) for c in columns}
+            yield selected if output_format == "json" else list(selected.values())
+            count += 1
+            if limit is not None and count >= limit:
+                return
+
+
+def _select_records(payload: Any, output_format: str) -> Iterator[Any]:
+    """Split the Records events of a select_object_content stream into parsed rows."""
+    pending = b""
+    for event in payload:
+        if "Records" not in event:
+            continue
+        pending += event["Records"]["Payload"]
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield json.loads(line) if output_format == "json" else next(csv.reader([line.decode("utf-8")]))
+    if pending.strip():
+        yield json.loads(pending) if output_format == "json" else next(csv.reader([pending.decode("utf-8")]))
+
+
+def select_rows(
+    bucket: str,
+    key: str,
+    sql: str,
+    input_format: str = "csv",
+    output_format: str = "json",
+    compression: Optional[str] = "auto",
+) -> Iterator[Any]:
+    """Stream the rows matching an S3 Select query, e.g. "SELECT s.id FROM S3Object s WHERE s.country = 'SE'".
+    CSV input must have a header row, JSON input is JSON lines. Rows are dicts for json output, lists for csv.
+    When the endpoint doesn't support Select, simple queries (column list, AND-ed comparisons, LIMIT)
+    are evaluated locally while streaming the object, so only the matching rows are kept."""
+    if input_format not in SELECT_FORMATS or output_format not in SELECT_FORMATS:
+        raise ValueError(f"input_format and output_format must be one of {SELECT_FORMATS}.")
+    resolved = _resolve_compression(compression, key)
+    input_serialization: dict[str, Any] = (
+        {"CSV": {"FileHeaderInfo": "USE"}} if input_format == "csv" else {"JSON": {"Type": "LINES"}}
+    )
+    output_serialization = {"JSON": {"RecordDelimiter": "\n"}} if output_format == "json" else {"CSV": {}}
+    # S3 Select only decompresses gzip (and bzip2), zstd objects are always filtered locally.
+    if resolved != "zstd":
+        input_serialization["CompressionType"] = "GZIP" if resolved == "gzip" else "NONE"
+        try:
+            response = get_s3_client().select_object_content(
+                Bucket=bucket,
+                Key=key,
+                Expression=sql,
+                ExpressionType="SQL",
+                InputSerialization=input_serialization,
+                OutputSerialization=output_serialization,
+            )
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in SELECT_UNSUPPORTED_CODES:
+                raise
+            logger.warning("S3 Select not supported by the endpoint, filtering '%s' locally.", key)
+        else:
+            yield from _select_records(response["Payload"], output_format)
+            return
+    yield from _local_select(bucket, key, sql, input_format, output_format, resolved)
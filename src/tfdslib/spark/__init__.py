@@ -1,3 +1,50 @@
-from .spark import get_spark_session, show_cfg, show_dbs, show_spark_info
+"""Spark session and table helpers."""
 
-__all__ = ["get_spark_session", "show_cfg", "show_dbs", "show_spark_info"]
+from typing import TYPE_CHECKING
+
+from tfdslib._lazy import attach
+
+if TYPE_CHECKING:
+    from .spark import (
+        broadcast_configs,
+        clear_schema_cache,
+        collect_job_metrics,
+        compact_dates,
+        delta_table_stats,
+        get_spark_session,
+        list_delta_tables,
+        list_tables,
+        maintain_delta_tables,
+        optimize_table,
+        read_dates,
+        show_cfg,
+        show_dbs,
+        show_spark_info,
+        stop_spark_session,
+        track_metrics,
+        use_broadcast_configs,
+        vacuum_table,
+    )
+
+__all__ = [
+    "get_spark_session",
+    "show_cfg",
+    "show_dbs",
+    "show_spark_info",
+    "stop_spark_session",
+    "read_dates",
+    "clear_schema_cache",
+    "compact_dates",
+    "delta_table_stats",
+    "list_delta_tables",
+    "maintain_delta_tables",
+    "optimize_table",
+    "vacuum_table",
+    "broadcast_configs",
+    "use_broadcast_configs",
+    "collect_job_metrics",
+    "track_metrics",
+    "list_tables",
+]
+
+__getattr__, __dir__ = attach(__name__, {"spark": __all__})
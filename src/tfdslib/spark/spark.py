@@ -1,32 +1,283 @@
+import datetime as dt
+import hashlib
+import json
+import logging
+import math
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterator, Optional, Union
+from urllib.parse import urlparse
+
 import pyspark
+import requests
 from delta import configure_spark_with_delta_pip
-from pyspark.sql import SparkSession
+from pyspark.broadcast import Broadcast
+from pyspark.sql import DataFrame, SparkSession
+from pyspark.sql.types import StructType
 
-from tfdslib.config import get_config
+from tfdslib.config import get_config, set_config_snapshot
+from tfdslib.config.config import SNAPSHOT_FILE_PREFIX
+from tfdslib.config_file import get_root_folder, strip_yaml
+from tfdslib.s3 import (
+    delete_keys,
+    delete_prefix,
+    get_s3_client,
+    iter_objects,
+    make_date_prefix,
+)
 
+logger = logging.getLogger(__name__)
 
-def get_spark_session(app_name: str, use_local: bool = False) -> SparkSession:
-    """Get spark client for s3."""
+# Settings shared by all profiles: S3A tuned for our MinIO and Delta enabled.
+_BASE_PROFILE = {
+    "spark.hadoop.fs.s3a.impl": "org.apache.hadoop.fs.s3a.S3AFileSystem",
+    "spark.hadoop.fs.s3a.path.style.access": "true",
+    "spark.hadoop.fs.s3a.connection.maximum": "100",
+    "spark.hadoop.fs.s3a.threads.max": "64",
+    "spark.hadoop.fs.s3a.fast.upload.buffer": "disk",
+    "spark.hadoop.fs.s3a.multipart.size": "64M",
+    "spark.hadoop.fs.s3a.experimental.input.fadvise": "normal",
+    "spark.hadoop.fs.s3a.readahead.range": "1M",
+    "spark.sql.extensions": "io.delta.sql.DeltaSparkSessionExtension",
+    "spark.sql.catalog.spark_catalog": "org.apache.spark.sql.delta.catalog.DeltaCatalog",
+}
 
-    s3_cfg = get_config("s3")
+# The S3A magic committer writes straight to the destination instead of renaming (copying) task output on S3.
+# Its classes come from the spark-hadoop-cloud module, which pip pyspark doesn't ship, so it is only used when
+# the 'spark' config sets magic_committer: true on clusters that have the module on the classpath.
+MAGIC_COMMITTER_SETTINGS = {
+    "spark.hadoop.fs.s3a.committer.name": "magic",
+    "spark.hadoop.fs.s3a.committer.magic.enabled": "true",
+    "spark.sql.sources.commitProtocolClass": "org.apache.spark.internal.io.cloud.PathOutputCommitProtocol",
+    "spark.sql.parquet.output.committer.class": "org.apache.spark.internal.io.cloud.BindingParquetOutputCommitter",
+}
+
+SPARK_PROFILES: dict[str, dict[str, str]] = {
+    "default": _BASE_PROFILE,
+    # Large sequential writes: upload blocks from memory in parallel, bigger parts, let Delta bin-pack output.
+    "bulk_write": {
+        **_BASE_PROFILE,
+        "spark.hadoop.fs.s3a.connection.maximum": "200",
+        "spark.hadoop.fs.s3a.threads.max": "128",
+        "spark.hadoop.fs.s3a.fast.upload.buffer": "bytebuffer",
+        "spark.hadoop.fs.s3a.fast.upload.active.blocks": "8",
+        "spark.hadoop.fs.s3a.multipart.size": "128M",
+        "spark.hadoop.fs.s3a.experimental.input.fadvise": "sequential",
+        "spark.databricks.delta.optimizeWrite.enabled": "true",
+        "spark.databricks.delta.autoCompact.enabled": "true",
+    },
+    # Selective reads of columnar files: small ranged GETs instead of streaming whole objects.
+    "random_read": {
+        **_BASE_PROFILE,
+        "spark.hadoop.fs.s3a.connection.maximum": "200",
+        "spark.hadoop.fs.s3a.experimental.input.fadvise": "random",
+        "spark.hadoop.fs.s3a.readahead.range": "64K",
+        "spark.sql.files.maxPartitionBytes": "64m",
+        "spark.sql.parquet.filterPushdown": "true",
+        "spark.sql.parquet.aggregatePushdown": "true",
+    },
+}
+
+
+def _get_spark_config() -> dict[str, Any]:
+    """The optional 'spark' config, empty if it doesn't exist."""
+    try:
+        return get_config("spark") or {}
+    except Exception as ex:
+        logger.debug("No spark config available, using defaults: %s", ex)
+        return {}
+
+
+def _profile_settings(profile: Optional[str], s3_cfg: dict[str, Any]) -> dict[str, str]:
+    """Resolve a tuning profile (parameter, then the 'profile' key of the spark config, then 'default')
+    into spark settings, including the S3A endpoint from the s3 config and the magic committer if enabled."""
+    spark_cfg = _get_spark_config()
+    profile = profile or spark_cfg.get("profile") or "default"
+    if profile not in SPARK_PROFILES:
+        raise ValueError(f"Unknown spark profile '{profile}', choose one of {sorted(SPARK_PROFILES)}.")
+    settings = dict(SPARK_PROFILES[profile])
+    if spark_cfg.get("magic_committer"):
+        settings.update(MAGIC_COMMITTER_SETTINGS)
+    url = s3_cfg.get("url")
+    if url:
+        settings["spark.hadoop.fs.s3a.endpoint"] = url
+        settings["spark.hadoop.fs.s3a.connection.ssl.enabled"] = str(url.startswith("https://")).lower()
+    return settings
+
+
+def _detect_cores() -> int:
+    """CPU cores available to this process (respecting affinity/cpusets)."""
+    if hasattr(os, "sched_getaffinity"):
+        return max(1, len(os.sched_getaffinity(0)))
+    return os.cpu_count() or 1
+
+
+def _detect_memory() -> int:
+    """Physical memory in bytes, capped by a cgroup (container) limit when there is one."""
+    try:
+        memory = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        memory = 4 * 1024**3
+    for limit_file in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(limit_file) as f:
+                limit = f.read().strip()
+        except OSError:
+            continue
+        if limit.isdigit():
+            memory = min(memory, int(limit))
+    return memory
+
+
+def _local_settings() -> dict[str, str]:
+    """Settings sized to this machine for local[*] sessions.
+    Shuffle partitions and parallelism follow the cores (instead of spark's fixed 200 partitions), the driver,
+    which runs all tasks in local mode, gets half the memory and adaptive execution coalesces small partitions.
+    Under pytest, or with TFDS_SPARK_LIGHTWEIGHT=1, the UI and event log are switched off."""
+    cores = _detect_cores()
+    memory_mb = _detect_memory() // 1024**2
+    driver_mb = min(max(memory_mb // 2, 1024), 32 * 1024)
+    settings = {
+        "spark.tfds.local.cores": str(cores),
+        "spark.tfds.local.memory": f"{memory_mb}m",
+        "spark.driver.memory": f"{driver_mb}m",
+        "spark.sql.shuffle.partitions": str(cores * 2),
+        "spark.default.parallelism": str(cores * 2),
+        "spark.sql.adaptive.enabled": "true",
+        "spark.sql.adaptive.coalescePartitions.enabled": "true",
+        "spark.sql.adaptive.coalescePartitions.initialPartitionNum": str(cores * 4),
+        "spark.sql.adaptive.advisoryPartitionSizeInBytes": "32m",
+        "spark.sql.adaptive.skewJoin.enabled": "true",
+    }
+    if "PYTEST_CURRENT_TEST" in os.environ or os.environ.get("TFDS_SPARK_LIGHTWEIGHT") == "1":
+        settings.update(
+            {
+                "spark.ui.enabled": "false",
+                "spark.ui.showConsoleProgress": "false",
+                "spark.eventLog.enabled": "false",
+                "spark.sql.ui.retainedExecutions": "1",
+                "spark.driver.bindAddress": "127.0.0.1",
+                "spark.driver.host": "localhost",
+            }
+        )
+    return settings
+
+
+_sessions: dict[tuple[str, bool, Optional[str]], SparkSession] = {}
+_sessions_lock = threading.RLock()
 
-    conf = (
-        pyspark.conf.SparkConf()
-        .setAppName(app_name)
+
+def _is_alive(spark_session: Any) -> bool:
+    """Check that a session still has a running SparkContext."""
+    try:
+        return spark_session.sparkContext._jsc is not None
+    except AttributeError:
+        return False
+
+
+def _live_session() -> Optional[SparkSession]:
+    """The running session, registered or created outside of tfdslib."""
+    for spark_session in _sessions.values():
+        if _is_alive(spark_session):
+            return spark_session
+    return pyspark.sql.SparkSession.getActiveSession()
+
+
+def _session_settings(app_name: str, use_local: bool, profile: Optional[str]) -> dict[str, str]:
+    """The effective spark settings for a get_spark_session call."""
+    s3_cfg = get_config("s3")
+    settings = {
+        "spark.app.name": app_name,
         # s3 secrets
-        .set("spark.hadoop.fs.s3a.access.key", s3_cfg["access_key"])
-        .set("spark.hadoop.fs.s3a.secret.key", s3_cfg["secret_key"])
-        .set("spark.task.maxFailures", "1")
-    )
+        "spark.hadoop.fs.s3a.access.key": s3_cfg["access_key"],
+        "spark.hadoop.fs.s3a.secret.key": s3_cfg["secret_key"],
+        "spark.task.maxFailures": "1",
+        **_profile_settings(profile, s3_cfg),
+    }
     if use_local:
-        conf = conf.setMaster("local[*]")
+        settings["spark.master"] = "local[*]"
+        settings.update(_local_settings())
+    return settings
+
 
-    builder = pyspark.sql.SparkSession.builder.config(conf=conf)
-    spark_session = configure_spark_with_delta_pip(builder).getOrCreate()
+def _apply_settings(spark_session: SparkSession, settings: dict[str, str]) -> None:
+    """Bring a live session in line with settings where that can be done at runtime.
+    Hadoop (spark.hadoop.*) and runtime SQL settings are updated in place, differing static settings raise,
+    getOrCreate would silently ignore them."""
+    spark_conf = spark_session.sparkContext.getConf()
+    hadoop_conf = spark_session.sparkContext._jsc.hadoopConfiguration()
+    conflicts = []
+    for key, value in settings.items():
+        if key == "spark.app.name":
+            continue
+        if key.startswith("spark.hadoop."):
+            if hadoop_conf.get(key[len("spark.hadoop.") :]) != value:
+                hadoop_conf.set(key[len("spark.hadoop.") :], value)
+        elif spark_session.conf.isModifiable(key):
+            if spark_session.conf.get(key, None) != value:
+                logger.debug("Updating %s on the live spark session.", key)
+                spark_session.conf.set(key, value)
+        elif spark_conf.get(key, None) != value:
+            conflicts.append(f"{key}={spark_conf.get(key, None)!r} (wanted {value!r})")
+    if conflicts:
+        raise ValueError(
+            "A spark session with conflicting static settings is running, call stop_spark_session() first: "
+            + ", ".join(conflicts)
+        )
+
+
+def get_spark_session(
+    app_name: str, use_local: bool = False, profile: Optional[str] = None, refresh: bool = False
+) -> SparkSession:
+    """Get spark client for s3.
+    profile selects a set of S3A/Delta tuning settings from SPARK_PROFILES ('default', 'bulk_write', 'random_read'),
+    when not given the 'profile' key of the spark config is used.
+    Sessions are registered per (app_name, use_local, profile), repeated calls return the registered session
+    without fetching configs. refresh=True refetches the configs and applies them to the live session.
+    A running session is reused when its static settings match, otherwise ValueError is raised."""
+    key = (app_name, use_local, profile)
+    with _sessions_lock:
+        spark_session = _sessions.get(key)
+        if spark_session is not None and _is_alive(spark_session) and not refresh:
+            return spark_session
+
+        settings = _session_settings(app_name, use_local, profile)
+        live = _live_session()
+        if live is not None:
+            _apply_settings(live, settings)
+            _sessions[key] = live
+            return live
+
+        conf = pyspark.conf.SparkConf().setAppName(app_name)
+        for name, value in settings.items():
+            if name not in ("spark.app.name", "spark.master"):
+                conf = conf.set(name, value)
+        if use_local:
+            conf = conf.setMaster("local[*]")
+
+        builder = pyspark.sql.SparkSession.builder.config(conf=conf)
+        spark_session = configure_spark_with_delta_pip(builder).getOrCreate()
+        _sessions[key] = spark_session
 
     return spark_session
 
 
+def stop_spark_session() -> None:
+    """Stop the running spark session and forget the registered ones."""
+    with _sessions_lock:
+        live = _live_session()
+        if live is not None:
+            live.stop()
+        _sessions.clear()
+
+
 def show_cfg(spark_session: SparkSession) -> None:
     """Print the entire spark config."""
     cfg = spark_session.sparkContext.getConf().getAll()
@@ -54,14 +305,592 @@ def show_spark_info(sc: SparkSession) -> None:
     print(f'Spark master: {cfg.get("spark.master")}')
     print(f'Delta lake location: {cfg.get("spark.sql.warehouse.dir")}')
     print(f'S3 endpoint: {cfg.get("spark.hadoop.fs.s3a.endpoint")}')
+    if cfg.get("spark.tfds.local.cores", None):
+        print(f'Local sizing: {cfg.get("spark.tfds.local.cores")} cores, {cfg.get("spark.tfds.local.memory")} memory')
+        print(f'    driver memory: {cfg.get("spark.driver.memory", None)}')
+        print(f'    shuffle partitions: {cfg.get("spark.sql.shuffle.partitions", None)}')
+        print(f'    default parallelism: {cfg.get("spark.default.parallelism", None)}')
+        print(f'    adaptive execution: {cfg.get("spark.sql.adaptive.enabled", None)}')
+        print(f'    ui enabled: {cfg.get("spark.ui.enabled", "true")}')
+
+
+_table_cache: dict[tuple[Any, ...], tuple[float, list[dict[str, Any]]]] = {}
+
+
+def _describe_table(spark: SparkSession, table: str) -> dict[str, Optional[str]]:
+    """Provider (delta, parquet, hive...) and location of a catalog table."""
+    found: dict[str, Optional[str]] = {"provider": None, "location": None}
+    for row in spark.sql(f"DESCRIBE TABLE EXTENDED {table}").collect():
+        if row["col_name"] == "Provider":
+            found["provider"] = str(row["data_type"]).lower()
+        elif row["col_name"] == "Location":
+            found["location"] = str(row["data_type"])
+    return found
+
+
+def list_tables(
+    spark: SparkSession,
+    databases: Optional[list[str]] = None,
+    details: bool = True,
+    cache_ttl: Optional[float] = None,
+    max_workers: int = 8,
+) -> list[dict[str, Any]]:
+    """List the catalog tables as records with db, table, type, temporary, provider and location.
+    Databases are listed concurrently, and so are the DESCRIBE calls that fetch provider and location
+    (skipped for views, temporary tables, and when details=False, leaving them None).
+    With cache_ttl (seconds) the result is reused for calls with the same arguments within the ttl."""
+    if databases is None:
+        databases = [db.name for db in spark.catalog.listDatabases()]
+    cache_key = (id(spark), tuple(databases), details)
+    if cache_ttl is not None:
+        cached = _table_cache.get(cache_key)
+        if cached and time.monotonic() - cached[0] < cache_ttl:
+            return [dict(record) for record in cached[1]]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        listings = pool.map(lambda db: (db, spark.catalog.listTables(db)), databases)
+        records = [
+            {
+                "db": db,
+                "table": tbl.name,
+                "type": tbl.tableType,
+                "temporary": tbl.isTemporary,
+                "provider": None,
+                "location": None,
+            }
+            for db, tables in listings
+            for tbl in tables
+        ]
+        if details:
+            described = [r for r in records if not r["temporary"] and r["type"] != "VIEW"]
+            for record, found in zip(
+                described, pool.map(lambda r: _describe_table(spark, f"{r['db']}.{r['table']}"), described)
+            ):
+                record.update(found)
+
+    if cache_ttl is not None:
+        _table_cache[cache_key] = (time.monotonic(), [dict(record) for record in records])
+    return records
 
 
 def show_dbs(sc: SparkSession) -> None:
     """Print all databases and tables."""
-    dbs = sc.catalog.listDatabases()
+    dbs = [db.name for db in sc.catalog.listDatabases()]
+    tables = list_tables(sc, dbs, details=False)
     print("Databases and tables:")
     for db in dbs:
-        print(db.name)
-        tables = sc.catalog.listTables(db.name)
+        print(db)
         for tbl in tables:
-            print(f"    {tbl.name}")
+            if tbl["db"] == db:
+                print(f"    {tbl['table']}")
+
+
+_schema_cache: dict[tuple[str, str, str], StructType] = {}
+# Files read to infer the schema of row based formats (csv, json, ...), spread over the date folders.
+SCHEMA_SAMPLE_FILES = 8
+
+
+def _schema_cache_dir() -> Path:
+    return get_root_folder() / "cache" / "spark_schemas"
+
+
+def _schema_key(bucket: str, format: str, options: dict[str, str]) -> tuple[str, str, str]:
+    """Cache key of an inferred schema, reader options (e.g. csv header) change the schema too."""
+    tag = hashlib.sha1(json.dumps(options, sort_keys=True).encode()).hexdigest()[:12] if options else ""
+    return bucket, format, tag
+
+
+def _schema_cache_file(key: tuple[str, str, str]) -> Path:
+    return _schema_cache_dir() / f"{'.'.join(filter(None, key))}.json"
+
+
+def _cached_schema(key: tuple[str, str, str]) -> Optional[StructType]:
+    """Schema from the in-process cache, or from the schema file of an earlier run."""
+    schema = _schema_cache.get(key)
+    if schema is None:
+        try:
+            schema = StructType.fromJson(json.loads(_schema_cache_file(key).read_text()))
+            _schema_cache[key] = schema
+        except (OSError, ValueError, KeyError):
+            return None
+    return schema
+
+
+def _store_schema(key: tuple[str, str, str], schema: StructType) -> None:
+    _schema_cache[key] = schema
+    cache_file = _schema_cache_file(key)
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        cache_file.write_text(schema.json())
+    except OSError as ex:
+        logger.debug("Could not persist schema cache %s: %s", cache_file, ex)
+
+
+def clear_schema_cache() -> None:
+    """Forget the schemas inferred by read_dates, removing the ones persisted by earlier runs too."""
+    shutil.rmtree(_schema_cache_dir(), ignore_errors=True)
+    _schema_cache.clear()
+
+
+def _schema_sample(format: str, folders: list[str], listings: dict[str, list[dict[str, Any]]]) -> list[str]:
+    """Keys to infer the schema from. Parquet files carry the schema in their footer, the smallest file will do.
+    Other formats are inferred from their rows, which can differ between files (a column only filled on some
+    days), so the smallest file of up to SCHEMA_SAMPLE_FILES date folders spread over the range is read."""
+    smallest = {
+        prefix: min((obj for obj in listings[prefix] if _is_data_file(obj, prefix)), key=lambda obj: obj["Size"])
+        for prefix in folders
+    }
+    if format == "parquet":
+        return [min(smallest.values(), key=lambda obj: obj["Size"])["Key"]]
+    step = math.ceil(len(folders) / SCHEMA_SAMPLE_FILES)
+    return [smallest[prefix]["Key"] for prefix in folders[::step]]
+
+
+def _list_date_objects(bucket: str, dates: list[Union[dt.datetime, dt.date]]) -> dict[str, list[dict[str, Any]]]:
+    """List the objects (key and size) of each date prefix concurrently, keeping the order of the dates."""
+    prefixes = list(dict.fromkeys(make_date_prefix(d) for d in dates))
+    with ThreadPoolExecutor(max_workers=min(16, len(prefixes) or 1)) as pool:
+        listings = pool.map(lambda prefix: list(iter_objects(prefix, bucket)), prefixes)
+        return dict(zip(prefixes, listings))
+
+
+def read_dates(
+    spark: SparkSession,
+    bucket: str,
+    dates: list[Union[dt.datetime, dt.date]],
+    format: str = "parquet",
+    schema: Optional[StructType] = None,
+    options: Optional[dict[str, str]] = None,
+    refresh_schema: bool = False,
+) -> DataFrame:
+    """Read the tfds standard date prefixes of a bucket into one DataFrame.
+    The prefixes are listed concurrently and spark is handed the non-empty date folders rather than every file,
+    one listing call per folder (which returns the sizes) instead of a status call per file on the driver.
+    Date folders must only hold data files of the format, spark itself skips _SUCCESS and other _/. files.
+    Without a schema, it is inferred once and cached per bucket, format and options, in process and under the
+    tfds root, so later runs skip the inference. Parquet schemas come from the smallest file, other formats are inferred
+    from a sample of files spread over the dates, pass a schema when that sample can't be representative."""
+    listings = _list_date_objects(bucket, dates)
+    files_per_folder = {
+        prefix: [obj for obj in objects if _is_data_file(obj, prefix)] for prefix, objects in listings.items()
+    }
+    folders = [prefix for prefix, files in files_per_folder.items() if files]
+    files = [obj for prefix in folders for obj in files_per_folder[prefix]]
+    logger.debug(
+        "Reading %s files (%s bytes) from %s of %s date folders in %s.",
+        len(files),
+        sum(obj["Size"] for obj in files),
+        len(folders),
+        len(listings),
+        bucket,
+    )
+
+    reader = spark.read.format(format).options(**(options or {}))
+    if not folders:
+        if schema is None:
+            raise ValueError(f"No files found in bucket '{bucket}' for the given dates, and no schema to use.")
+        return spark.createDataFrame([], schema)
+
+    schema_key = _schema_key(bucket, format, options or {})
+    if schema is None and not refresh_schema:
+        schema = _cached_schema(schema_key)
+    if schema is None:
+        sample = [f"s3a://{bucket}/{key}" for key in _schema_sample(format, folders, listings)]
+        schema = reader.load(sample[0] if len(sample) == 1 else sample).schema
+        _store_schema(schema_key, schema)
+
+    paths = [f"s3a://{bucket}/{prefix}/" for prefix in folders]
+    return reader.schema(schema).option("recursiveFileLookup", "true").load(paths)
+
+
+COMPACTION_STAGING_PREFIX = "_compaction"
+
+
+def _is_data_file(obj: dict[str, Any], prefix: Optional[str] = None) -> bool:
+    """Skip empty objects and the _SUCCESS/.crc style files spark ignores.
+    With the prefix the object was listed under, files in hidden folders below it (_delta_log, ...) are skipped too."""
+    path = obj["Key"][len(prefix) :] if prefix is not None else obj["Key"].rsplit("/", 1)[-1]
+    return bool(obj["Size"]) and not any(part.startswith(("_", ".")) for part in path.split("/") if part)
+
+
+def _compact_parquet(
+    spark: SparkSession,
+    bucket: str,
+    prefix: str,
+    objects: list[dict[str, Any]],
+    num_files: int,
+    format: str,
+    options: dict[str, str],
+) -> list[dict[str, Any]]:
+    """Rewrite a date folder into num_files files through a staging prefix, then swap them in.
+    The compacted files are copied in next to the originals before the originals are deleted,
+    so readers never see the folder empty (at worst both versions for a moment).
+    A failed copy removes the files copied so far, originals that fail to delete raise."""
+    staging = f"{COMPACTION_STAGING_PREFIX}/{prefix}/"
+    delete_prefix(bucket, staging)
+    reader = spark.read.format(format).options(**options)
+    df = reader.option("recursiveFileLookup", "true").load(f"s3a://{bucket}/{prefix}/")
+    rows = df.count()
+    df.repartition(num_files).write.format(format).options(**options).mode("overwrite").save(
+        f"s3a://{bucket}/{staging}"
+    )
+    staged_rows = spark.read.format(format).options(**options).load(f"s3a://{bucket}/{staging}").count()
+    if staged_rows != rows:
+        delete_prefix(bucket, staging)
+        raise ValueError(f"Compaction of {prefix} wrote {staged_rows} rows, expected {rows}, originals kept.")
+
+    staged = [obj for obj in iter_objects(staging, bucket) if _is_data_file(obj)]
+    original_keys = {obj["Key"] for obj in objects}
+    targets = {obj["Key"]: f"{prefix}/{obj['Key'][len(staging):]}" for obj in staged}
+    if original_keys & set(targets.values()):
+        raise ValueError(f"Compacted file names collide with the originals in {prefix}, originals kept.")
+    s3 = get_s3_client()
+    copied: list[str] = []
+    try:
+        for source, target in targets.items():
+            # Added before the copy, a copy failing halfway may still have written the target.
+            copied.append(target)
+            s3.copy({"Bucket": bucket, "Key": source}, bucket, target)
+    except Exception:
+        delete_keys(bucket, copied)
+        delete_prefix(bucket, staging)
+        raise
+    failed = delete_keys(bucket, [obj["Key"] for obj in objects])["errors"]
+    delete_prefix(bucket, staging)
+    if failed:
+        keys = [error["Key"] for error in failed]
+        raise IOError(f"Compacted {prefix} but could not delete the originals {keys}, the folder holds both.")
+    return [{**obj, "Key": targets[obj["Key"]]} for obj in staged]
+
+
+@contextmanager
+def _session_conf(spark: SparkSession, key: str, value: str) -> Iterator[None]:
+    """Set a session conf for the block, restoring the previous value (or unsetting it) afterwards."""
+    previous = spark.conf.get(key, None)
+    spark.conf.set(key, value)
+    try:
+        yield
+    finally:
+        if previous is None:
+            spark.conf.unset(key)
+        else:
+            spark.conf.set(key, previous)
+
+
+def _compact_delta(spark: SparkSession, bucket: str, prefix: str) -> dict[str, int]:
+    """Bin-pack a Delta table folder with OPTIMIZE, the replaced files stay until VACUUM.
+    The target file size is set on the session by compact_dates."""
+    table = f"delta.`s3a://{bucket}/{prefix}/`"
+    spark.sql(f"OPTIMIZE {table}")
+    detail = spark.sql(f"DESCRIBE DETAIL {table}").collect()[0]
+    return {"files_after": detail["numFiles"], "bytes_after": detail["sizeInBytes"]}
+
+
+def compact_dates(
+    spark: SparkSession,
+    bucket: str,
+    dates: list[Union[dt.datetime, dt.date]],
+    target_file_size: int = 128 * 1024**2,
+    format: str = "parquet",
+    max_workers: int = 4,
+    options: Optional[dict[str, str]] = None,
+) -> list[dict[str, Any]]:
+    """Rewrite the date folders of a bucket into files of about target_file_size bytes.
+    Parquet (or other file format) folders are rewritten through a staging prefix and verified by row count
+    before the compacted files replace the originals. Delta folders are compacted with OPTIMIZE.
+    options are passed to both the reader and the writer, e.g. {"header": "true"} for csv with header rows.
+    Several dates are processed concurrently, returns files and bytes before and after per date."""
+
+    def compact(prefix: str) -> dict[str, Any]:
+        objects = list(iter_objects(prefix + "/", bucket))
+        data = [obj for obj in objects if _is_data_file(obj)]
+        if format == "delta":
+            data = [obj for obj in data if "/_delta_log/" not in obj["Key"]]
+        size = sum(obj["Size"] for obj in data)
+        num_files = max(1, math.ceil(size / target_file_size))
+        report: dict[str, Any] = {"prefix": prefix, "files_before": len(data), "bytes_before": size}
+        if len(data) <= num_files:
+            logger.info("Skipping %s, %s files are already at the target size.", prefix, len(data))
+            return {**report, "files_after": len(data), "bytes_after": size, "skipped": True}
+        if format == "delta":
+            return {**report, **_compact_delta(spark, bucket, prefix), "skipped": False}
+        compacted = _compact_parquet(spark, bucket, prefix, objects, num_files, format, options or {})
+        after = {"files_after": len(compacted), "bytes_after": sum(obj["Size"] for obj in compacted)}
+        logger.info("Compacted %s from %s to %s files.", prefix, len(data), after["files_after"])
+        return {**report, **after, "skipped": False}
+
+    prefixes = list(dict.fromkeys(make_date_prefix(d) for d in dates))
+    if format != "delta":
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(compact, prefixes))
+    # The file size is a session conf, set once around all the concurrent OPTIMIZE calls rather than per date.
+    with _session_conf(spark, "spark.databricks.delta.optimize.maxFileSize", str(target_file_size)):
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(compact, prefixes))
+
+
+def list_delta_tables(spark: SparkSession, databases: Optional[list[str]] = None) -> list[str]:
+    """Qualified names (db.table) of the Delta tables in the catalog, optionally limited to some databases."""
+    return [f"{t['db']}.{t['table']}" for t in list_tables(spark, databases) if t["provider"] == "delta"]
+
+
+def delta_table_stats(spark: SparkSession, table: str) -> dict[str, Any]:
+    """File count and size of the current version of a Delta table."""
+    detail = spark.sql(f"DESCRIBE DETAIL {table}").collect()[0]
+    num_files, size = int(detail["numFiles"]), int(detail["sizeInBytes"])
+    return {
+        "table": table,
+        "num_files": num_files,
+        "size_bytes": size,
+        "avg_file_size": size // num_files if num_files else 0,
+    }
+
+
+def optimize_table(spark: SparkSession, table: str, zorder_by: Optional[list[str]] = None) -> dict[str, Any]:
+    """Bin-pack (and optionally Z-ORDER) a Delta table, returning the stats before and after and the OPTIMIZE metrics."""
+    before = delta_table_stats(spark, table)
+    sql = f"OPTIMIZE {table}"
+    if zorder_by:
+        sql += f" ZORDER BY ({', '.join(zorder_by)})"
+    result = spark.sql(sql).collect()
+    metrics = result[0]["metrics"].asDict() if result else {}
+    after = delta_table_stats(spark, table)
+    logger.info("Optimized %s: %s -> %s files.", table, before["num_files"], after["num_files"])
+    return {"table": table, "before": before, "after": after, "metrics": metrics}
+
+
+def _object_sizes(location: str) -> Optional[dict[str, int]]:
+    """Size per path of the objects under a table location on S3, None for other file systems."""
+    url = urlparse(location)
+    if url.scheme not in ("s3", "s3a"):
+        return None
+    prefix = url.path.strip("/") + "/"
+    return {f"{url.netloc}/{obj['Key']}": obj["Size"] for obj in iter_objects(prefix, url.netloc)}
+
+
+def _bucket_path(path: str) -> str:
+    """bucket/key of an s3 or s3a url, the keys of _object_sizes."""
+    url = urlparse(path)
+    return url.netloc + url.path
+
+
+def vacuum_table(spark: SparkSession, table: str, retention_hours: int = 168) -> dict[str, Any]:
+    """Remove files no longer referenced by a Delta table and older than retention_hours.
+    Delta refuses retentions under 7 days unless its safety check is off, it is switched off for the call
+    (which breaks time travel and concurrent readers older than the retention).
+    VACUUM doesn't change the current version DESCRIBE DETAIL reports on, so the files to delete are taken
+    from a DRY RUN first, their bytes from a listing of the table location (None when it isn't on S3)."""
+    location = spark.sql(f"DESCRIBE DETAIL {table}").collect()[0]["location"]
+    check_key = "spark.databricks.delta.retentionDurationCheck.enabled"
+    previous = spark.conf.get(check_key, "true") or "true"
+    if retention_hours < 168:
+        spark.conf.set(check_key, "false")
+    vacuum = f"VACUUM {table} RETAIN {retention_hours} HOURS"
+    try:
+        deleted = [row["path"] for row in spark.sql(f"{vacuum} DRY RUN").collect()]
+        sizes = _object_sizes(location) if deleted else {}
+        spark.sql(vacuum)
+    finally:
+        spark.conf.set(check_key, previous)
+    reclaimed = None
+    if sizes is not None:
+        reclaimed = sum(sizes.get(_bucket_path(path), 0) for path in deleted)
+    logger.info("Vacuumed %s: %s files, %s bytes.", table, len(deleted), reclaimed)
+    return {"table": table, "files_deleted": len(deleted), "bytes_deleted": reclaimed}
+
+
+def maintain_delta_tables(
+    spark: SparkSession,
+    databases: Optional[list[str]] = None,
+    min_files: int = 50,
+    small_file_size: int = 32 * 1024**2,
+    zorder_by: Optional[dict[str, list[str]]] = None,
+    retention_hours: Optional[int] = 168,
+) -> list[dict[str, Any]]:
+    """Nightly maintenance: OPTIMIZE (Z-ORDER BY zorder_by[table] when given) and VACUUM the Delta tables
+    that have at least min_files files averaging under small_file_size bytes.
+    Delta's DESCRIBE DETAIL has no per-file sizes, the average file size stands in for the small-file count.
+    retention_hours=None skips VACUUM, else the report has the files and bytes it deleted (see vacuum_table).
+    Returns a report per table, untouched tables included."""
+    reports = []
+    for table in list_delta_tables(spark, databases):
+        stats = delta_table_stats(spark, table)
+        if stats["num_files"] < min_files or stats["avg_file_size"] >= small_file_size:
+            reports.append({"table": table, "before": stats, "after": stats, "maintained": False})
+            continue
+        report = optimize_table(spark, table, (zorder_by or {}).get(table))
+        if retention_hours is not None:
+            vacuumed = vacuum_table(spark, table, retention_hours)
+            report.update(files_deleted=vacuumed["files_deleted"], bytes_deleted=vacuumed["bytes_deleted"])
+        reports.append({**report, "maintained": True})
+    return reports
+
+
+_snapshot_tempdir: Optional["tempfile.TemporaryDirectory[str]"] = None
+
+
+def _snapshot_dir() -> "tempfile.TemporaryDirectory[str]":
+    """Private directory for the config snapshot files, removed with its secrets when the driver exits.
+    The files can't be deleted right after addFile, executors fetch them from the driver when they first need them."""
+    global _snapshot_tempdir
+    with _sessions_lock:
+        if _snapshot_tempdir is None:
+            _snapshot_tempdir = tempfile.TemporaryDirectory(prefix=f"{SNAPSHOT_FILE_PREFIX}-")
+        return _snapshot_tempdir
+
+
+def broadcast_configs(
+    spark: SparkSession, names: list[str], ship_file: bool = True
+) -> Broadcast[dict[str, dict[str, Any]]]:
+    """Fetch configs once on the driver and make them available to executor code without config server calls.
+    With ship_file the configs are also shipped as a SparkFiles snapshot, which get_config on executors picks up
+    by itself. Otherwise call use_broadcast_configs(broadcast) in the task before get_config.
+    Note the configs (secrets included) end up on every executor, as they would with per-task get_config calls."""
+    configs = {strip_yaml(name): get_config(name) for name in names}
+    broadcast = spark.sparkContext.broadcast(configs)
+    if ship_file:
+        # addFile refuses a second file of the same name, each snapshot gets its own.
+        fd, path = tempfile.mkstemp(prefix=f"{SNAPSHOT_FILE_PREFIX}-", suffix=".json", dir=_snapshot_dir().name)
+        with os.fdopen(fd, "w") as f:
+            json.dump(configs, f)
+        spark.sparkContext.addFile(path)
+    return broadcast
+
+
+def use_broadcast_configs(broadcast: Broadcast[dict[str, dict[str, Any]]]) -> None:
+    """Executor side: serve get_config from a broadcast made with broadcast_configs."""
+    set_config_snapshot(broadcast.value)
+
+
+_STAGE_FIELDS = {
+    "executorRunTime": "executor_run_time_ms",
+    "inputBytes": "input_bytes",
+    "outputBytes": "output_bytes",
+    "shuffleReadBytes": "shuffle_read_bytes",
+    "shuffleWriteBytes": "shuffle_write_bytes",
+    "memoryBytesSpilled": "memory_spilled_bytes",
+    "diskBytesSpilled": "disk_spilled_bytes",
+    "numTasks": "num_tasks",
+    "numFailedTasks": "failed_tasks",
+}
+
+
+def _rest_time(value: Optional[str]) -> Optional[float]:
+    """Parse a spark REST timestamp like 2024-05-25T12:00:00.000GMT to epoch seconds."""
+    if not value:
+        return None
+    return dt.datetime.strptime(value.replace("GMT", "+0000"), "%Y-%m-%dT%H:%M:%S.%f%z").timestamp()
+
+
+def _rest_stage_metrics(base_url: str, stage: dict[str, Any]) -> dict[str, Any]:
+    """Metrics of one stage attempt from the REST API, including the task time spread as a skew indicator."""
+    metrics: dict[str, Any] = {
+        "stage_id": stage["stageId"],
+        "attempt_id": stage.get("attemptId", 0),
+        "name": stage.get("name"),
+        "status": stage.get("status"),
+        **{name: stage.get(field, 0) for field, name in _STAGE_FIELDS.items()},
+    }
+    start, end = _rest_time(stage.get("submissionTime")), _rest_time(stage.get("completionTime"))
+    metrics["duration_ms"] = int((end - start) * 1000) if start and end else None
+    summary_url = f"{base_url}/stages/{stage['stageId']}/{metrics['attempt_id']}/taskSummary?quantiles=0.5,1.0"
+    response = requests.get(summary_url, timeout=5)
+    if response.ok:
+        median, longest = response.json().get("executorRunTime", [0, 0])
+        metrics.update(task_time_median_ms=median, task_time_max_ms=longest, skew=longest / median if median else None)
+    return metrics
+
+
+def _collect_rest(spark: SparkSession, job_group: str) -> list[dict[str, Any]]:
+    sc = spark.sparkContext
+    base_url = f"{sc.uiWebUrl}/api/v1/applications/{sc.applicationId}"
+    jobs = requests.get(f"{base_url}/jobs", timeout=5)
+    jobs.raise_for_status()
+    stage_ids = sorted({sid for job in jobs.json() if job.get("jobGroup") == job_group for sid in job["stageIds"]})
+    stages: list[dict[str, Any]] = []
+    for stage_id in stage_ids:
+        response = requests.get(f"{base_url}/stages/{stage_id}", timeout=5)
+        if response.status_code == 404:  # skipped stages (reused shuffle output) are never run
+            continue
+        response.raise_for_status()
+        stages.extend(_rest_stage_metrics(base_url, attempt) for attempt in response.json())
+    return stages
+
+
+def _collect_status_tracker(spark: SparkSession, job_group: str) -> list[dict[str, Any]]:
+    """Task counts only, for sessions without UI (and REST API)."""
+    tracker = spark.sparkContext.statusTracker()
+    stages = []
+    for job_id in tracker.getJobIdsForGroup(job_group):
+        job = tracker.getJobInfo(job_id)
+        for stage_id in job.stageIds if job else []:
+            info = tracker.getStageInfo(stage_id)
+            if info:
+                stages.append(
+                    {
+                        "stage_id": info.stageId,
+                        "attempt_id": info.currentAttemptId,
+                        "name": info.name,
+                        "num_tasks": info.numTasks,
+                        "failed_tasks": info.numFailedTasks,
+                    }
+                )
+    return stages
+
+
+def collect_job_metrics(spark: SparkSession, job_group: str) -> dict[str, Any]:
+    """Stage and task metrics of the jobs run under a job group (see track_metrics).
+    Uses the REST API of the session's UI (duration, shuffle, spill, input/output bytes, task time skew)
+    and falls back to the status tracker, which only knows task counts, when the UI is disabled."""
+    stages: list[dict[str, Any]] = []
+    source = "status_tracker"
+    if spark.sparkContext.uiWebUrl:
+        try:
+            stages = _collect_rest(spark, job_group)
+            source = "rest"
+        except requests.exceptions.RequestException as ex:
+            logger.warning("Spark REST API not reachable, falling back to the status tracker: %s", ex)
+    if source == "status_tracker":
+        stages = _collect_status_tracker(spark, job_group)
+    totals = {name: sum(stage.get(name) or 0 for stage in stages) for name in _STAGE_FIELDS.values()}
+    skews = [stage["skew"] for stage in stages if stage.get("skew")]
+    return {
+        "job_group": job_group,
+        "source": source,
+        "stages": stages,
+        "totals": totals,
+        "max_skew": max(skews) if skews else None,
+    }
+
+
+@contextmanager
+def track_metrics(
+    spark: SparkSession, label: Optional[str] = None, output_path: Optional[Union[str, Path]] = None
+) -> Iterator[dict[str, Any]]:
+    """Record the spark metrics of the jobs run in a block:
+
+        with track_metrics(spark, "daily_load") as metrics:
+            df.write...
+        print(metrics["totals"]["shuffle_write_bytes"])
+
+    The yielded dict is filled when the block exits, output_path additionally gets it as JSON."""
+    sc = spark.sparkContext
+    job_group = f"tfds-{label or 'metrics'}-{uuid.uuid4().hex[:8]}"
+    previous_group = sc.getLocalProperty("spark.jobGroup.id")
+    previous_description = sc.getLocalProperty("spark.job.description")
+    metrics: dict[str, Any] = {"label": label}
+    sc.setJobGroup(job_group, label or job_group)
+    start = time.perf_counter()
+    try:
+        yield metrics
+    finally:
+        wall_time = time.perf_counter() - start
+        if previous_group:
+            sc.setJobGroup(previous_group, previous_description or previous_group)
+        else:
+            # None removes the property (Java null), the pyspark stubs only allow str.
+            sc.setLocalProperty("spark.jobGroup.id", None)  # type: ignore[arg-type]
+            sc.setLocalProperty("spark.job.description", None)  # type: ignore[arg-type]
+        metrics.update(collect_job_metrics(spark, job_group), wall_time_s=round(wall_time, 3))
+        if output_path:
+            Path(output_path).write_text(json.dumps(metrics, indent=2, default=str))
@@ -1,3 +1,57 @@
-from .utils import date_range, parse_execution_date, setup_logging
+"""Small shared helpers."""
 
-__all__ = ["date_range", "parse_execution_date", "setup_logging"]
+from typing import TYPE_CHECKING
+
+from tfdslib._lazy import attach
+
+if TYPE_CHECKING:
+    from .stats import (
+        add_stats_hook,
+        enable_stats,
+        export_to_opentelemetry,
+        export_to_prometheus,
+        get_stats,
+        instrumented,
+        record_bytes,
+        record_cache,
+        remove_stats_hook,
+        reset_stats,
+        stats_enabled,
+    )
+    from .utils import date_range, parse_execution_date, setup_logging
+
+_exports = {
+    "utils": ["date_range", "parse_execution_date", "setup_logging"],
+    "stats": [
+        "add_stats_hook",
+        "enable_stats",
+        "export_to_opentelemetry",
+        "export_to_prometheus",
+        "get_stats",
+        "instrumented",
+        "record_bytes",
+        "record_cache",
+        "remove_stats_hook",
+        "reset_stats",
+        "stats_enabled",
+    ],
+}
+
+__all__ = [
+    "date_range",
+    "parse_execution_date",
+    "setup_logging",
+    "add_stats_hook",
+    "enable_stats",
+    "export_to_opentelemetry",
+    "export_to_prometheus",
+    "get_stats",
+    "instrumented",
+    "record_bytes",
+    "record_cache",
+    "remove_stats_hook",
+    "reset_stats",
+    "stats_enabled",
+]
+
+__getattr__, __dir__ = attach(__name__, _exports)
@@ -0,0 +1,198 @@
+"""Call statistics for the tfdslib config and S3 functions.
+Collection is off by default (or set TFDS_STATS=1), an instrumented function then costs one flag check per call.
+When on, every call records its count, errors and a latency histogram, and functions can add transferred
+bytes and cache hits. Hooks receive every event, to forward them to Prometheus or OpenTelemetry."""
+
+import bisect
+import functools
+import os
+import threading
+import time
+from typing import Any, Callable, Optional, ParamSpec, TypeVar
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+# Upper bounds (seconds) of the latency histogram buckets, the last bucket takes everything slower.
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0)
+
+StatsHook = Callable[[str, str, float], None]
+
+_enabled = os.environ.get("TFDS_STATS", "") not in ("", "0")
+_stats: dict[str, dict[str, Any]] = {}
+_hooks: list[StatsHook] = []
+_lock = threading.Lock()
+
+
+def enable_stats(enabled: bool = True) -> None:
+    """Turn statistics collection on or off."""
+    global _enabled
+    _enabled = enabled
+
+
+def stats_enabled() -> bool:
+    return _enabled
+
+
+def _entry(name: str) -> dict[str, Any]:
+    entry = _stats.get(name)
+    if entry is None:
+        entry = {
+            "count": 0,
+            "errors": 0,
+            "seconds": 0.0,
+            "max_seconds": 0.0,
+            "histogram": [0] * (len(LATENCY_BUCKETS) + 1),
+            "bytes": 0,
+            "cache_hits": 0,
+            "cache_misses": 0,
+        }
+        _stats[name] = entry
+    return entry
+
+
+def _emit(event: str, name: str, value: float) -> None:
+    for hook in _hooks:
+        hook(event, name, value)
+
+
+def record_call(name: str, seconds: float, error: bool = False) -> None:
+    """Record one call of name taking seconds."""
+    if not _enabled:
+        return
+    with _lock:
+        entry = _entry(name)
+        entry["count"] += 1
+        entry["errors"] += error
+        entry["seconds"] += seconds
+        entry["max_seconds"] = max(entry["max_seconds"], seconds)
+        entry["histogram"][bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+    _emit("error" if error else "call", name, seconds)
+
+
+def record_bytes(name: str, nbytes: int) -> None:
+    """Add bytes transferred by name."""
+    if not _enabled:
+        return
+    with _lock:
+        _entry(name)["bytes"] += nbytes
+    _emit("bytes", name, nbytes)
+
+
+def record_cache(name: str, hit: bool) -> None:
+    """Record a cache hit or miss for name."""
+    if not _enabled:
+        return
+    with _lock:
+        _entry(name)["cache_hits" if hit else "cache_misses"] += 1
+    _emit("cache_hit" if hit else "cache_miss", name, 1)
+
+
+def instrumented(name: Optional[str] = None) -> Callable[[Callable[P, R]], Callable[P, R]]:
+    """Decorator recording the calls of a function, named like s3.put_file unless a name is given."""
+
+    def decorator(func: Callable[P, R]) -> Callable[P, R]:
+        stat_name = name or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+
+        @functools.wraps(func)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+            if not _enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except BaseException:
+                record_call(stat_name, time.perf_counter() - start, error=True)
+                raise
+            record_call(stat_name, time.perf_counter() - start)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def get_stats() -> dict[str, dict[str, Any]]:
+    """Statistics per function: count, errors, seconds (total, mean, max), a latency histogram keyed by the
+    bucket upper bound ('+Inf' for the last), bytes and cache hits/misses."""
+    with _lock:
+        stats = {}
+        for name, entry in sorted(_stats.items()):
+            stats[name] = {
+                **entry,
+                "mean_seconds": entry["seconds"] / entry["count"] if entry["count"] else 0.0,
+                "histogram": dict(zip([*map(str, LATENCY_BUCKETS), "+Inf"], entry["histogram"])),
+            }
+        return stats
+
+
+def reset_stats() -> None:
+    """Drop all collected statistics."""
+    with _lock:
+        _stats.clear()
+
+
+def add_stats_hook(hook: StatsHook) -> None:
+    """Call hook(event, name, value) for every recorded event, event being call, error, bytes, cache_hit or
+    cache_miss. value is the call duration in seconds, the number of bytes, or 1 for cache events."""
+    _hooks.append(hook)
+
+
+def remove_stats_hook(hook: StatsHook) -> None:
+    if hook in _hooks:
+        _hooks.remove(hook)
+
+
+def export_to_prometheus(registry: Any = None) -> StatsHook:
+    """Forward the statistics to prometheus_client metrics (in the given or the default registry).
+    Returns the hook, pass it to remove_stats_hook to stop. Needs prometheus_client installed."""
+    import prometheus_client
+
+    kwargs = {"registry": registry} if registry is not None else {}
+    seconds = prometheus_client.Histogram(
+        "tfds_call_seconds", "Duration of tfdslib calls.", ["function"], buckets=LATENCY_BUCKETS, **kwargs
+    )
+    errors = prometheus_client.Counter("tfds_call_errors", "Failed tfdslib calls.", ["function"], **kwargs)
+    nbytes = prometheus_client.Counter("tfds_bytes", "Bytes transferred by tfdslib calls.", ["function"], **kwargs)
+    cache = prometheus_client.Counter("tfds_cache", "tfdslib cache lookups.", ["function", "result"], **kwargs)
+
+    def hook(event: str, name: str, value: float) -> None:
+        if event in ("call", "error"):
+            seconds.labels(name).observe(value)
+            if event == "error":
+                errors.labels(name).inc()
+        elif event == "bytes":
+            nbytes.labels(name).inc(value)
+        else:
+            cache.labels(name, "hit" if event == "cache_hit" else "miss").inc()
+
+    add_stats_hook(hook)
+    return hook
+
+
+def export_to_opentelemetry(meter: Any = None) -> StatsHook:
+    """Forward the statistics to OpenTelemetry instruments on the given meter (by default the global meter
+    provider's 'tfdslib' meter). Returns the hook, pass it to remove_stats_hook to stop.
+    Needs opentelemetry-api installed."""
+    if meter is None:
+        from opentelemetry import metrics
+
+        meter = metrics.get_meter("tfdslib")
+    duration = meter.create_histogram("tfds.call.duration", unit="s", description="Duration of tfdslib calls.")
+    errors = meter.create_counter("tfds.call.errors", description="Failed tfdslib calls.")
+    nbytes = meter.create_counter("tfds.bytes", unit="By", description="Bytes transferred by tfdslib calls.")
+    cache = meter.create_counter("tfds.cache", description="tfdslib cache lookups.")
+
+    def hook(event: str, name: str, value: float) -> None:
+        attributes = {"function": name}
+        if event in ("call", "error"):
+            duration.record(value, attributes)
+            if event == "error":
+                errors.add(1, attributes)
+        elif event == "bytes":
+            nbytes.add(int(value), attributes)
+        else:
+            cache.add(1, {**attributes, "result": "hit" if event == "cache_hit" else "miss"})
+
+    add_stats_hook(hook)
+    return hook
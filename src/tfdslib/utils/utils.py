@@ -1,6 +1,10 @@
+import atexit
 import datetime as dt
+import json
 import logging
+import queue
 import sys
+from logging.handlers import QueueHandler, QueueListener
 from typing import Optional, Union
 
 
@@ -21,19 +25,72 @@ def date_range(execution_date: Union[str, dt.datetime, dt.date], length: int) ->
     return [start_date - dt.timedelta(days=i) for i in reversed(range(length))]
 
 
+class JsonFormatter(logging.Formatter):
+    """Format log records as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record, self.datefmt),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """Queue records with only the message merged, so the formatting (time, exception text, JSON) and the
+    write happen on the listener thread instead of the caller's."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The %-merge stays on the caller: args can be mutated (or not be thread safe) by the time the
+        # listener gets to the record, so it costs a str() of the args per call to log what was passed.
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class _LogListener(QueueListener):
+    """QueueListener that can be stopped more than once, it is stopped at exit as well."""
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            super().stop()
+
+
 def setup_logging(
     tfds_package_names: list[str] = ["tfdslib", "tfds"],
     current_module: Optional[str] = None,
     tfds_level: int = logging.DEBUG,
     global_level: int = logging.WARNING,
-) -> None:
+    use_queue: bool = False,
+    json_format: bool = False,
+) -> Optional[QueueListener]:
+    """Log to stdout, tfds packages at tfds_level and everything else at global_level.
+    With use_queue, log calls only put the record on a queue and a background listener formats and writes it,
+    so logging in tight loops doesn't wait on stdout. The listener is returned (and stopped at exit).
+    json_format writes one JSON object per line instead of plain text."""
     root_logger = logging.getLogger()
 
     handler = logging.StreamHandler(sys.stdout)
-    formatter = logging.Formatter(fmt="[%(asctime)s] %(levelname)s %(name)s: %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
+    datefmt = "%Y-%m-%d %H:%M:%S"
+    if json_format:
+        formatter: logging.Formatter = JsonFormatter(datefmt=datefmt)
+    else:
+        formatter = logging.Formatter(fmt="[%(asctime)s] %(levelname)s %(name)s: %(message)s", datefmt=datefmt)
     handler.setFormatter(formatter)
+    listener = None
     if not root_logger.handlers:
-        root_logger.addHandler(handler)
+        if use_queue:
+            log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+            listener = _LogListener(log_queue, handler)
+            listener.start()
+            atexit.register(listener.stop)
+            root_logger.addHandler(_DeferredQueueHandler(log_queue))
+        else:
+            root_logger.addHandler(handler)
 
     # other packages
     root_logger.setLevel(global_level)  # Third-party default: only warn and up
@@ -46,3 +103,4 @@ def setup_logging(
     for pkg in pkg_lst:
         package_logger = logging.getLogger(pkg)
         package_logger.setLevel(tfds_level)
+    return listener
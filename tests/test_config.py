@@ -1,7 +1,11 @@
-from unittest.mock import patch
+import json
+import subprocess
+import sys
+from unittest.mock import MagicMock, patch
 
 import pytest
 
+from tfdslib.config import config
 from tfdslib.config.config import get_config
 
 
@@ -41,3 +45,108 @@ def test_get_config_raises_on_none():
 def test_get_config_raises_on_empty():
     with pytest.raises(ValueError, match="A config_name must be provided."):
         get_config("")
+
+
+@pytest.fixture
+def clear_snapshot():
+    config.clear_config_snapshot()
+    yield
+    config.clear_config_snapshot()
+
+
+def test_get_config_from_snapshot(clear_snapshot):
+    config.set_config_snapshot({"s3.yaml": {"url": "http://minio"}})
+    with patch("tfdslib.config.config.is_api_avaiable") as is_api_avaiable:
+        result = get_config("s3")
+        result["url"] = "changed"
+        assert get_config("s3") == {"url": "http://minio"}
+    is_api_avaiable.assert_not_called()
+
+
+def test_get_config_snapshot_miss_falls_back(clear_snapshot, mock_file_config):
+    config.set_config_snapshot({"s3": {"url": "http://minio"}})
+    with (
+        patch("tfdslib.config.config.is_api_avaiable", return_value=False),
+        patch("tfdslib.config.config.get_config_from_file", return_value=mock_file_config),
+    ):
+        assert get_config("other") == mock_file_config
+
+
+def test_get_config_loads_spark_files_snapshot_on_executor(clear_snapshot, tmp_path, monkeypatch):
+    (tmp_path / f"{config.SNAPSHOT_FILE_PREFIX}-abc.json").write_text(json.dumps({"s3": {"url": "http://minio"}}))
+    spark_files = MagicMock()
+    spark_files.getRootDirectory.return_value = str(tmp_path)
+    monkeypatch.setitem(sys.modules, "pyspark", MagicMock(SparkFiles=spark_files))
+    monkeypatch.setattr("tfdslib.config.config._on_spark_executor", lambda: True)
+    with patch("tfdslib.config.config.is_api_avaiable") as is_api_avaiable:
+        assert get_config("s3") == {"url": "http://minio"}
+        assert get_config("s3") == {"url": "http://minio"}
+    is_api_avaiable.assert_not_called()
+    spark_files.getRootDirectory.assert_called_once()
+
+
+def test_get_config_loads_later_spark_files_snapshots(clear_snapshot, tmp_path, monkeypatch):
+    (tmp_path / f"{config.SNAPSHOT_FILE_PREFIX}-abc.json").write_text(json.dumps({"s3": {"url": "http://minio"}}))
+    spark_files = MagicMock()
+    spark_files.getRootDirectory.return_value = str(tmp_path)
+    monkeypatch.setitem(sys.modules, "pyspark", MagicMock(SparkFiles=spark_files))
+    monkeypatch.setattr("tfdslib.config.config._on_spark_executor", lambda: True)
+    assert get_config("s3") == {"url": "http://minio"}
+    # A later broadcast_configs ships another file to the same executor.
+    (tmp_path / f"{config.SNAPSHOT_FILE_PREFIX}-def.json").write_text(json.dumps({"spark": {"profile": "etl"}}))
+    with patch("tfdslib.config.config.is_api_avaiable") as is_api_avaiable:
+        assert get_config("spark") == {"profile": "etl"}
+    is_api_avaiable.assert_not_called()
+
+
+def test_on_spark_executor_without_pyspark(monkeypatch):
+    monkeypatch.delitem(sys.modules, "pyspark", raising=False)
+    assert not config._on_spark_executor()
+
+
+# Budget for the cumulative import time of tfdslib.config, measured with python -X importtime.
+IMPORT_BUDGET_US = 50_000
+
+
+def _import_times(statement):
+    """Cumulative import time in microseconds per module, for a fresh interpreter running the statement."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement], capture_output=True, text=True, check=True
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, module = line.split("|")
+            if cumulative.strip().isdigit():
+                times[module.strip()] = int(cumulative)
+    return times
+
+
+def _loaded_modules(statement):
+    """Modules loaded by a fresh interpreter running the statement."""
+    code = f"import sys, json; {statement}; print(json.dumps(sorted(sys.modules)))"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return set(json.loads(result.stdout))
+
+
+def test_import_config_within_budget():
+    assert _import_times("import tfdslib.config")["tfdslib.config"] < IMPORT_BUDGET_US
+
+
+def test_import_is_lazy():
+    assert not {"requests", "boto3", "botocore", "yaml"} & _loaded_modules("import tfdslib.config, tfdslib.s3")
+
+
+def test_lazy_exports():
+    import tfdslib.config
+
+    assert {"get_config", "set_config_snapshot"} <= set(dir(tfdslib.config))
+    assert tfdslib.config.config.__name__ == "tfdslib.config.config"
+    with pytest.raises(AttributeError, match="no attribute 'missing'"):
+        tfdslib.config.missing
+
+
+def test_first_use_skips_requests():
+    modules = _loaded_modules("import tfdslib.config; tfdslib.config.get_config")
+    assert "tfdslib.config.config" in modules
+    assert "requests" not in modules
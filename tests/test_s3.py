@@ -1,14 +1,28 @@
 import datetime as dt
+import gzip
+import hashlib
+import io
+import os
+import threading
+import time
 from unittest.mock import MagicMock
 
 import pytest
 from botocore.exceptions import ClientError
 
 import tfdslib.s3 as s3_mod
+from tfdslib.utils import enable_stats, get_stats, reset_stats
 
 MOCK_CONFIG = {"access_key": "ak", "secret_key": "sk", "url": "http://localhost"}
 
 
+@pytest.fixture(autouse=True)
+def clear_s3_clients():
+    s3_mod.clear_s3_clients()
+    yield
+    s3_mod.clear_s3_clients()
+
+
 @pytest.fixture
 def mock_s3_client():
     return MagicMock()
@@ -22,6 +36,17 @@ def test_get_s3_client_success(monkeypatch):
     assert result == mock_client
 
 
+def test_get_s3_client_is_reused(monkeypatch):
+    create = MagicMock(side_effect=lambda *a, **k: MagicMock())
+    monkeypatch.setattr("tfdslib.s3.s3.get_config", lambda *_: MOCK_CONFIG)
+    monkeypatch.setattr("boto3.client", create)
+    assert s3_mod.get_s3_client() is s3_mod.get_s3_client()
+    assert create.call_count == 1
+    monkeypatch.setattr("tfdslib.s3.s3.get_config", lambda *_: {**MOCK_CONFIG, "secret_key": "rotated"})
+    s3_mod.get_s3_client()
+    assert create.call_count == 2
+
+
 def test_get_s3_client_no_config(monkeypatch):
     monkeypatch.setattr("tfdslib.s3.s3.get_config", lambda *_: None)
     with pytest.raises(ValueError):
@@ -38,15 +63,66 @@ def test_get_s3_client_no_url(monkeypatch):
 
 def test_is_s3_service_available_true(monkeypatch, mock_s3_client):
     mock_s3_client.list_buckets.return_value = {}
-    monkeypatch.setattr("tfdslib.s3.s3.get_s3_client", lambda: mock_s3_client)
+    monkeypatch.setattr("tfdslib.s3.s3._get_probe_client", lambda: mock_s3_client)
     assert s3_mod.is_s3_service_available()
 
 
 def test_is_s3_service_available_false(monkeypatch):
-    monkeypatch.setattr("tfdslib.s3.s3.get_s3_client", lambda: (_ for _ in ()).throw(Exception("fail")))
+    monkeypatch.setattr("tfdslib.s3.s3._get_probe_client", lambda: (_ for _ in ()).throw(Exception("fail")))
     assert not s3_mod.is_s3_service_available()
 
 
+def test_is_s3_service_available_is_cached(monkeypatch, mock_s3_client):
+    monkeypatch.setattr("tfdslib.s3.s3._get_probe_client", lambda: mock_s3_client)
+    assert s3_mod.is_s3_service_available()
+    mock_s3_client.list_buckets.side_effect = Exception("down")
+    assert s3_mod.is_s3_service_available()
+    assert mock_s3_client.list_buckets.call_count == 1
+    assert not s3_mod.is_s3_service_available(max_age=0)
+    health = s3_mod.get_s3_health()
+    assert health["error"] == "down"
+    assert health["age"] >= 0
+
+
+def test_probe_client_fails_fast(monkeypatch):
+    configs = []
+    monkeypatch.setattr("tfdslib.s3.s3.get_config", lambda *_: MOCK_CONFIG)
+    monkeypatch.setattr("boto3.client", lambda *a, **k: configs.append(k["config"]) or MagicMock())
+    s3_mod.s3._get_probe_client()
+    assert configs[0].connect_timeout == s3_mod.s3.HEALTH_PROBE_TIMEOUT
+    assert configs[0].retries == {"total_max_attempts": 1}
+    assert s3_mod.s3._get_probe_client() is not s3_mod.get_s3_client()
+
+
+def test_wait_for_s3(monkeypatch, mock_s3_client):
+    mock_s3_client.list_buckets.side_effect = [Exception("starting"), Exception("starting"), {}]
+    monkeypatch.setattr("tfdslib.s3.s3._get_probe_client", lambda: mock_s3_client)
+    assert s3_mod.wait_for_s3(timeout=5, interval=0.01)
+    assert mock_s3_client.list_buckets.call_count == 3
+
+
+def test_wait_for_s3_timeout(monkeypatch, mock_s3_client):
+    mock_s3_client.list_buckets.side_effect = Exception("down")
+    monkeypatch.setattr("tfdslib.s3.s3._get_probe_client", lambda: mock_s3_client)
+    assert not s3_mod.wait_for_s3(timeout=0.05, interval=0.01)
+
+
+def test_health_monitor_refreshes(monkeypatch, mock_s3_client):
+    probed = threading.Event()
+    mock_s3_client.list_buckets.side_effect = lambda: probed.set() or {}
+    monkeypatch.setattr("tfdslib.s3.s3._get_probe_client", lambda: mock_s3_client)
+    s3_mod.start_s3_health_monitor(interval=0.01)
+    try:
+        assert probed.wait(5)
+        assert s3_mod.is_s3_service_available()
+    finally:
+        s3_mod.stop_s3_health_monitor()
+    calls = mock_s3_client.list_buckets.call_count
+    assert calls >= 1
+    time.sleep(0.05)
+    assert mock_s3_client.list_buckets.call_count == calls
+
+
 def test_bucket_exists_true(monkeypatch, mock_s3_client):
     mock_s3_client.list_buckets.return_value = {"Buckets": [{"Name": "bucket1"}]}
     monkeypatch.setattr("tfdslib.s3.s3.get_s3_client", lambda: mock_s3_client)
@@ -170,3 +246,442 @@ def test_list_files_for_dates(monkeypatch):
         "s3a://mybucket/prefix/2024-05-26/file2.txt",
     ]
     assert result == expected
+
+
+def _listing(key, size, last_modified, etag="x"):
+    return {"Key": key, "Size": size, "LastModified": last_modified, "ETag": f'"{etag}"'}
+
+
+def test_compute_etag_single_and_multipart(tmp_path):
+    path = tmp_path / "data.bin"
+    path.write_bytes(b"a" * 10)
+    assert s3_mod.compute_etag(path) == hashlib.md5(b"a" * 10).hexdigest()
+    parts = [hashlib.md5(b"a" * 4).digest(), hashlib.md5(b"a" * 4).digest(), hashlib.md5(b"a" * 2).digest()]
+    assert s3_mod.compute_etag(path, part_size=4) == hashlib.md5(b"".join(parts)).hexdigest() + "-3"
+
+
+def test_sync_to_s3_uploads_only_changed(monkeypatch, mock_s3_client, tmp_path):
+    (tmp_path / "same.txt").write_bytes(b"12345")
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "new.txt").write_bytes(b"abc")
+    (tmp_path / "resized.txt").write_bytes(b"123")
+    future = dt.datetime.now(dt.timezone.utc) + dt.timedelta(days=1)
+    listing = [
+        _listing("pre/same.txt", 5, future),
+        _listing("pre/resized.txt", 99, future),
+        _listing("pre/extra.txt", 1, future),
+    ]
+    monkeypatch.setattr("tfdslib.s3.s3.get_s3_client", lambda: mock_s3_client)
+    monkeypatch.setattr("tfdslib.s3.s3.iter_objects", lambda prefix, bucket: iter(listing))
+
+    plan = s3_mod.sync_to_s3(tmp_path, "bucket", "pre", delete=True)
+
+    assert sorted(plan["uploaded"]) == ["pre/resized.txt", "pre/sub/new.txt"]
+    assert plan["deleted"] == ["pre/extra.txt"]
+    assert plan["unchanged"] == 1
+    assert plan["bytes"] == 6
+    assert plan["errors"] == []
+    assert mock_s3_client.upload_file.call_count == 2
+    mock_s3_client.delete_objects.assert_called_once_with(
+        Bucket="bucket", Delete={"Objects": [{"Key": "pre/extra.txt"}], "Quiet": True}
+    )
+
+
+def test_delete_keys_reports_failures(monkeypatch, mock_s3_client):
+    failure = {"Key": "b", "Code": "AccessDenied"}
+    mock_s3_client.delete_objects.return_value = {"Errors": [failure]}
+    monkeypatch.setattr("tfdslib.s3.s3.get_s3_client", lambda: mock_s3_client)
+    monkeypatch.setattr("tfdslib.s3.s3.time.sleep", lambda _: None)
+    result = s3_mod.delete_keys("bucket", ["a", "b"], max_retries=1)
+    assert result == {"files": 1, "errors": [failure]}
+    assert mock_s3_client.delete_objects.call_args_list[1].kwargs["Delete"]["Objects"] == [{"Key": "b"}]
+
+
+def test_sync_to_s3_dry_run(monkeypatch, mock_s3_client, tmp_path):
+    (tmp_path / "a.txt").write_bytes(b"abcd")
+    monkeypatch.setattr("tfdslib.s3.s3.get_s3_client", lambda: mock_s3_client)
+    monkeypatch.setattr("tfdslib.s3.s3.iter_objects", lambda prefix, bucket: iter([]))
+    plan = s3_mod.sync_to_s3(tmp_path, "bucket", "pre", dry_run=True)
+    assert plan["uploaded"] == ["pre/a.txt"]
+    assert plan["bytes"] == 4
+    mock_s3_client.upload_file.assert_not_called()
+
+
+def test_sync_to_s3_checksum(monkeypatch, mock_s3_client, tmp_path):
+    (tmp_path / "same.txt").write_bytes(b"same")
+    (tmp_path / "changed.txt").write_bytes(b"new!")
+    past = dt.datetime(2000, 1, 1, tzinfo=dt.timezone.utc)
+    listing = [
+        _listing("same.txt", 4, past, hashlib.md5(b"same").hexdigest()),
+        _listing("changed.txt", 4, past, hashlib.md5(b"old!").hexdigest()),
+    ]
+    monkeypatch.setattr("tfdslib.s3.s3.get_s3_client", lambda: mock_s3_client)
+    monkeypatch.setattr("tfdslib.s3.s3.iter_objects", lambda prefix, bucket: iter(listing))
+    plan = s3_mod.sync_to_s3(tmp_path, "bucket", compare="checksum")
+    assert plan["uploaded"] == ["changed.txt"]
+
+
+def test_sync_to_s3_invalid_compare(tmp_path):
+    with pytest.raises(ValueError):
+        s3_mod.sync_to_s3(tmp_path, "bucket", compare="bogus")
+
+
+def test_sync_from_s3_downloads_and_sets_mtime(monkeypatch, mock_s3_client, tmp_path):
+    (tmp_path / "local_only.txt").write_bytes(b"x")
+    modified = dt.datetime(2024, 5, 25, tzinfo=dt.timezone.utc)
+    listing = [_listing("pre/dir/", 0, modified), _listing("pre/dir/file.txt", 3, modified)]
+    monkeypatch.setattr("tfdslib.s3.s3.get_s3_client", lambda: mock_s3_client)
+    monkeypatch.setattr("tfdslib.s3.s3.iter_objects", lambda prefix, bucket: iter(listing))
+    mock_s3_client.download_file.side_effect = lambda bucket, key, path: open(path, "wb").write(b"abc")
+
+    plan = s3_mod.sync_from_s3(tmp_path, "bucket", "pre/", delete=True)
+
+    assert plan["downloaded"] == ["pre/dir/file.txt"]
+    assert plan["bytes"] == 3
+    assert not (tmp_path / "local_only.txt").exists()
+    assert (tmp_path / "dir" / "file.txt").stat().st_mtime == modified.timestamp()
+
+
+def test_put_bytes_small_single_put(monkeypatch, mock_s3_client):
+    monkeypatch.setattr("tfdslib.s3.s3.get_s3_client", lambda: mock_s3_client)
+    assert s3_mod.put_bytes(b"hello", "bucket", "file.txt", prefix="pre/")
+    mock_s3_client.put_object.assert_called_once_with(Bucket="bucket", Key="pre/file.txt", Body=b"hello")
+    mock_s3_client.create_multipart_upload.assert_not_called()
+
+
+def test_put_bytes_multipart(monkeypatch, mock_s3_client):
+    mock_s3_client.create_multipart_upload.return_value = {"UploadId": "up1"}
+    mock_s3_client.upload_part.side_effect = lambda **kw: {"ETag": f"e{kw['PartNumber']}"}
+    monkeypatch.setattr("tfdslib.s3.s3.get_s3_client", lambda: mock_s3_client)
+    assert s3_mod.put_bytes(memoryview(b"abcdefghij"), "bucket", "file.bin", part_size=4)
+    bodies = [c.kwargs["Body"] for c in mock_s3_client.upload_part.call_args_list]
+    assert bodies == [b"abcd", b"efgh", b"ij"]
+    mock_s3_client.complete_multipart_upload.assert_called_once_with(
+        Bucket="bucket",
+        Key="file.bin",
+        UploadId="up1",
+        MultipartUpload={"Parts": [{"ETag": f"e{i}", "PartNumber": i} for i in (1, 2, 3)]},
+    )
+
+
+def test_put_bytes_failure(monkeypatch, mock_s3_client):
+    mock_s3_client.put_object.side_effect = Exception("fail")
+    monkeypatch.setattr("tfdslib.s3.s3.get_s3_client", lambda: mock_s3_client)
+    assert not s3_mod.put_bytes(b"hello", "bucket", "file.txt")
+
+
+def test_put_bytes_stats(monkeypatch, mock_s3_client):
+    monkeypatch.setattr("tfdslib.s3.s3.get_s3_client", lambda: mock_s3_client)
+    enable_stats()
+    reset_stats()
+    try:
+        s3_mod.put_bytes(b"hello", "bucket", "file.txt")
+        stats = get_stats()
+    finally:
+        enable_stats(False)
+        reset_stats()
+    assert stats["s3.put_bytes"]["count"] == 1
+    assert stats["s3.put_bytes"]["bytes"] == 5
+
+
+def test_open_write_aborts_on_error(monkeypatch, mock_s3_client):
+    mock_s3_client.create_multipart_upload.return_value = {"UploadId": "up1"}
+    mock_s3_client.upload_part.return_value = {"ETag": "e"}
+    monkeypatch.setattr("tfdslib.s3.s3.get_s3_client", lambda: mock_s3_client)
+    with pytest.raises(RuntimeError):
+        with s3_mod.open_write("bucket", "file.bin", part_size=2) as writer:
+            writer.write(b"abcd")
+            raise RuntimeError("producer failed")
+    mock_s3_client.abort_multipart_upload.assert_called_once_with(Bucket="bucket", Key="file.bin", UploadId="up1")
+    mock_s3_client.complete_multipart_upload.assert_not_called()
+
+
+def test_get_bytes(monkeypatch, mock_s3_client):
+    mock_s3_client.get_object.return_value = {"Body": io.BytesIO(b"payload"), "ContentLength": 7}
+    monkeypatch.setattr("tfdslib.s3.s3.get_s3_client", lambda: mock_s3_client)
+    assert s3_mod.get_bytes("bucket", "file.txt", prefix="pre") == b"payload"
+    mock_s3_client.get_object.assert_called_once_with(Bucket="bucket", Key="pre/file.txt")
+
+
+def test_open_read_streams_lines(monkeypatch, mock_s3_client):
+    mock_s3_client.get_object.return_value = {"Body": io.BytesIO(b"a,1\nb,2\n"), "ContentLength": 8}
+    monkeypatch.setattr("tfdslib.s3.s3.get_s3_client", lambda: mock_s3_client)
+    with io.TextIOWrapper(s3_mod.open_read("bucket", "file.csv")) as f:
+        assert f.readlines() == ["a,1\n", "b,2\n"]
+
+
+class _RangeClient:
+    """Minimal client serving ranged GETs from an in-memory object."""
+
+    def __init__(self, data, etag='"abc"'):
+        self.data = data
+        self.etag = etag
+        self.ranges = []
+
+    def head_object(self, Bucket, Key):
+        return {"ContentLength": len(self.data), "ETag": self.etag}
+
+    def get_object(self, Bucket, Key, Range=None, IfMatch=None):
+        if IfMatch is not None and IfMatch != self.etag:
+            raise ClientError({"Error": {"Code": "412"}}, "GetObject")
+        start, end = Range[len("bytes=") :].split("-")
+        end = int(end) if end else len(self.data) - 1
+        self.ranges.append((int(start), end))
+        return {"Body": io.BytesIO(self.data[int(start) : end + 1])}
+
+
+def test_get_range(monkeypatch):
+    client = _RangeClient(b"0123456789")
+    monkeypatch.setattr("tfdslib.s3.s3.get_s3_client", lambda: client)
+    assert s3_mod.get_range("bucket", "key", 2, 4) == b"234"
+    assert s3_mod.get_range("bucket", "key", 7) == b"789"
+
+
+@pytest.mark.parametrize("use_mmap", [False, True])
+def test_get_file_ranged(monkeypatch, tmp_path, use_mmap):
+    data = bytes(range(256)) * 40
+    client = _RangeClient(data)
+    monkeypatch.setattr("tfdslib.s3.s3.get_s3_client", lambda: client)
+    target = tmp_path / "out.bin"
+    assert s3_mod.get_file_ranged(
+        str(target), "bucket", "f.bin", "pre", part_size=1000, max_workers=4, use_mmap=use_mmap
+    )
+    assert target.read_bytes() == data
+    assert len(client.ranges) == 11
+
+
+def test_get_file_ranged_failure_removes_partial_file(monkeypatch, tmp_path):
+    client = _RangeClient(b"0123456789")
+    client.get_object = MagicMock(side_effect=ClientError({"Error": {"Code": "412"}}, "GetObject"))
+    monkeypatch.setattr("tfdslib.s3.s3.get_s3_client", lambda: client)
+    target = tmp_path / "out.bin"
+    assert not s3_mod.get_file_ranged(str(target), "bucket", "f.bin", part_size=4)
+    assert not target.exists()
+
+
+def test_get_file_ranged_failure_cancels_pending_ranges(monkeypatch, tmp_path):
+    client = _RangeClient(bytes(1000))
+    client.get_object = MagicMock(side_effect=ClientError({"Error": {"Code": "412"}}, "GetObject"))
+    monkeypatch.setattr("tfdslib.s3.s3.get_s3_client", lambda: client)
+    assert not s3_mod.get_file_ranged(str(tmp_path / "out.bin"), "bucket", "f.bin", part_size=10, max_workers=1)
+    assert client.get_object.call_count < 100
+
+
+def test_get_file_ranged_head_failure_keeps_existing_file(monkeypatch, tmp_path):
+    client = _RangeClient(b"0123456789")
+    client.head_object = MagicMock(side_effect=ClientError({"Error": {"Code": "404"}}, "HeadObject"))
+    monkeypatch.setattr("tfdslib.s3.s3.get_s3_client", lambda: client)
+    target = tmp_path / "out.bin"
+    target.write_bytes(b"previous download")
+    assert not s3_mod.get_file_ranged(str(target), "bucket", "f.bin")
+    assert target.read_bytes() == b"previous download"
+
+
+def test_get_file_parallel_delegates(monkeypatch):
+    ranged = MagicMock(return_value=True)
+    monkeypatch.setattr("tfdslib.s3.s3.get_file_ranged", ranged)
+    assert s3_mod.get_file("local.bin", "bucket", "f.bin", "pre", parallel=True)
+    ranged.assert_called_once_with("local.bin", "bucket", "f.bin", "pre")
+
+
+def _paged_listing(mock_client, pages):
+    mock_paginator = MagicMock()
+    mock_paginator.paginate.return_value = pages
+    mock_client.get_paginator.return_value = mock_paginator
+
+
+def test_delete_prefix_counts_and_bytes(monkeypatch, mock_s3_client):
+    pages = [
+        {"Contents": [{"Key": f"p/{i}", "Size": 10} for i in range(1000)]},
+        {"Contents": [{"Key": "p/last", "Size": 5}]},
+        {},
+    ]
+    _paged_listing(mock_s3_client, pages)
+    mock_s3_client.delete_objects.return_value = {}
+    monkeypatch.setattr("tfdslib.s3.s3.get_s3_client", lambda: mock_s3_client)
+    result = s3_mod.delete_prefix("bucket", "p/", max_workers=2)
+    assert result == {"files": 1001, "bytes": 10005, "errors": [], "dry_run": False}
+    assert mock_s3_client.delete_objects.call_count == 2
+
+
+def test_delete_prefix_retries_and_reports_failures(monkeypatch, mock_s3_client):
+    _paged_listing(mock_s3_client, [{"Contents": [{"Key": "a", "Size": 1}, {"Key": "b", "Size": 2}]}])
+    failure = {"Key": "b", "Code": "AccessDenied", "Message": "denied"}
+    mock_s3_client.delete_objects.side_effect = [{"Errors": [failure]}, {"Errors": [failure]}]
+    monkeypatch.setattr("tfdslib.s3.s3.get_s3_client", lambda: mock_s3_client)
+    monkeypatch.setattr("tfdslib.s3.s3.time.sleep", lambda _: None)
+    result = s3_mod.delete_prefix("bucket", "", max_retries=1)
+    assert result["files"] == 1
+    assert result["bytes"] == 1
+    assert result["errors"] == [failure]
+    retry = mock_s3_client.delete_objects.call_args_list[1]
+    assert retry.kwargs["Delete"]["Objects"] == [{"Key": "b"}]
+
+
+def test_delete_prefix_dry_run(monkeypatch, mock_s3_client):
+    _paged_listing(mock_s3_client, [{"Contents": [{"Key": "a", "Size": 3}, {"Key": "b", "Size": 4}]}])
+    monkeypatch.setattr("tfdslib.s3.s3.get_s3_client", lambda: mock_s3_client)
+    result = s3_mod.delete_prefix("bucket", "", dry_run=True)
+    assert result["files"] == 2
+    assert result["bytes"] == 7
+    mock_s3_client.delete_objects.assert_not_called()
+
+
+def test_put_bytes_gzip_sets_content_encoding(monkeypatch, mock_s3_client):
+    monkeypatch.setattr("tfdslib.s3.s3.get_s3_client", lambda: mock_s3_client)
+    assert s3_mod.put_bytes(b"a,b\n" * 1000, "bucket", "export.csv.gz", compression="auto")
+    kwargs = mock_s3_client.put_object.call_args.kwargs
+    assert kwargs["ContentEncoding"] == "gzip"
+    assert gzip.decompress(kwargs["Body"]) == b"a,b\n" * 1000
+
+
+def test_put_file_gzip_streams_multipart(monkeypatch, mock_s3_client, tmp_path):
+    local = tmp_path / "export.csv"
+    data = os.urandom(50_000)
+    local.write_bytes(data)
+    uploaded = []
+    mock_s3_client.create_multipart_upload.return_value = {"UploadId": "up1"}
+    mock_s3_client.upload_part.side_effect = lambda **kw: uploaded.append(kw["Body"]) or {"ETag": "e"}
+    monkeypatch.setattr("tfdslib.s3.s3.get_s3_client", lambda: mock_s3_client)
+    monkeypatch.setattr(
+        "tfdslib.s3.s3.open_write",
+        lambda bucket, key, compression: s3_mod.s3.S3ObjectWriter(mock_s3_client, bucket, key, 10_000, {}, compression),
+    )
+    assert s3_mod.put_file(str(local), "bucket", "export.csv.gz", prefix="pre", compression="gzip")
+    mock_s3_client.upload_file.assert_not_called()
+    assert mock_s3_client.create_multipart_upload.call_args.kwargs["ContentEncoding"] == "gzip"
+    assert len(uploaded) > 1
+    assert gzip.decompress(b"".join(uploaded)) == data
+
+
+def test_put_file_auto_keeps_precompressed_file(monkeypatch, mock_s3_client):
+    monkeypatch.setattr("tfdslib.s3.s3.get_s3_client", lambda: mock_s3_client)
+    assert s3_mod.put_file("local.csv.gz", "bucket", "file.csv.gz", compression="auto")
+    mock_s3_client.upload_file.assert_called_once_with("local.csv.gz", "bucket", "file.csv.gz")
+
+
+def test_get_file_auto_decompresses_by_content_encoding(monkeypatch, mock_s3_client, tmp_path):
+    data = b"line\n" * 10_000
+    body = io.BytesIO(gzip.compress(data[:20_000]) + gzip.compress(data[20_000:]))
+    mock_s3_client.get_object.return_value = {"Body": body, "ContentLength": 0, "ContentEncoding": "gzip"}
+    monkeypatch.setattr("tfdslib.s3.s3.get_s3_client", lambda: mock_s3_client)
+    target = tmp_path / "out.txt"
+    assert s3_mod.get_file(str(target), "bucket", "file.txt", "pre", compression="auto")
+    assert target.read_bytes() == data
+    mock_s3_client.download_file.assert_not_called()
+
+
+def test_get_file_corrupt_data_returns_false(monkeypatch, mock_s3_client, tmp_path):
+    body = io.BytesIO(gzip.compress(b"line\n" * 10_000)[:-20] + b"not gzip at all" * 10)
+    mock_s3_client.get_object.return_value = {"Body": body, "ContentLength": 0}
+    monkeypatch.setattr("tfdslib.s3.s3.get_s3_client", lambda: mock_s3_client)
+    target = tmp_path / "out.txt"
+    assert not s3_mod.get_file(str(target), "bucket", "file.txt.gz", compression="gzip")
+    assert not target.exists()
+
+
+def test_get_file_unknown_compression_returns_false(monkeypatch, mock_s3_client, tmp_path):
+    monkeypatch.setattr("tfdslib.s3.s3.get_s3_client", lambda: mock_s3_client)
+    target = tmp_path / "out.txt"
+    target.write_bytes(b"previous")
+    assert not s3_mod.get_file(str(target), "bucket", "file.txt", compression="lz4")
+    assert target.read_bytes() == b"previous"
+
+
+def test_get_bytes_gzip(monkeypatch, mock_s3_client):
+    mock_s3_client.get_object.return_value = {"Body": io.BytesIO(gzip.compress(b"payload")), "ContentLength": 0}
+    monkeypatch.setattr("tfdslib.s3.s3.get_s3_client", lambda: mock_s3_client)
+    assert s3_mod.get_bytes("bucket", "file.gz", compression="gzip") == b"payload"
+
+
+def test_invalid_compression(monkeypatch, mock_s3_client):
+    monkeypatch.setattr("tfdslib.s3.s3.get_s3_client", lambda: mock_s3_client)
+    with pytest.raises(ValueError):
+        s3_mod.open_write("bucket", "file", compression="lz4")
+
+
+def test_zstd_requires_zstandard(monkeypatch, mock_s3_client):
+    monkeypatch.setattr("tfdslib.s3.s3.zstandard", None)
+    monkeypatch.setattr("tfdslib.s3.s3.get_s3_client", lambda: mock_s3_client)
+    with pytest.raises(ImportError):
+        s3_mod.open_write("bucket", "file.zst", compression="auto")
+
+
+def test_zstd_roundtrip(monkeypatch, mock_s3_client):
+    pytest.importorskip("zstandard")
+    monkeypatch.setattr("tfdslib.s3.s3.get_s3_client", lambda: mock_s3_client)
+    assert s3_mod.put_bytes(b"zstd payload" * 100, "bucket", "file.zst", compression="auto")
+    body = mock_s3_client.put_object.call_args.kwargs["Body"]
+    mock_s3_client.get_object.return_value = {"Body": io.BytesIO(body), "ContentLength": len(body)}
+    assert s3_mod.get_bytes("bucket", "file.zst", compression="zstd") == b"zstd payload" * 100
+
+
+CSV_DATA = b"id,country,amount\n1,SE,10\n2,NO,25\n3,SE,7\n4,SE,40\n"
+
+
+def test_select_rows_uses_s3_select(monkeypatch, mock_s3_client):
+    mock_s3_client.select_object_content.return_value = {
+        "Payload": [
+            {"Records": {"Payload": b'{"id": "1"}\n{"i'}},
+            {"Stats": {}},
+            {"Records": {"Payload": b'd": "3"}\n'}},
+            {"End": {}},
+        ]
+    }
+    monkeypatch.setattr("tfdslib.s3.s3.get_s3_client", lambda: mock_s3_client)
+    sql = "SELECT s.id FROM S3Object s WHERE s.country = 'SE'"
+    rows = list(s3_mod.select_rows("bucket", "data.csv.gz", sql))
+    assert rows == [{"id": "1"}, {"id": "3"}]
+    kwargs = mock_s3_client.select_object_content.call_args.kwargs
+    assert kwargs["InputSerialization"] == {"CSV": {"FileHeaderInfo": "USE"}, "CompressionType": "GZIP"}
+    assert kwargs["OutputSerialization"] == {"JSON": {"RecordDelimiter": "\n"}}
+
+
+def test_select_rows_falls_back_to_local_filter(monkeypatch, mock_s3_client):
+    mock_s3_client.select_object_content.side_effect = ClientError(
+        {"Error": {"Code": "NotImplemented"}}, "SelectObjectContent"
+    )
+    mock_s3_client.get_object.return_value = {"Body": io.BytesIO(gzip.compress(CSV_DATA)), "ContentLength": 0}
+    monkeypatch.setattr("tfdslib.s3.s3.get_s3_client", lambda: mock_s3_client)
+    sql = "SELECT s.id, s.amount FROM S3Object s WHERE s.country = 'SE' AND s.amount > 8 LIMIT 1"
+    assert list(s3_mod.select_rows("bucket", "data.csv.gz", sql)) == [{"id": "1", "amount": "10"}]
+
+
+def test_select_rows_local_json_to_csv(monkeypatch, mock_s3_client):
+    data = b'{"id": 1, "tag": "a"}\n{"id": 2, "tag": "b"}\n'
+    mock_s3_client.get_object.return_value = {"Body": io.BytesIO(data), "ContentLength": len(data)}
+    mock_s3_client.select_object_content.side_effect = ClientError(
+        {"Error": {"Code": "MethodNotAllowed"}}, "SelectObjectContent"
+    )
+    monkeypatch.setattr("tfdslib.s3.s3.get_s3_client", lambda: mock_s3_client)
+    sql = "select * from s3object where id >= 2"
+    assert list(s3_mod.select_rows("bucket", "data.json", sql, "json", "csv")) == [[2, "b"]]
+
+
+def test_select_rows_local_nested_fields_dont_match(monkeypatch, mock_s3_client):
+    data = b'{"id": {"nested": 1}}\n{"id": [1, 2]}\n{"id": 3}\n'
+    mock_s3_client.get_object.return_value = {"Body": io.BytesIO(data), "ContentLength": len(data)}
+    mock_s3_client.select_object_content.side_effect = ClientError({"Error": {"Code": "NotImplemented"}}, "Select")
+    monkeypatch.setattr("tfdslib.s3.s3.get_s3_client", lambda: mock_s3_client)
+    assert list(s3_mod.select_rows("bucket", "data.json", "select * from s3object where id > 0", "json")) == [{"id": 3}]
+
+
+def test_select_rows_other_errors_raise(monkeypatch, mock_s3_client):
+    mock_s3_client.select_object_content.side_effect = ClientError({"Error": {"Code": "NoSuchKey"}}, "Select")
+    monkeypatch.setattr("tfdslib.s3.s3.get_s3_client", lambda: mock_s3_client)
+    with pytest.raises(ClientError):
+        list(s3_mod.select_rows("bucket", "missing.csv", "SELECT * FROM S3Object"))
+
+
+def test_select_rows_unsupported_local_sql(monkeypatch, mock_s3_client):
+    mock_s3_client.select_object_content.side_effect = ClientError({"Error": {"Code": "NotImplemented"}}, "Select")
+    monkeypatch.setattr("tfdslib.s3.s3.get_s3_client", lambda: mock_s3_client)
+    with pytest.raises(ValueError):
+        list(s3_mod.select_rows("bucket", "data.csv", "SELECT COUNT(*) FROM S3Object s WHERE s.a LIKE 'x%'"))
+
+
+def test_select_rows_local_rejects_functions(monkeypatch, mock_s3_client):
+    mock_s3_client.select_object_content.side_effect = ClientError({"Error": {"Code": "NotImplemented"}}, "Select")
+    monkeypatch.setattr("tfdslib.s3.s3.get_s3_client", lambda: mock_s3_client)
+    with pytest.raises(ValueError):
+        list(s3_mod.select_rows("bucket", "data.csv", "SELECT COUNT(*) FROM S3Object"))
@@ -0,0 +1,94 @@
+import asyncio
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from tfdslib.s3 import aio
+
+
+@pytest.fixture(autouse=True)
+def reset_concurrency():
+    aio.set_max_concurrency(32)
+    yield
+    aio.set_max_concurrency(32)
+
+
+def test_list_files(monkeypatch):
+    mock_client = MagicMock()
+    mock_client.get_paginator.return_value.paginate.return_value = [
+        {"Contents": [{"Key": "p/1"}, {"Key": "p/2"}]},
+        {},
+        {"Contents": [{"Key": "p/3"}]},
+    ]
+    monkeypatch.setattr("tfdslib.s3.s3.get_s3_client", lambda: mock_client)
+    assert asyncio.run(aio.list_files("p/", "bucket")) == ["p/1", "p/2", "p/3"]
+
+
+def test_file_exists_runs_off_loop(monkeypatch):
+    loop_thread = threading.get_ident()
+    calls = []
+
+    def fake_file_exists(bucket, name, prefix):
+        calls.append(threading.get_ident())
+        return True
+
+    monkeypatch.setattr("tfdslib.s3.s3.file_exists", fake_file_exists)
+    assert asyncio.run(aio.file_exists("bucket", "file", "pre"))
+    assert calls and calls[0] != loop_thread
+
+
+def test_put_and_get_file(monkeypatch):
+    put = MagicMock(return_value=True)
+    get = MagicMock(return_value=True)
+    monkeypatch.setattr("tfdslib.s3.s3.put_file", put)
+    monkeypatch.setattr("tfdslib.s3.s3.get_file", get)
+
+    async def main():
+        return await asyncio.gather(
+            aio.put_file("a.txt", "bucket", "a.txt", compression="gzip"),
+            aio.get_file("b.txt", "bucket", "b.txt", "pre"),
+        )
+
+    assert asyncio.run(main()) == [True, True]
+    put.assert_called_once_with("a.txt", "bucket", "a.txt", None, compression="gzip")
+    get.assert_called_once_with("b.txt", "bucket", "b.txt", "pre", compression=None)
+
+
+def test_delete_prefix(monkeypatch):
+    result = {"files": 1, "bytes": 2, "errors": [], "dry_run": True}
+    delete = MagicMock(return_value=result)
+    monkeypatch.setattr("tfdslib.s3.s3.delete_prefix", delete)
+    assert asyncio.run(aio.delete_prefix("bucket", "p/", dry_run=True)) == result
+    delete.assert_called_once_with("bucket", "p/", dry_run=True)
+
+
+def test_concurrency_is_capped(monkeypatch):
+    aio.set_max_concurrency(3)
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def slow_exists(bucket, name, prefix):
+        nonlocal active, peak
+        with lock:
+            active += 1
+            peak = max(peak, active)
+        time.sleep(0.01)
+        with lock:
+            active -= 1
+        return True
+
+    monkeypatch.setattr("tfdslib.s3.s3.file_exists", slow_exists)
+
+    async def main():
+        return await asyncio.gather(*(aio.file_exists("bucket", str(i)) for i in range(20)))
+
+    assert all(asyncio.run(main()))
+    assert peak <= 3
+
+
+def test_set_max_concurrency_invalid():
+    with pytest.raises(ValueError):
+        aio.set_max_concurrency(0)
@@ -1,3 +1,6 @@
+import datetime as dt
+import json
+import os
 from unittest import mock
 
 import pytest
@@ -7,6 +10,13 @@ import tfdslib.spark as spark_mod
 MOCK_CONFIG = {"access_key": "AKIA_TEST", "secret_key": "SECRET_TEST"}
 
 
+@pytest.fixture(autouse=True)
+def clear_sessions():
+    spark_mod.spark._sessions.clear()
+    yield
+    spark_mod.spark._sessions.clear()
+
+
 @pytest.fixture
 def patch_get_config():
     with mock.patch("tfdslib.spark.spark.get_config", return_value=MOCK_CONFIG):
@@ -73,12 +83,12 @@ def test_show_cfg_prints(monkeypatch):
 
 def test_show_spark_info_prints(monkeypatch):
     mock_conf = mock.Mock()
-    mock_conf.get.side_effect = lambda k: {
+    mock_conf.get.side_effect = lambda k, *d: {
         "spark.app.name": "test_app",
         "spark.master": "local[*]",
         "spark.sql.warehouse.dir": "/tmp/warehouse",
         "spark.hadoop.fs.s3a.endpoint": "s3.amazonaws.com",
-    }[k]
+    }.get(k, *d)
     mock_spark_session = mock.Mock()
     mock_spark_session.sparkContext.getConf.return_value = mock_conf
     with mock.patch("builtins.print") as mock_print:
@@ -86,6 +96,48 @@ def test_show_spark_info_prints(monkeypatch):
         assert mock_print.call_count > 0
 
 
+def test_show_spark_info_prints_local_sizing():
+    conf = {
+        "spark.tfds.local.cores": "8",
+        "spark.tfds.local.memory": "16384m",
+        "spark.sql.shuffle.partitions": "16",
+    }
+    mock_spark_session = mock.Mock()
+    mock_spark_session.sparkContext.getConf.return_value.get.side_effect = lambda k, d=None: conf.get(k, d)
+    with mock.patch("builtins.print") as mock_print:
+        spark_mod.show_spark_info(mock_spark_session)
+    printed = " ".join(str(c.args[0]) for c in mock_print.call_args_list)
+    assert "8 cores" in printed
+    assert "shuffle partitions: 16" in printed
+
+
+def test_local_settings_sized_from_machine(monkeypatch):
+    monkeypatch.setattr("tfdslib.spark.spark._detect_cores", lambda: 4)
+    monkeypatch.setattr("tfdslib.spark.spark._detect_memory", lambda: 16 * 1024**3)
+    settings = spark_mod.spark._local_settings()
+    assert settings["spark.sql.shuffle.partitions"] == "8"
+    assert settings["spark.default.parallelism"] == "8"
+    assert settings["spark.driver.memory"] == "8192m"
+    assert settings["spark.sql.adaptive.enabled"] == "true"
+    # we are running under pytest
+    assert settings["spark.ui.enabled"] == "false"
+
+
+def test_local_settings_keep_ui_outside_tests(monkeypatch):
+    monkeypatch.delenv("PYTEST_CURRENT_TEST", raising=False)
+    monkeypatch.delenv("TFDS_SPARK_LIGHTWEIGHT", raising=False)
+    monkeypatch.setattr("tfdslib.spark.spark._detect_memory", lambda: 1024**3)
+    settings = spark_mod.spark._local_settings()
+    assert "spark.ui.enabled" not in settings
+    assert settings["spark.driver.memory"] == "1024m"
+
+
+def test_get_spark_session_local_sizing(patch_get_config, patch_pyspark_and_delta, mock_spark_conf):
+    with mock.patch("tfdslib.spark.spark._detect_cores", return_value=2):
+        spark_mod.get_spark_session("test_app", use_local=True)
+    mock_spark_conf.set.assert_any_call("spark.sql.shuffle.partitions", "4")
+
+
 def test_show_db_prints(monkeypatch):
     db1 = mock.Mock()
     db1.name = "db1"
@@ -101,3 +153,656 @@ def test_show_db_prints(monkeypatch):
     with mock.patch("builtins.print") as mock_print:
         spark_mod.show_dbs(mock_spark_session)
         assert mock_print.call_count > 0
+
+
+def test_get_spark_session_default_profile(patch_pyspark_and_delta, mock_spark_conf):
+    cfg = {**MOCK_CONFIG, "url": "http://minio:9000"}
+    with mock.patch("tfdslib.spark.spark.get_config", side_effect=lambda name: cfg if name == "s3" else {}):
+        spark_mod.get_spark_session("test_app")
+    mock_spark_conf.set.assert_any_call("spark.hadoop.fs.s3a.endpoint", "http://minio:9000")
+    mock_spark_conf.set.assert_any_call("spark.hadoop.fs.s3a.connection.ssl.enabled", "false")
+    mock_spark_conf.set.assert_any_call("spark.hadoop.fs.s3a.experimental.input.fadvise", "normal")
+    keys = {c.args[0] for c in mock_spark_conf.set.call_args_list}
+    assert "spark.sql.sources.commitProtocolClass" not in keys
+
+
+def test_get_spark_session_magic_committer(patch_pyspark_and_delta, mock_spark_conf):
+    configs = {"s3": MOCK_CONFIG, "spark": {"magic_committer": True}}
+    with mock.patch("tfdslib.spark.spark.get_config", side_effect=lambda name: configs[name]):
+        spark_mod.get_spark_session("test_app")
+    mock_spark_conf.set.assert_any_call("spark.hadoop.fs.s3a.committer.name", "magic")
+    mock_spark_conf.set.assert_any_call(
+        "spark.sql.sources.commitProtocolClass", "org.apache.spark.internal.io.cloud.PathOutputCommitProtocol"
+    )
+
+
+def test_get_spark_session_profile_parameter(patch_get_config, patch_pyspark_and_delta, mock_spark_conf):
+    spark_mod.get_spark_session("test_app", profile="random_read")
+    mock_spark_conf.set.assert_any_call("spark.hadoop.fs.s3a.experimental.input.fadvise", "random")
+
+
+def test_get_spark_session_profile_from_spark_config(patch_pyspark_and_delta, mock_spark_conf):
+    configs = {"s3": MOCK_CONFIG, "spark": {"profile": "bulk_write"}}
+    with mock.patch("tfdslib.spark.spark.get_config", side_effect=lambda name: configs[name]):
+        spark_mod.get_spark_session("test_app")
+    mock_spark_conf.set.assert_any_call("spark.hadoop.fs.s3a.fast.upload.buffer", "bytebuffer")
+
+
+def test_get_spark_session_missing_spark_config(patch_pyspark_and_delta, mock_spark_conf):
+    def get_config(name):
+        if name == "spark":
+            raise ValueError("Config 'spark' not found")
+        return MOCK_CONFIG
+
+    with mock.patch("tfdslib.spark.spark.get_config", side_effect=get_config):
+        assert spark_mod.get_spark_session("test_app") == "spark_session"
+
+
+def test_get_spark_session_unknown_profile(patch_get_config, patch_pyspark_and_delta):
+    with pytest.raises(ValueError, match="Unknown spark profile"):
+        spark_mod.get_spark_session("test_app", profile="turbo")
+
+
+def _live_session(spark_conf=None, runtime=None, modifiable=()):
+    """A mock session with a running context, spark_conf holds static settings, runtime the SQL ones."""
+    session = mock.Mock()
+    spark_conf = spark_conf or {}
+    runtime = runtime if runtime is not None else {}
+    hadoop = {}
+    session.sparkContext.getConf.return_value.get.side_effect = lambda k, d=None: spark_conf.get(k, d)
+    session.sparkContext._jsc.hadoopConfiguration.return_value.get.side_effect = hadoop.get
+    session.sparkContext._jsc.hadoopConfiguration.return_value.set.side_effect = hadoop.__setitem__
+    session.conf.isModifiable.side_effect = lambda k: k in modifiable
+    session.conf.get.side_effect = lambda k, d=None: runtime.get(k, d)
+    session.conf.set.side_effect = runtime.__setitem__
+    session.hadoop = hadoop
+    return session
+
+
+def _settings(use_local=False, profile=None):
+    with mock.patch("tfdslib.spark.spark.get_config", return_value=MOCK_CONFIG):
+        return spark_mod.spark._session_settings("test_app", use_local, profile)
+
+
+def test_get_spark_session_is_registered(patch_pyspark_and_delta):
+    session = _live_session()
+    patch_pyspark_and_delta.return_value.getOrCreate.return_value = session
+    with mock.patch("tfdslib.spark.spark.get_config", return_value=MOCK_CONFIG) as get_config:
+        assert spark_mod.get_spark_session("test_app") is session
+        calls = get_config.call_count
+        assert spark_mod.get_spark_session("test_app") is session
+        assert get_config.call_count == calls
+    assert patch_pyspark_and_delta.return_value.getOrCreate.call_count == 1
+
+
+def test_get_spark_session_reuses_matching_live_session(patch_get_config, patch_pyspark_and_delta):
+    settings = _settings()
+    static = {k: v for k, v in settings.items() if not k.startswith("spark.hadoop.")}
+    session = _live_session(spark_conf=static)
+    with mock.patch("pyspark.sql.SparkSession.getActiveSession", return_value=session):
+        assert spark_mod.get_spark_session("other_app") is session
+    patch_pyspark_and_delta.assert_not_called()
+    assert session.hadoop["fs.s3a.access.key"] == "AKIA_TEST"
+
+
+def test_get_spark_session_conflicting_live_session(patch_get_config, patch_pyspark_and_delta):
+    session = _live_session(spark_conf={"spark.master": "spark://cluster:7077"})
+    with mock.patch("pyspark.sql.SparkSession.getActiveSession", return_value=session):
+        with pytest.raises(ValueError, match="spark.master"):
+            spark_mod.get_spark_session("test_app", use_local=True)
+
+
+def test_get_spark_session_refresh_updates_runtime_settings(patch_pyspark_and_delta):
+    settings = _settings(profile="random_read")
+    static = {k: v for k, v in settings.items() if not k.startswith("spark.hadoop.")}
+    runtime = {"spark.sql.files.maxPartitionBytes": "128m"}
+    session = _live_session(spark_conf=static, runtime=runtime, modifiable=("spark.sql.files.maxPartitionBytes",))
+    spark_mod.spark._sessions[("test_app", False, "random_read")] = session
+    rotated = {**MOCK_CONFIG, "secret_key": "ROTATED"}
+    with mock.patch("tfdslib.spark.spark.get_config", return_value=rotated):
+        assert spark_mod.get_spark_session("test_app", profile="random_read", refresh=True) is session
+    assert session.hadoop["fs.s3a.secret.key"] == "ROTATED"
+    assert runtime["spark.sql.files.maxPartitionBytes"] == "64m"
+
+
+def test_stop_spark_session():
+    session = _live_session()
+    spark_mod.spark._sessions[("test_app", False, None)] = session
+    spark_mod.stop_spark_session()
+    session.stop.assert_called_once()
+    assert spark_mod.spark._sessions == {}
+
+
+@pytest.fixture
+def schema_cache(monkeypatch, tmp_path):
+    monkeypatch.setenv("TFDS_ROOT_PATH", str(tmp_path))
+    spark_mod.spark._schema_cache.clear()
+    yield tmp_path
+    spark_mod.spark._schema_cache.clear()
+
+
+def _mock_reader_session(schema):
+    session = mock.Mock()
+    reader = session.read.format.return_value
+    reader.options.return_value = reader
+    reader.option.return_value = reader
+    reader.schema.return_value = reader
+    reader.load.return_value.schema = schema
+    return session, reader
+
+
+LISTINGS = {
+    "2024/2024-05/25": [
+        {"Key": "2024/2024-05/25/a.parquet", "Size": 300},
+        {"Key": "2024/2024-05/25/_SUCCESS", "Size": 0},
+    ],
+    "2024/2024-05/26": [],
+    "2024/2024-05/27": [{"Key": "2024/2024-05/27/b.parquet", "Size": 100}],
+}
+
+
+def test_read_dates_reads_folders_and_caches_schema(monkeypatch, schema_cache):
+    from pyspark.sql.types import LongType, StructField, StructType
+
+    schema = StructType([StructField("id", LongType())])
+    monkeypatch.setattr("tfdslib.spark.spark.iter_objects", lambda prefix, bucket: iter(LISTINGS[prefix]))
+    session, reader = _mock_reader_session(schema)
+    dates = [dt.date(2024, 5, 25), dt.date(2024, 5, 26), dt.date(2024, 5, 27)]
+
+    spark_mod.read_dates(session, "bucket", dates)
+
+    # schema inferred from the smallest file, data read per non-empty date folder
+    assert reader.load.call_args_list[0] == mock.call("s3a://bucket/2024/2024-05/27/b.parquet")
+    reader.schema.assert_called_with(schema)
+    assert reader.load.call_args_list[-1] == mock.call(
+        ["s3a://bucket/2024/2024-05/25/", "s3a://bucket/2024/2024-05/27/"]
+    )
+    assert (schema_cache / "cache" / "spark_schemas" / "bucket.parquet.json").is_file()
+
+    # a later run (new process) uses the persisted schema without inferring
+    spark_mod.spark._schema_cache.clear()
+    session, reader = _mock_reader_session(None)
+    spark_mod.read_dates(session, "bucket", dates)
+    reader.load.assert_called_once()
+    assert reader.schema.call_args.args[0] == schema
+
+
+def test_read_dates_infers_text_formats_from_sample(monkeypatch, schema_cache):
+    from pyspark.sql.types import LongType, StructField, StructType
+
+    dates = [dt.date(2024, 5, 1) + dt.timedelta(days=i) for i in range(20)]
+    listings = {
+        spark_mod.spark.make_date_prefix(d): [
+            {"Key": f"{spark_mod.spark.make_date_prefix(d)}/{name}.json", "Size": size}
+            for name, size in (("big", 500), ("small", 100))
+        ]
+        for d in dates
+    }
+    monkeypatch.setattr("tfdslib.spark.spark.iter_objects", lambda prefix, bucket: iter(listings[prefix]))
+    monkeypatch.setattr("tfdslib.spark.spark.SCHEMA_SAMPLE_FILES", 4)
+    session, reader = _mock_reader_session(StructType([StructField("id", LongType())]))
+    spark_mod.read_dates(session, "bucket", dates, format="json")
+    sample = reader.load.call_args_list[0].args[0]
+    assert sample == [f"s3a://bucket/2024/2024-05/{day:02d}/small.json" for day in (1, 6, 11, 16)]
+
+
+def test_read_dates_infers_schema_from_data_files_only(monkeypatch, schema_cache):
+    from pyspark.sql.types import LongType, StructField, StructType
+
+    listings = {
+        "2024/2024-05/25": [
+            {"Key": "2024/2024-05/25/_SUCCESS", "Size": 20},
+            {"Key": "2024/2024-05/25/.part-0.csv.crc", "Size": 12},
+            {"Key": "2024/2024-05/25/_delta_log/00000000000000000000.json", "Size": 30},
+            {"Key": "2024/2024-05/25/part-0.csv", "Size": 400},
+        ],
+        "2024/2024-05/26": [{"Key": "2024/2024-05/26/_SUCCESS", "Size": 20}],
+    }
+    monkeypatch.setattr("tfdslib.spark.spark.iter_objects", lambda prefix, bucket: iter(listings[prefix]))
+    session, reader = _mock_reader_session(StructType([StructField("id", LongType())]))
+    spark_mod.read_dates(session, "bucket", [dt.date(2024, 5, 25), dt.date(2024, 5, 26)], format="csv")
+    assert reader.load.call_args_list == [
+        mock.call("s3a://bucket/2024/2024-05/25/part-0.csv"),
+        mock.call(["s3a://bucket/2024/2024-05/25/"]),
+    ]
+
+
+def test_read_dates_caches_schema_per_options(monkeypatch, schema_cache):
+    from pyspark.sql.types import LongType, StringType, StructField, StructType
+
+    monkeypatch.setattr("tfdslib.spark.spark.iter_objects", lambda prefix, bucket: iter(LISTINGS[prefix]))
+    dates = [dt.date(2024, 5, 25)]
+    with_header = StructType([StructField("id", LongType())])
+    session, _ = _mock_reader_session(with_header)
+    spark_mod.read_dates(session, "bucket", dates, format="csv", options={"header": "true"})
+    without_header = StructType([StructField("_c0", StringType())])
+    session, reader = _mock_reader_session(without_header)
+    spark_mod.read_dates(session, "bucket", dates, format="csv", options={"header": "false"})
+    assert reader.schema.call_args.args[0] == without_header
+    assert len(list((schema_cache / "cache" / "spark_schemas").glob("bucket.csv.*.json"))) == 2
+
+
+def test_clear_schema_cache_removes_persisted_schemas(schema_cache):
+    cache_dir = schema_cache / "cache" / "spark_schemas"
+    cache_dir.mkdir(parents=True)
+    (cache_dir / "other.json.json").write_text("{}")
+    spark_mod.clear_schema_cache()
+    assert not cache_dir.exists()
+
+
+def test_read_dates_with_schema_skips_inference(monkeypatch, schema_cache):
+    monkeypatch.setattr("tfdslib.spark.spark.iter_objects", lambda prefix, bucket: iter(LISTINGS[prefix]))
+    session, reader = _mock_reader_session(None)
+    schema = mock.Mock()
+    spark_mod.read_dates(session, "bucket", [dt.date(2024, 5, 25)], format="json", schema=schema, options={"a": "b"})
+    session.read.format.assert_called_once_with("json")
+    reader.options.assert_called_once_with(a="b")
+    reader.load.assert_called_once_with(["s3a://bucket/2024/2024-05/25/"])
+
+
+def test_read_dates_no_files(monkeypatch, schema_cache):
+    monkeypatch.setattr("tfdslib.spark.spark.iter_objects", lambda prefix, bucket: iter([]))
+    session, _ = _mock_reader_session(None)
+    with pytest.raises(ValueError, match="No files found"):
+        spark_mod.read_dates(session, "bucket", [dt.date(2024, 5, 26)])
+    schema = mock.Mock()
+    spark_mod.read_dates(session, "bucket", [dt.date(2024, 5, 26)], schema=schema)
+    session.createDataFrame.assert_called_once_with([], schema)
+
+
+def _compaction_session(rows, staged_rows):
+    session = mock.Mock()
+    reader = session.read.format.return_value
+    reader.option.return_value = reader
+    reader.options.return_value = reader
+    reader.load.side_effect = lambda path: mock.Mock(
+        count=mock.Mock(return_value=staged_rows if "_compaction" in path else rows)
+    )
+    return session
+
+
+def test_compact_dates_parquet(monkeypatch):
+    small = [{"Key": f"2024/2024-05/25/part-{i}.parquet", "Size": 10} for i in range(5)]
+    listings = {
+        "2024/2024-05/25/": small + [{"Key": "2024/2024-05/25/_SUCCESS", "Size": 0}],
+        "2024/2024-05/26/": [{"Key": "2024/2024-05/26/big.parquet", "Size": 500}],
+        "_compaction/2024/2024-05/25/": [
+            {"Key": "_compaction/2024/2024-05/25/part-new.parquet", "Size": 45},
+            {"Key": "_compaction/2024/2024-05/25/_SUCCESS", "Size": 0},
+        ],
+    }
+    s3 = mock.Mock()
+    delete = mock.Mock()
+    delete_keys = mock.Mock(return_value={"files": 6, "errors": []})
+    monkeypatch.setattr("tfdslib.spark.spark.iter_objects", lambda prefix, bucket: iter(listings[prefix]))
+    monkeypatch.setattr("tfdslib.spark.spark.get_s3_client", lambda: s3)
+    monkeypatch.setattr("tfdslib.spark.spark.delete_prefix", delete)
+    monkeypatch.setattr("tfdslib.spark.spark.delete_keys", delete_keys)
+    session = _compaction_session(rows=100, staged_rows=100)
+
+    reports = spark_mod.compact_dates(session, "bucket", [dt.date(2024, 5, 25), dt.date(2024, 5, 26)], 1000)
+
+    assert reports[0] == {
+        "prefix": "2024/2024-05/25",
+        "files_before": 5,
+        "bytes_before": 50,
+        "files_after": 1,
+        "bytes_after": 45,
+        "skipped": False,
+    }
+    assert reports[1]["skipped"]
+    s3.copy.assert_called_once_with(
+        {"Bucket": "bucket", "Key": "_compaction/2024/2024-05/25/part-new.parquet"},
+        "bucket",
+        "2024/2024-05/25/part-new.parquet",
+    )
+    bucket, deleted = delete_keys.call_args.args
+    assert "2024/2024-05/25/_SUCCESS" in deleted
+    assert len(deleted) == 6
+    delete.assert_called_with("bucket", "_compaction/2024/2024-05/25/")
+
+
+def _staged_listings():
+    return {
+        "2024/2024-05/25/": [{"Key": f"2024/2024-05/25/p{i}.csv", "Size": 10} for i in range(3)],
+        "_compaction/2024/2024-05/25/": [
+            {"Key": f"_compaction/2024/2024-05/25/part-{i}.csv", "Size": 15} for i in range(2)
+        ],
+    }
+
+
+def test_compact_dates_passes_options(monkeypatch):
+    listings = _staged_listings()
+    monkeypatch.setattr("tfdslib.spark.spark.iter_objects", lambda prefix, bucket: iter(listings[prefix]))
+    monkeypatch.setattr("tfdslib.spark.spark.get_s3_client", mock.Mock)
+    monkeypatch.setattr("tfdslib.spark.spark.delete_prefix", mock.Mock())
+    monkeypatch.setattr("tfdslib.spark.spark.delete_keys", mock.Mock(return_value={"files": 3, "errors": []}))
+    session = _compaction_session(rows=100, staged_rows=100)
+    reader = session.read.format.return_value
+    df = mock.Mock(count=mock.Mock(return_value=100))
+    reader.load.side_effect = lambda path: df
+    spark_mod.compact_dates(session, "bucket", [dt.date(2024, 5, 25)], 1000, format="csv", options={"header": "true"})
+    assert reader.options.call_args_list == [mock.call(header="true")] * 2
+    df.repartition.return_value.write.format.return_value.options.assert_called_once_with(header="true")
+
+
+def test_compact_dates_copy_failure_removes_copied(monkeypatch):
+    listings = _staged_listings()
+    s3 = mock.Mock()
+    s3.copy.side_effect = [None, IOError("connection reset")]
+    delete_keys = mock.Mock(return_value={"files": 2, "errors": []})
+    monkeypatch.setattr("tfdslib.spark.spark.iter_objects", lambda prefix, bucket: iter(listings[prefix]))
+    monkeypatch.setattr("tfdslib.spark.spark.get_s3_client", lambda: s3)
+    monkeypatch.setattr("tfdslib.spark.spark.delete_prefix", mock.Mock())
+    monkeypatch.setattr("tfdslib.spark.spark.delete_keys", delete_keys)
+    session = _compaction_session(rows=100, staged_rows=100)
+    with pytest.raises(IOError, match="connection reset"):
+        spark_mod.compact_dates(session, "bucket", [dt.date(2024, 5, 25)], 1000, format="csv")
+    delete_keys.assert_called_once_with("bucket", ["2024/2024-05/25/part-0.csv", "2024/2024-05/25/part-1.csv"])
+
+
+def test_compact_dates_failed_deletes_raise(monkeypatch):
+    listings = _staged_listings()
+    errors = [{"Key": "2024/2024-05/25/p1.csv", "Code": "AccessDenied", "Message": "Access Denied"}]
+    monkeypatch.setattr("tfdslib.spark.spark.iter_objects", lambda prefix, bucket: iter(listings[prefix]))
+    monkeypatch.setattr("tfdslib.spark.spark.get_s3_client", mock.Mock)
+    monkeypatch.setattr("tfdslib.spark.spark.delete_prefix", mock.Mock())
+    monkeypatch.setattr("tfdslib.spark.spark.delete_keys", mock.Mock(return_value={"files": 2, "errors": errors}))
+    session = _compaction_session(rows=100, staged_rows=100)
+    with pytest.raises(IOError, match="p1.csv"):
+        spark_mod.compact_dates(session, "bucket", [dt.date(2024, 5, 25)], 1000, format="csv")
+
+
+def test_compact_dates_row_count_mismatch_keeps_originals(monkeypatch):
+    listings = {"2024/2024-05/25/": [{"Key": f"2024/2024-05/25/p{i}.parquet", "Size": 10} for i in range(3)]}
+    s3 = mock.Mock()
+    monkeypatch.setattr("tfdslib.spark.spark.iter_objects", lambda prefix, bucket: iter(listings[prefix]))
+    monkeypatch.setattr("tfdslib.spark.spark.get_s3_client", lambda: s3)
+    monkeypatch.setattr("tfdslib.spark.spark.delete_prefix", mock.Mock())
+    session = _compaction_session(rows=100, staged_rows=90)
+    with pytest.raises(ValueError, match="originals kept"):
+        spark_mod.compact_dates(session, "bucket", [dt.date(2024, 5, 25)], 1000)
+    s3.delete_objects.assert_not_called()
+
+
+def test_compact_dates_delta_uses_optimize(monkeypatch):
+    listings = {
+        "2024/2024-05/25/": [{"Key": f"2024/2024-05/25/p{i}.parquet", "Size": 10} for i in range(3)]
+        + [{"Key": "2024/2024-05/25/_delta_log/00000000000000000000.json", "Size": 10}]
+    }
+    monkeypatch.setattr("tfdslib.spark.spark.iter_objects", lambda prefix, bucket: iter(listings[prefix]))
+    session = mock.Mock()
+    session.conf.get.return_value = "1073741824"
+    session.sql.return_value.collect.return_value = [{"numFiles": 1, "sizeInBytes": 28}]
+    reports = spark_mod.compact_dates(session, "bucket", [dt.date(2024, 5, 25)], 1000, format="delta")
+    session.sql.assert_any_call("OPTIMIZE delta.`s3a://bucket/2024/2024-05/25/`")
+    assert session.conf.set.call_args_list == [
+        mock.call("spark.databricks.delta.optimize.maxFileSize", "1000"),
+        mock.call("spark.databricks.delta.optimize.maxFileSize", "1073741824"),
+    ]
+    assert reports[0]["files_before"] == 3
+    assert reports[0]["files_after"] == 1
+
+
+def test_compact_dates_delta_sets_file_size_once(monkeypatch):
+    dates = [dt.date(2024, 5, 25), dt.date(2024, 5, 26), dt.date(2024, 5, 27)]
+    listings = {
+        f"{spark_mod.spark.make_date_prefix(d)}/": [
+            {"Key": f"{spark_mod.spark.make_date_prefix(d)}/p{i}.parquet", "Size": 10} for i in range(3)
+        ]
+        for d in dates
+    }
+    monkeypatch.setattr("tfdslib.spark.spark.iter_objects", lambda prefix, bucket: iter(listings[prefix]))
+    session = mock.Mock()
+    session.conf.get.return_value = None
+    session.sql.return_value.collect.return_value = [{"numFiles": 1, "sizeInBytes": 28}]
+    spark_mod.compact_dates(session, "bucket", dates, 1000, format="delta", max_workers=3)
+    assert [c.args[0] for c in session.sql.call_args_list].count("OPTIMIZE delta.`s3a://bucket/2024/2024-05/26/`") == 1
+    session.conf.set.assert_called_once_with("spark.databricks.delta.optimize.maxFileSize", "1000")
+    session.conf.unset.assert_called_once_with("spark.databricks.delta.optimize.maxFileSize")
+
+
+class _DeltaCatalogSession:
+    """Fake session answering the catalog and SQL calls of the Delta maintenance helpers."""
+
+    def __init__(self, details, providers, vacuumed=()):
+        self.details = details
+        self.providers = providers
+        self.vacuumed = list(vacuumed)
+        self.statements = []
+        self.conf = mock.Mock()
+        self.conf.get.return_value = "true"
+        self.catalog = mock.Mock()
+        db = mock.Mock()
+        db.name = "db"
+        self.catalog.listDatabases.return_value = [db]
+
+        def tables(db):
+            result = []
+            for name in providers:
+                tbl = mock.Mock(isTemporary=False, tableType="MANAGED")
+                tbl.name = name.split(".")[1]
+                result.append(tbl)
+            return result
+
+        self.catalog.listTables.side_effect = tables
+
+    def sql(self, statement):
+        self.statements.append(statement)
+        result = mock.Mock()
+        table = statement.split()[-1] if statement.startswith("DESCRIBE") else statement.split()[1]
+        if statement.startswith("DESCRIBE DETAIL"):
+            result.collect.return_value = [{"location": f"s3a://warehouse/{table}", **self.details[table]}]
+        elif statement.endswith("DRY RUN"):
+            result.collect.return_value = [{"path": f"s3a://warehouse/{table}/{name}"} for name in self.vacuumed]
+        elif statement.startswith("DESCRIBE TABLE EXTENDED"):
+            result.collect.return_value = [
+                {"col_name": "Provider", "data_type": self.providers[table]},
+                {"col_name": "Location", "data_type": f"s3a://warehouse/{table}"},
+            ]
+        elif statement.startswith("OPTIMIZE"):
+            self.details[table] = {"numFiles": 2, "sizeInBytes": self.details[table]["sizeInBytes"]}
+            metrics = mock.Mock()
+            metrics.asDict.return_value = {"numFilesAdded": 2}
+            result.collect.return_value = [{"metrics": metrics}]
+        return result
+
+
+def test_list_delta_tables():
+    session = _DeltaCatalogSession({}, {"db.events": "delta", "db.raw": "parquet"})
+    assert spark_mod.list_delta_tables(session) == ["db.events"]
+
+
+def test_list_tables_records():
+    session = _DeltaCatalogSession({}, {"db.events": "delta", "db.raw": "parquet"})
+    records = spark_mod.list_tables(session)
+    assert records[0] == {
+        "db": "db",
+        "table": "events",
+        "type": "MANAGED",
+        "temporary": False,
+        "provider": "delta",
+        "location": "s3a://warehouse/db.events",
+    }
+    assert records[1]["provider"] == "parquet"
+
+
+def test_list_tables_without_details():
+    session = _DeltaCatalogSession({}, {"db.events": "delta"})
+    records = spark_mod.list_tables(session, ["db"], details=False)
+    assert records[0]["provider"] is None
+    assert session.statements == []
+
+
+def test_list_tables_cache(monkeypatch):
+    monkeypatch.setattr("tfdslib.spark.spark._table_cache", {})
+    session = _DeltaCatalogSession({}, {"db.events": "delta"})
+    first = spark_mod.list_tables(session, cache_ttl=60)
+    second = spark_mod.list_tables(session, cache_ttl=60)
+    assert first == second
+    assert session.catalog.listTables.call_count == 1
+    spark_mod.list_tables(session)
+    assert session.catalog.listTables.call_count == 2
+
+
+def test_optimize_table_with_zorder():
+    session = _DeltaCatalogSession({"db.events": {"numFiles": 100, "sizeInBytes": 1000}}, {"db.events": "delta"})
+    report = spark_mod.optimize_table(session, "db.events", zorder_by=["user_id", "ts"])
+    assert "OPTIMIZE db.events ZORDER BY (user_id, ts)" in session.statements
+    assert report["before"]["num_files"] == 100
+    assert report["after"]["num_files"] == 2
+    assert report["metrics"] == {"numFilesAdded": 2}
+
+
+def test_vacuum_table_short_retention_disables_check(monkeypatch):
+    monkeypatch.setattr("tfdslib.spark.spark.iter_objects", lambda prefix, bucket: iter([]))
+    session = _DeltaCatalogSession({"db.events": {"numFiles": 2, "sizeInBytes": 1000}}, {"db.events": "delta"})
+    spark_mod.vacuum_table(session, "db.events", retention_hours=24)
+    assert "VACUUM db.events RETAIN 24 HOURS" in session.statements
+    session.conf.set.assert_any_call("spark.databricks.delta.retentionDurationCheck.enabled", "false")
+    assert session.conf.set.call_args == mock.call("spark.databricks.delta.retentionDurationCheck.enabled", "true")
+
+
+def test_vacuum_table_reports_reclaimed_files(monkeypatch):
+    listing = [
+        {"Key": "db.events/part-0.parquet", "Size": 300},
+        {"Key": "db.events/part-1.parquet", "Size": 200},
+        {"Key": "db.events/part-2.parquet", "Size": 900},
+    ]
+    listed = []
+    monkeypatch.setattr(
+        "tfdslib.spark.spark.iter_objects", lambda prefix, bucket: listed.append((bucket, prefix)) or iter(listing)
+    )
+    session = _DeltaCatalogSession(
+        {"db.events": {"numFiles": 1, "sizeInBytes": 900}},
+        {"db.events": "delta"},
+        vacuumed=["part-0.parquet", "part-1.parquet"],
+    )
+    report = spark_mod.vacuum_table(session, "db.events")
+    assert report == {"table": "db.events", "files_deleted": 2, "bytes_deleted": 500}
+    assert listed == [("warehouse", "db.events/")]
+    assert session.statements[-2:] == ["VACUUM db.events RETAIN 168 HOURS DRY RUN", "VACUUM db.events RETAIN 168 HOURS"]
+
+
+def test_maintain_delta_tables_targets_small_file_tables(monkeypatch):
+    monkeypatch.setattr("tfdslib.spark.spark.iter_objects", lambda prefix, bucket: iter([]))
+    details = {
+        "db.small": {"numFiles": 500, "sizeInBytes": 500 * 1024},
+        "db.healthy": {"numFiles": 500, "sizeInBytes": 500 * 256 * 1024**2},
+    }
+    session = _DeltaCatalogSession(details, {"db.small": "delta", "db.healthy": "delta"})
+    reports = spark_mod.maintain_delta_tables(session, zorder_by={"db.small": ["id"]})
+    by_table = {r["table"]: r for r in reports}
+    assert by_table["db.small"]["maintained"]
+    assert not by_table["db.healthy"]["maintained"]
+    assert "OPTIMIZE db.small ZORDER BY (id)" in session.statements
+    assert "VACUUM db.small RETAIN 168 HOURS" in session.statements
+    assert not any(s.startswith(("OPTIMIZE db.healthy", "VACUUM db.healthy")) for s in session.statements)
+
+
+def test_broadcast_configs(tmp_path):
+    session = mock.Mock()
+    configs = {"s3": {"url": "http://minio"}, "spark": {"profile": "default"}}
+    with mock.patch(
+        "tfdslib.spark.spark.get_config", side_effect=lambda name: configs[name.removesuffix(".yaml")]
+    ) as get_config:
+        broadcast = spark_mod.broadcast_configs(session, ["s3.yaml", "spark"])
+    assert get_config.call_count == 2
+    session.sparkContext.broadcast.assert_called_once_with(configs)
+    assert broadcast == session.sparkContext.broadcast.return_value
+    shipped = session.sparkContext.addFile.call_args.args[0]
+    assert os.path.basename(shipped).startswith("tfds_config_snapshot")
+    # Kept for the executors to fetch, in a private directory removed when the driver exits.
+    assert os.path.dirname(shipped) == spark_mod.spark._snapshot_dir().name
+    with open(shipped) as f:
+        assert json.load(f) == configs
+    os.remove(shipped)
+
+
+def test_use_broadcast_configs():
+    from tfdslib.config import clear_config_snapshot, get_config
+
+    broadcast = mock.Mock(value={"s3": {"url": "http://minio"}})
+    try:
+        spark_mod.use_broadcast_configs(broadcast)
+        assert get_config("s3") == {"url": "http://minio"}
+    finally:
+        clear_config_snapshot()
+
+
+def _response(payload, status=200):
+    response = mock.Mock(status_code=status, ok=status == 200)
+    response.json.return_value = payload
+    return response
+
+
+def test_track_metrics_rest(tmp_path):
+    session = mock.Mock()
+    session.sparkContext.uiWebUrl = "http://driver:4040"
+    session.sparkContext.applicationId = "app-1"
+    session.sparkContext.getLocalProperty.return_value = None
+    base = "http://driver:4040/api/v1/applications/app-1"
+    stage = {
+        "stageId": 3,
+        "attemptId": 0,
+        "name": "save",
+        "status": "COMPLETE",
+        "numTasks": 4,
+        "numFailedTasks": 0,
+        "executorRunTime": 400,
+        "inputBytes": 1000,
+        "outputBytes": 500,
+        "shuffleReadBytes": 0,
+        "shuffleWriteBytes": 200,
+        "memoryBytesSpilled": 0,
+        "diskBytesSpilled": 10,
+        "submissionTime": "2024-05-25T12:00:00.000GMT",
+        "completionTime": "2024-05-25T12:00:02.500GMT",
+    }
+    group = {}
+
+    def get(url, timeout):
+        if url == f"{base}/jobs":
+            return _response(
+                [{"jobId": 1, "jobGroup": group["id"], "stageIds": [3, 4]}, {"jobGroup": "other", "stageIds": [9]}]
+            )
+        if url == f"{base}/stages/3":
+            return _response([stage])
+        if url == f"{base}/stages/4":
+            return _response(None, 404)
+        if url.startswith(f"{base}/stages/3/0/taskSummary"):
+            return _response({"executorRunTime": [50.0, 200.0]})
+        raise AssertionError(url)
+
+    session.sparkContext.setJobGroup.side_effect = lambda gid, desc: group.setdefault("id", gid)
+    output = tmp_path / "metrics.json"
+    with mock.patch("requests.get", side_effect=get):
+        with spark_mod.track_metrics(session, "daily", output_path=output) as metrics:
+            assert metrics == {"label": "daily"}
+
+    assert metrics["source"] == "rest"
+    assert group["id"].startswith("tfds-daily-")
+    assert [s["stage_id"] for s in metrics["stages"]] == [3]
+    assert metrics["stages"][0]["duration_ms"] == 2500
+    assert metrics["totals"]["shuffle_write_bytes"] == 200
+    assert metrics["totals"]["disk_spilled_bytes"] == 10
+    assert metrics["max_skew"] == 4.0
+    assert json.loads(output.read_text())["totals"]["input_bytes"] == 1000
+    session.sparkContext.setLocalProperty.assert_any_call("spark.jobGroup.id", None)
+
+
+def test_collect_job_metrics_status_tracker():
+    session = mock.Mock()
+    session.sparkContext.uiWebUrl = None
+    tracker = session.sparkContext.statusTracker.return_value
+    tracker.getJobIdsForGroup.return_value = [1]
+    tracker.getJobInfo.return_value = mock.Mock(stageIds=[5])
+    stage = mock.Mock(stageId=5, currentAttemptId=0, numTasks=8, numFailedTasks=1)
+    stage.name = "count"
+    tracker.getStageInfo.return_value = stage
+    metrics = spark_mod.collect_job_metrics(session, "group")
+    assert metrics["source"] == "status_tracker"
+    assert metrics["totals"]["num_tasks"] == 8
+    assert metrics["totals"]["failed_tasks"] == 1
+    assert metrics["max_skew"] is None
+    assert metrics["stages"][0]["name"] == "count"
@@ -1,8 +1,33 @@
 import datetime as dt
+import json
+import logging
+import sys
+import threading
+from unittest.mock import MagicMock
 
 import pytest
 
-from tfdslib.utils import date_range, parse_execution_date
+from tfdslib.utils import (
+    add_stats_hook,
+    date_range,
+    enable_stats,
+    export_to_prometheus,
+    get_stats,
+    instrumented,
+    parse_execution_date,
+    record_bytes,
+    record_cache,
+    remove_stats_hook,
+    reset_stats,
+    setup_logging,
+)
+
+
+def _clean_root_logger(monkeypatch):
+    """Give setup_logging a root logger without handlers, this has to run in the test since pytest adds its own."""
+    root_logger = logging.getLogger()
+    monkeypatch.setattr(root_logger, "handlers", [])
+    monkeypatch.setattr(root_logger, "level", root_logger.level)
 
 
 def test_parse_execution_date_from_datetime():
@@ -63,3 +88,122 @@ def test_date_range_with_date():
         dt.datetime(2024, 5, 25, 0, 0),
     ]
     assert result == expected
+
+
+def test_setup_logging_plain(monkeypatch, capsys):
+    _clean_root_logger(monkeypatch)
+    assert setup_logging() is None
+    logging.getLogger("tfdslib.test").debug("hello %s", "world")
+    assert "DEBUG tfdslib.test: hello world" in capsys.readouterr().out
+
+
+def test_setup_logging_queue_json(monkeypatch, capsys):
+    _clean_root_logger(monkeypatch)
+    threads = []
+    handler_emit = logging.StreamHandler.emit
+
+    def emit(self, record):
+        threads.append(threading.get_ident())
+        handler_emit(self, record)
+
+    monkeypatch.setattr(logging.StreamHandler, "emit", emit)
+    listener = setup_logging(use_queue=True, json_format=True)
+    logging.getLogger("tfdslib.test").info("moved %d files", 3)
+    listener.stop()
+    entry = json.loads(capsys.readouterr().out)
+    assert entry["message"] == "moved 3 files"
+    assert entry["level"] == "INFO"
+    assert entry["logger"] == "tfdslib.test"
+    assert threads and threads[0] != threading.get_ident()
+
+
+def test_setup_logging_queue_logs_args_as_passed(monkeypatch, capsys):
+    _clean_root_logger(monkeypatch)
+    listener = setup_logging(use_queue=True)
+    files = ["a.parquet"]
+    logging.getLogger("tfdslib.test").info("moving %s", files)
+    files.append("b.parquet")
+    listener.stop()
+    assert "moving ['a.parquet']" in capsys.readouterr().out
+
+
+@pytest.fixture
+def stats():
+    enable_stats()
+    reset_stats()
+    yield
+    enable_stats(False)
+    reset_stats()
+
+
+@instrumented("test.work")
+def _work(fail=False):
+    if fail:
+        raise ValueError("failed")
+    return 42
+
+
+def test_instrumented_records_calls(stats):
+    assert _work() == 42
+    with pytest.raises(ValueError):
+        _work(fail=True)
+    record_bytes("test.work", 100)
+    record_cache("test.work", True)
+    record_cache("test.work", False)
+    entry = get_stats()["test.work"]
+    assert entry["count"] == 2
+    assert entry["errors"] == 1
+    assert entry["bytes"] == 100
+    assert (entry["cache_hits"], entry["cache_misses"]) == (1, 1)
+    assert sum(entry["histogram"].values()) == 2
+    assert entry["mean_seconds"] == entry["seconds"] / 2
+
+
+def test_instrumented_disabled():
+    reset_stats()
+    assert _work() == 42
+    record_bytes("test.work", 100)
+    assert get_stats() == {}
+
+
+def test_instrumented_default_name(stats):
+    @instrumented()
+    def helper():
+        return None
+
+    helper()
+    assert "test_utils.helper" in get_stats()
+
+
+def test_stats_hook(stats):
+    events = []
+
+    def hook(event, name, value):
+        events.append((event, name))
+
+    add_stats_hook(hook)
+    try:
+        _work()
+        record_cache("test.work", False)
+    finally:
+        remove_stats_hook(hook)
+    _work()
+    assert events == [("call", "test.work"), ("cache_miss", "test.work")]
+
+
+def test_export_to_prometheus(stats, monkeypatch):
+    prometheus_client = MagicMock()
+    monkeypatch.setitem(sys.modules, "prometheus_client", prometheus_client)
+    hook = export_to_prometheus()
+    try:
+        _work()
+    finally:
+        remove_stats_hook(hook)
+    prometheus_client.Histogram.return_value.labels.assert_called_with("test.work")
+    prometheus_client.Histogram.return_value.labels.return_value.observe.assert_called_once()
+
+
+def test_lazy_exports_match_all():
+    import tfdslib.utils
+
+    assert sorted(tfdslib.utils.__all__) == sorted(name for names in tfdslib.utils._exports.values() for name in names)